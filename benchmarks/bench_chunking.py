@@ -0,0 +1,65 @@
+"""Compares the line-count chunker with the token-budget chunker on long
+synthetic transcripts.
+
+Run: `python -m benchmarks.bench_chunking`
+"""
+
+import random
+import statistics
+
+from video_summarizer.backend.src.summarize_video import (
+    build_question,
+    chunk_a_list,
+    chunk_by_tokens,
+)
+from video_summarizer.backend.utils.transcripts import convert_video_ts
+from video_summarizer.backend.utils.utils import estimate_tokens
+
+WORDS = """the model data vector search we can see that this is going to be a
+really important part of how retrieval works""".split()
+
+
+def make_transcript(minutes: int, seed: int = 0) -> list[str]:
+    """Generates a transcript that mixes short captions and long monologues"""
+
+    rng = random.Random(seed)
+    lines = []
+    start = 0.0
+
+    while start < minutes * 60:
+        if rng.random() < 0.8:
+            n_words = rng.randint(2, 10)
+        else:
+            n_words = rng.randint(40, 120)
+
+        text = " ".join(rng.choice(WORDS) for _ in range(n_words))
+        lines.append(f"\n{convert_video_ts(start)} - {text}")
+        start += n_words * 0.4
+
+    return lines
+
+
+def prompt_sizes(chunks: list[list[str]]) -> list[int]:
+    return [estimate_tokens(build_question(c, 5, 150)) for c in chunks]
+
+
+def report(name: str, chunks: list[list[str]]) -> None:
+    sizes = prompt_sizes(chunks)
+    mean = statistics.mean(sizes)
+    stdev = statistics.pstdev(sizes)
+    print(
+        f"{name:<28} calls={len(chunks):>5} mean={mean:>7.1f} "
+        f"stdev={stdev:>7.1f} cv={stdev / mean:>5.2f} max={max(sizes):>6}"
+    )
+
+
+if __name__ == "__main__":
+    for minutes in (30, 120, 240):
+        transcript = make_transcript(minutes)
+        print(f"\n{minutes} minute video, {len(transcript)} lines")
+        report("lines (CHUNK_SIZE=10)", chunk_a_list(transcript, 10))
+        report("tokens (1500)", chunk_by_tokens(transcript, 1500))
+        report(
+            "tokens (1500, overlap 100)",
+            chunk_by_tokens(transcript, 1500, 100),
+        )
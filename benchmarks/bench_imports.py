@@ -0,0 +1,94 @@
+"""Measures how long the backend modules take to import in a fresh
+interpreter, using `python -X importtime`, and checks the API's cold start
+against a budget.
+
+Exits with status 1 if the median import time of a module is over the
+budget, so it can run in CI.
+
+Run: `python -m benchmarks.bench_imports [--budget 1500] [--runs 5]`
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser
+from collections import defaultdict
+
+from video_summarizer.backend.configs.config import ROOT_DIR
+
+# `api` imports `main` as a top-level module, as it does when served
+BACKEND_DIR = ROOT_DIR / "video_summarizer/backend"
+
+MODULES = [
+    "api",
+    "video_summarizer.backend.src.chat_video",
+    "video_summarizer.backend.src.summarize_video",
+]
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Imports a module in a new interpreter. Returns the cumulative import
+    time of each module it loaded in microseconds"""
+
+    env = {**os.environ, "PYTHONPATH": str(ROOT_DIR)}
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def top_packages(times: dict[str, int], n: int) -> list[tuple[str, int]]:
+    """Returns the third-party and local packages that took the longest to
+    import, by the cumulative time of their top-level module"""
+
+    packages = defaultdict(int)
+    for name, cumulative in times.items():
+        if "." not in name and not name.startswith("_"):
+            packages[name] = max(packages[name], cumulative)
+
+    return sorted(packages.items(), key=lambda p: -p[1])[:n]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument(
+        "--budget", type=float, default=1500, help="Budget of `api` in ms"
+    )
+    args = parser.parse_args()
+
+    over_budget = False
+
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.runs)]
+        median = statistics.median(r[module] for r in runs) / 1000
+
+        line = f"{module:<48} median={median:>8.1f}ms"
+        if module == "api":
+            over_budget = median > args.budget
+            line += f" budget={args.budget:.0f}ms"
+            line += " OVER BUDGET" if over_budget else " ok"
+        print(line)
+
+        for name, cumulative in top_packages(runs[-1], args.top):
+            if name != module:
+                print(f"    {name:<44} {cumulative / 1000:>8.1f}ms")
+
+    sys.exit(1 if over_budget else 0)
@@ -0,0 +1,139 @@
+"""Compares downloading transcripts one video at a time with the concurrent
+`ingest_urls`, against a local stand-in for YouTube.
+
+The stand-in server answers transcript and oEmbed metadata requests after a
+delay, and fails a share of them with a 503 so that retries are exercised.
+Transcripts are saved to an in-memory collection and the metadata is cached
+in memory.
+
+Run: `python -m benchmarks.bench_ingest [--videos 200] [--workers 8]`
+"""
+
+import json
+import random
+import threading
+import time
+import urllib.request
+from argparse import ArgumentParser
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from video_summarizer.backend.configs.config import IngestSettings
+from video_summarizer.backend.src.extract_transcript import (
+    fetch_video_metadata,
+    get_video_id,
+    ingest_urls,
+)
+from video_summarizer.backend.utils.cache import MemoryCache
+from video_summarizer.backend.utils.repository import VideoRepository
+
+
+class StandInYouTube(BaseHTTPRequestHandler):
+    latency = 0.05
+    failure_rate = 0.1
+    rng = random.Random(0)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+
+        if self.rng.random() < self.failure_rate:
+            self.send_error(503)
+            return
+
+        url = urlparse(self.path)
+        if url.path == "/oembed":
+            video_url = parse_qs(url.query)["url"][0]
+            body = {"title": f"Video {get_video_id(video_url)}"}
+        else:
+            body = [
+                {"text": f"line {i}", "start": 2.0 * i, "duration": 2.0}
+                for i in range(600)
+            ]
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class MemoryCollection:
+    """The parts of a MongoDB collection used by `VideoRepository`"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query: dict, projection=None):
+        ids = query["video_id"]["$in"]
+        return [self.docs[i] for i in ids if i in self.docs]
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        for request in requests:
+            self.docs[request._doc["video_id"]] = request._doc
+
+        return SimpleNamespace(upserted_count=len(requests), modified_count=0)
+
+
+def fetch_transcript(base_url: str, video_id: str, timeout: float):
+    url = f"{base_url}/transcript/{video_id}"
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def run(urls: list[str], base_url: str, workers: int) -> tuple[float, list]:
+    settings = IngestSettings(
+        workers=workers, timeout_seconds=5, backoff_seconds=0.05
+    )
+    start = time.perf_counter()
+    reports = ingest_urls(
+        urls,
+        partial(fetch_transcript, base_url),
+        partial(fetch_video_metadata, base_url=f"{base_url}/oembed"),
+        VideoRepository(MemoryCollection()),
+        settings,
+        MemoryCache(),
+    )
+
+    return time.perf_counter() - start, reports
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--videos", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    StandInYouTube.latency = args.latency
+    StandInYouTube.failure_rate = args.failure_rate
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInYouTube)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    urls = [
+        f"https://www.youtube.com/watch?v=v{i}" for i in range(args.videos)
+    ]
+    print(
+        f"{args.videos} videos, {args.latency * 1000:.0f}ms per request, "
+        f"{args.failure_rate:.0%} of requests fail"
+    )
+
+    for workers in sorted({1, args.workers}):
+        elapsed, reports = run(urls, base_url, workers)
+        ok = sum(r["status"] == "downloaded" for r in reports)
+        requests = sum(r["requests"] for r in reports)
+        print(
+            f"workers={workers:<3} {elapsed:>7.2f}s "
+            f"{len(urls) / elapsed:>7.1f} videos/s downloaded={ok} "
+            f"requests={requests}"
+        )
+
+    server.shutdown()
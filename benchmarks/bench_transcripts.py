@@ -0,0 +1,95 @@
+"""Compares the size and read time of transcripts stored as formatted lines,
+as earlier versions did, with the columnar format.
+
+Reading a legacy transcript is timed the way the RAG ingester used to do
+it, with a pandas regex, and the way `Transcript.decode` does now.
+
+Run: `python -m benchmarks.bench_transcripts [--lines 2000] [--runs 20]`
+"""
+
+import importlib.util
+import random
+import statistics
+import time
+from argparse import ArgumentParser
+
+from video_summarizer.backend.src.migrate_transcripts import stored_size
+from video_summarizer.backend.utils.transcripts import Transcript
+
+WORDS = """the model data vector search we can see that this is going to be a
+really important part of how retrieval works""".split()
+
+
+def make_segments(n_lines: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    segments = []
+    start = 0.0
+
+    for _ in range(n_lines):
+        n_words = rng.randint(4, 12)
+        duration = round(n_words * rng.uniform(0.3, 0.5), 3)
+        text = " ".join(rng.choice(WORDS) for _ in range(n_words))
+        segments.append({"text": text, "start": start, "duration": duration})
+        start = round(start + duration, 3)
+
+    return segments
+
+
+def parse_with_pandas(lines: list[str]) -> tuple[list[str], list[str]]:
+    import pandas as pd
+
+    pattern = r"\n(\d+:\d{2}:\d{2})\s-\s(.*)"
+    data = pd.DataFrame(lines)[0].str.extract(pattern)
+    return data[1].tolist(), data[0].tolist()
+
+
+def timed(func, runs: int) -> float:
+    """Returns the median time of a call in ms"""
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return 1000 * statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    transcript = Transcript.from_segments(make_segments(args.lines))
+    legacy = transcript.lines()
+
+    compressions = ["none", "zlib"]
+    if importlib.util.find_spec("zstandard") is not None:
+        compressions.append("zstd")
+
+    print(f"{args.lines} lines")
+    size = stored_size(legacy)
+    print(f"{'legacy lines':<20} {size / 1024:>8.1f}KiB")
+    for compression in compressions:
+        stored = transcript.encode(compression)
+        ratio = stored_size(stored) / size
+        print(
+            f"{'columnar ' + compression:<20} "
+            f"{stored_size(stored) / 1024:>8.1f}KiB {ratio:>6.1%}"
+        )
+
+    print("\nread time (texts and start times)")
+    parse_with_pandas(legacy)  # imports pandas
+    print(
+        f"{'legacy with pandas':<20} "
+        f"{timed(lambda: parse_with_pandas(legacy), args.runs):>8.2f}ms"
+    )
+    print(
+        f"{'legacy decode':<20} "
+        f"{timed(lambda: Transcript.decode(legacy), args.runs):>8.2f}ms"
+    )
+    for compression in compressions:
+        stored = transcript.encode(compression)
+        elapsed = timed(lambda: Transcript.decode(stored).texts, args.runs)
+        print(f"{'columnar ' + compression:<20} {elapsed:>8.2f}ms")
@@ -0,0 +1,95 @@
+"""Compares the query latency of the vector store backends on random
+embeddings the size of a long transcript.
+
+The Pinecone backend is only benchmarked with `--pinecone` (it creates and
+deletes an index, so it needs `PINECONE_API_KEY`).
+
+Run: `python -m benchmarks.bench_vectorstore [--pinecone]`
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from video_summarizer.backend.utils.vectorstore import (
+    BaseVectorStore,
+    LocalVectorStore,
+)
+
+VIDEO_ID = "benchvectorstore"
+
+
+def time_queries(
+    store: BaseVectorStore, queries: np.ndarray, k: int
+) -> list[float]:
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        store.query(VIDEO_ID, query.tolist(), top_k=k)
+        timings.append(1000 * (time.perf_counter() - start))
+
+    return timings
+
+
+def report(name: str, setup: float, timings: list[float]) -> None:
+    first, rest = timings[0], sorted(timings[1:])
+    p95 = rest[int(0.95 * (len(rest) - 1))]
+    print(
+        f"{name:<10} setup={setup:>8.2f}s first={first:>8.2f}ms "
+        f"p50={statistics.median(rest):>7.2f}ms p95={p95:>7.2f}ms"
+    )
+
+
+def bench(
+    store: BaseVectorStore, name: str, vectors: np.ndarray, queries, k: int
+) -> None:
+    ids = [str(i) for i in range(len(vectors))]
+    metadata = [{"text": f"line {i}", "timestamp": "0:00:00"} for i in ids]
+
+    start = time.perf_counter()
+    store.upsert(VIDEO_ID, ids, vectors.tolist(), metadata)
+    setup = time.perf_counter() - start
+
+    try:
+        report(name, setup, time_queries(store, queries, k))
+    finally:
+        store.delete(VIDEO_ID)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--pinecone", action="store_true", default=False)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.lines, args.dimension))
+    queries = rng.normal(size=(args.queries, args.dimension))
+
+    print(f"{args.lines} vectors of {args.dimension} dimensions, k={args.k}")
+
+    with tempfile.TemporaryDirectory() as path:
+        bench(LocalVectorStore(path), "local", vectors, queries, args.k)
+
+    if args.pinecone:
+        from dotenv import load_dotenv
+        from pinecone import Pinecone
+
+        from video_summarizer.backend.utils.vectorstore import (
+            PineconeVectorStore,
+        )
+
+        load_dotenv()
+        client = Pinecone(
+            api_key=os.environ.get("PINECONE_API_KEY"),
+            environment=os.environ.get("PINECONE_ENVIRONMENT"),
+        )
+        store = PineconeVectorStore(client, dimension=args.dimension)
+        bench(store, "pinecone", vectors, queries, args.k)
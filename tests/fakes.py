@@ -0,0 +1,139 @@
+"""In-memory stand-ins for external services used by the tests"""
+
+from types import SimpleNamespace
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if isinstance(condition, dict) and "$in" in condition:
+            if doc.get(key) not in condition["$in"]:
+                return False
+        elif condition == {"$type": "array"}:
+            if not isinstance(doc.get(key), list):
+                return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    """A MongoDB collection that counts its round trips"""
+
+    def __init__(self, name: str = "collection", docs: list[dict] = ()):
+        self.name = name
+        self.docs = [dict(doc) for doc in docs]
+        self.round_trips = 0
+
+    def create_index(self, *args, **kwargs):
+        self.round_trips += 1
+
+    def find_one(self, query: dict, projection=None):
+        self.round_trips += 1
+        return next((d for d in self.docs if matches(d, query)), None)
+
+    def find(self, query: dict, projection=None):
+        self.round_trips += 1
+        return [d for d in self.docs if matches(d, query)]
+
+    def _replace(self, query: dict, doc: dict) -> bool:
+        for i, d in enumerate(self.docs):
+            if matches(d, query):
+                self.docs[i] = dict(doc)
+                return True
+        self.docs.append(dict(doc))
+        return False
+
+    def replace_one(self, query: dict, doc: dict, upsert: bool = False):
+        self.round_trips += 1
+        self._replace(query, doc)
+
+    def insert_one(self, doc: dict):
+        self.round_trips += 1
+        self.docs.append(dict(doc))
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        self.round_trips += 1
+        modified = upserted = 0
+        for request in requests:
+            if self._replace(request._filter, request._doc):
+                modified += 1
+            else:
+                upserted += 1
+        return SimpleNamespace(
+            modified_count=modified, upserted_count=upserted
+        )
+
+
+class FakePineconeIndex:
+    """A Pinecone index holding its vectors in memory, per namespace"""
+
+    def __init__(self):
+        self.namespaces: dict[str, dict[str, tuple]] = {}
+
+    def upsert(self, vectors, namespace: str = "", batch_size=None):
+        for id_, values, metadata in vectors:
+            self.namespaces.setdefault(namespace, {})[id_] = (
+                list(values),
+                metadata,
+            )
+
+    def query(self, vector, top_k, namespace="", **kwargs):
+        vectors = self.namespaces.get(namespace, {})
+        scores = {
+            id_: sum(a * b for a, b in zip(values, vector))
+            for id_, (values, _) in vectors.items()
+        }
+        best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return {
+            "matches": [
+                {"id": i, "score": scores[i], "metadata": vectors[i][1]}
+                for i in best
+            ]
+        }
+
+    def describe_index_stats(self):
+        return {
+            "total_vector_count": sum(map(len, self.namespaces.values())),
+            "namespaces": {
+                ns: {"vector_count": len(v)}
+                for ns, v in self.namespaces.items()
+            },
+        }
+
+    def delete(self, delete_all: bool = False, namespace: str = ""):
+        self.namespaces.pop(namespace, None)
+
+    def fetch(self, ids, namespace: str = ""):
+        vectors = self.namespaces.get(namespace, {})
+        fetched = {}
+        for i in ids:
+            if i not in vectors:
+                continue
+            values, metadata = vectors[i]
+            fetched[i] = {"id": i, "values": values, "metadata": metadata}
+
+        return {"vectors": fetched}
+
+
+class FakePinecone:
+    """A Pinecone client that counts the indexes it creates"""
+
+    def __init__(self, indexes: dict[str, FakePineconeIndex] | None = None):
+        self.indexes = dict(indexes or {})
+        self.created = 0
+
+    def list_indexes(self):
+        return {"indexes": [{"name": name} for name in self.indexes]}
+
+    def create_index(self, name: str, **kwargs):
+        self.created += 1
+        self.indexes[name] = FakePineconeIndex()
+
+    def describe_index(self, name: str):
+        return SimpleNamespace(status={"ready": True})
+
+    def Index(self, name: str):
+        return self.indexes[name]
+
+    def delete_index(self, name: str):
+        del self.indexes[name]
@@ -0,0 +1,275 @@
+"""This module tests the cache backends and the cached LLM wrapper"""
+
+import copy
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from video_summarizer.backend.src.chat_video import CachedEmbeddings
+from video_summarizer.backend.src.summarize_video import CachedModel
+from video_summarizer.backend.utils.cache import (
+    MemoryCache,
+    MongoCache,
+    SQLiteCache,
+    make_key,
+)
+from video_summarizer.backend.utils.semantic_cache import SemanticCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class EchoModel:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, question: str) -> str:
+        self.calls += 1
+        return question.upper()
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [[len(t), 0.5] for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.embedded.append(text)
+        return [len(text), 0.25]
+
+
+class FakeCacheCollection:
+    """The parts of a MongoDB collection used by `MongoCache`. Creating an
+    index that exists with another TTL fails as it does on the server"""
+
+    def __init__(self, ttls: dict | None = None):
+        self.name = "cache"
+        self.ttls = dict(ttls or {})
+        self.docs = {}
+        self.commands = []
+        self.database = SimpleNamespace(
+            command=lambda *args, **kwargs: self.commands.append(
+                (args, kwargs)
+            )
+        )
+
+    def create_index(self, key: str, expireAfterSeconds=None):
+        if key in self.ttls and self.ttls[key] != expireAfterSeconds:
+            raise OperationFailure("IndexOptionsConflict", code=85)
+        self.ttls[key] = expireAfterSeconds
+
+    def index_information(self) -> dict:
+        return {f"{key}_1": {} for key in self.ttls}
+
+    def drop_index(self, name: str):
+        del self.ttls[name.removesuffix("_1")]
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        for request in requests:
+            key = request._filter["_id"]
+            self.docs[key] = {"_id": key, **request._doc}
+
+    def find_one_and_update(self, query: dict, update: dict):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+
+        before = copy.deepcopy(doc)
+        doc.update(update["$set"])
+        return before
+
+    def delete_one(self, query: dict):
+        self.docs.pop(query["_id"], None)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def factory(**kwargs):
+        if request.param == "memory":
+            return MemoryCache(**kwargs)
+        return SQLiteCache(str(tmp_path / "cache.sqlite"), "test", **kwargs)
+
+    return factory
+
+
+def test_make_key():
+    assert make_key("a", "b") == make_key("a", "b")
+    assert make_key("a", "b") != make_key("ab", "")
+
+
+def test_cache_hits_and_misses(make_cache):
+    cache = make_cache()
+
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    assert cache.stats.hits == 1 and cache.stats.misses == 1
+    assert cache.get_stats()["hit_rate"] == 0.5
+
+
+def test_cache_ttl(make_cache):
+    clock = FakeClock()
+    cache = make_cache(ttl=10, clock=clock)
+
+    cache.set("key", "value")
+    clock.now = 5
+    assert cache.get("key") == "value"
+
+    clock.now = 11
+    assert cache.get("key") is None
+    assert cache.stats.evictions == 1
+
+
+def test_cache_lru_eviction(make_cache):
+    clock = FakeClock()
+    cache = make_cache(max_entries=2, clock=clock)
+
+    cache.set("a", "1")
+    clock.now = 1
+    cache.set("b", "2")
+    clock.now = 2
+    cache.get("a")  # "b" is now the least recently used
+    clock.now = 3
+    cache.set("c", "3")
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+
+def test_cache_get_many(make_cache):
+    clock = FakeClock()
+    cache = make_cache(ttl=10, max_entries=3, clock=clock)
+
+    cache.set_many({"a": "1", "b": "2"})
+    clock.now = 5
+    cache.set("c", "3")
+    clock.now = 12
+
+    assert cache.get_many(["a", "c", "z", "c"]) == {"c": "3"}
+    assert cache.stats.hits == 1 and cache.stats.misses == 2
+    assert cache.stats.evictions == 1
+
+    cache.set_many({"d": "4", "e": "5", "f": "6"})
+    assert len(cache) == 3
+
+
+def test_mongo_cache_ttl_index():
+    clock = FakeClock()
+    collection = FakeCacheCollection()
+    cache = MongoCache(collection, ttl=10, clock=clock)
+
+    cache.set("key", "value")
+    # the server only expires entries whose `created_at` is a date
+    assert isinstance(collection.docs["key"]["created_at"], datetime)
+    assert collection.ttls["created_at"] == 10
+
+    clock.now = 5
+    assert cache.get("key") == "value"
+    clock.now = 11
+    assert cache.get("key") is None
+
+    # a new TTL changes the index instead of failing
+    MongoCache(collection, ttl=20)
+    ((args, kwargs),) = collection.commands
+    assert args == ("collMod", "cache")
+    assert kwargs["index"]["expireAfterSeconds"] == 20
+
+    MongoCache(collection, ttl=None)
+    assert "created_at" not in collection.ttls
+
+
+def test_sqlite_cache_persists(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SQLiteCache(path, "test").set("key", b"\x00\x01")
+
+    assert SQLiteCache(path, "test").get("key") == b"\x00\x01"
+
+
+def test_cached_model():
+    model = EchoModel()
+    cached = CachedModel(model, MemoryCache(), "gpt", "{question}")
+
+    assert cached.predict(question="hello") == "HELLO"
+    assert cached.predict(question="hello") == "HELLO"
+    assert cached.predict(question="world") == "WORLD"
+    assert model.calls == 2
+
+    other_model = CachedModel(model, cached.cache, "other-gpt", "{question}")
+    other_model.predict(question="hello")
+    assert model.calls == 3
+
+
+def test_cached_embeddings_only_embed_misses(make_cache):
+    embeddings = CountingEmbeddings()
+    cached = CachedEmbeddings(embeddings, make_cache(), "ada")
+
+    first = cached.embed_documents(["hello", "thanks for watching"])
+    second = cached.embed_documents(
+        [" thanks  for watching\n", "new line", "new line"]
+    )
+
+    assert first == [[5.0, 0.5], [19.0, 0.5]]
+    assert second == [[19.0, 0.5], [8.0, 0.5], [8.0, 0.5]]
+    assert embeddings.embedded == ["hello", "thanks for watching", "new line"]
+    assert cached.cache.stats.hits == 1
+
+    cached.embed_documents(["thanks for watching"])
+    assert embeddings.embedded[-1] == "new line"
+
+    assert cached.embed_query("hello") == [5.0, 0.25]
+    assert cached.embed_query("hello") == [5.0, 0.25]
+    assert embeddings.embedded[-1] == "hello"
+
+    other = CachedEmbeddings(embeddings, cached.cache, "other-model")
+    other.embed_documents(["hello"])
+    assert len(embeddings.embedded) == 5
+
+
+def test_semantic_cache():
+    clock = FakeClock()
+    cache = SemanticCache(threshold=0.9, ttl=10, max_entries=2, clock=clock)
+
+    cache.set("abc", "what is rag", [1.0, 0.0], ["abc-0-3"], "an answer")
+
+    assert cache.get("abc", [1.0, 0.1]).answer == "an answer"
+    assert cache.get("abc", [0.0, 1.0]) is None
+    assert cache.get("xyz", [1.0, 0.0]) is None
+
+    # a question is only embedded when there are answers to compare with
+    def fail():
+        raise AssertionError("the question was embedded")
+
+    assert cache.get("xyz", fail) is None
+    assert cache.get("abc", lambda: [1.0, 0.1]).answer == "an answer"
+
+    # least recently used answers are evicted first
+    cache.set("abc", "b", [0.0, 1.0], [], "b")
+    cache.get("abc", [1.0, 0.0])
+    cache.set("abc", "c", [-1.0, 0.0], [], "c")
+    assert cache.get("abc", [0.0, 1.0]) is None
+    assert cache.get("abc", [1.0, 0.0]).context_ids == ["abc-0-3"]
+
+    clock.now = 11
+    assert cache.get("abc", [-1.0, 0.0]) is None
+    assert len(cache) == 0
+
+    cache.set("abc", "d", [1.0, 0.0], [], "d")
+    assert cache.invalidate("abc") == 1
+    assert cache.get("abc", [1.0, 0.0]) is None
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (4, 6)
+    assert stats["evictions"] == 3
+    assert stats["invalidations"] == 1
@@ -0,0 +1,388 @@
+"""This module tests indexing and querying the transcript of a video"""
+
+import math
+import threading
+import time
+
+import pytest
+
+from video_summarizer.backend.src import chat_sessions, chat_video
+from video_summarizer.backend.utils.semantic_cache import SemanticCache
+from video_summarizer.backend.utils.vectorstore import LocalVectorStore
+
+TRANSCRIPT = [
+    f"\n0:{i // 60:02d}:{i % 60:02d} - line number {i}" for i in range(250)
+]
+
+
+def embed(text: str) -> list[float]:
+    """Embeds "... number i" as a unit vector at an angle set by i"""
+
+    angle = float(text.split()[-1]) / 100
+    return [math.cos(angle), math.sin(angle)]
+
+
+class FlakyEmbeddings:
+    """Embeds a text with `embed` and fails on the `fail_on`-th call"""
+
+    def __init__(self, fail_on: int | None = None):
+        self.calls = 0
+        self.embedded = []
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("embedding API error")
+
+        self.embedded.extend(texts)
+        return [embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return embed(text)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        chat_video, "get_document", lambda _: {"transcript": TRANSCRIPT}
+    )
+    return LocalVectorStore(tmp_path)
+
+
+@pytest.fixture
+def use_settings(tmp_path, monkeypatch):
+    def use(**kwargs):
+        kwargs.setdefault("lexical_path", str(tmp_path / "lexical"))
+        settings = chat_video.config.ChatSettings(**kwargs)
+        monkeypatch.setattr(
+            chat_video.config.ChatSettings, "load_settings", lambda: settings
+        )
+
+    return use
+
+
+def test_window_indices_by_seconds():
+    starts = [0, 2, 4, 6, 8, 10, 12, 30, 31]
+
+    assert chat_video.window_indices_by_seconds(starts, 6, 2) == [
+        [0, 1, 2],
+        [2, 3, 4],
+        [4, 5, 6],
+        [7, 8],
+    ]
+    assert chat_video.window_indices_by_seconds(starts, 100) == [
+        list(range(9))
+    ]
+
+    with pytest.raises(ValueError):
+        chat_video.window_indices_by_seconds(starts, 5, 5)
+
+
+def test_upsert_documents_uses_line_ids(store, use_settings):
+    use_settings(window_mode="lines")
+    embeddings = FlakyEmbeddings()
+
+    assert chat_video.upsert_documents(store, "abc", embeddings) == 250
+    assert store.count("abc") == 250
+    assert store.existing_ids(
+        "abc", ["abc-0-0", "abc-249-249", "abc-250-250"]
+    ) == {"abc-0-0", "abc-249-249"}
+
+    # a rerun neither embeds nor writes anything
+    assert chat_video.upsert_documents(store, "abc", embeddings) == 0
+    assert len(embeddings.embedded) == 250
+
+    match = store.query("abc", embed("number 123"), top_k=1)[0]
+    assert match["id"] == "abc-123-123"
+    assert match["metadata"] == {
+        "text": "line number 123",
+        "timestamp": "0:02:03",
+        "end_timestamp": "0:02:03",
+    }
+
+
+def test_upsert_documents_resumes(store, use_settings):
+    use_settings(
+        window_mode="lines",
+        embed_batch_size=50,
+        embed_workers=1,
+        upsert_workers=1,
+    )
+
+    with pytest.raises(RuntimeError):
+        chat_video.upsert_documents(store, "abc", FlakyEmbeddings(fail_on=3))
+
+    assert store.count("abc") == 100
+
+    embeddings = FlakyEmbeddings()
+    assert chat_video.upsert_documents(store, "abc", embeddings) == 150
+    assert len(embeddings.embedded) == 150
+    assert store.count("abc") == 250
+
+
+def test_upsert_documents_merges_lines_into_windows(store, use_settings):
+    use_settings(window_mode="lines")
+    chat_video.upsert_documents(store, "abc", FlakyEmbeddings())
+
+    # one line per second: windows of 30 lines, starting every 20 lines
+    use_settings(window_mode="seconds", window_size=30, window_overlap=10)
+    embeddings = FlakyEmbeddings()
+
+    assert chat_video.upsert_documents(store, "abc", embeddings) == 12
+    assert store.count("abc") == 12
+    assert embeddings.calls == 1
+
+    match = store.query("abc", embed("number 49"), top_k=1)[0]
+    assert match["id"] == "abc-20-49"
+    assert match["metadata"]["text"].startswith("line number 20 line")
+    assert match["metadata"]["timestamp"] == "0:00:20"
+    assert match["metadata"]["end_timestamp"] == "0:00:49"
+
+    context = chat_video.query_vectorstore(
+        "number 49", embeddings, store, "abc", k=1, include_timestamp=True
+    )
+    assert context.endswith("line number 49 - 0:00:20 to 0:00:49")
+
+
+def test_segment_transcript_by_tokens():
+    settings = chat_video.config.ChatSettings(
+        window_mode="tokens", window_size=20, window_overlap=5
+    )
+    lines = [f"line number {i}" for i in range(100)]
+
+    spans = chat_video.segment_transcript(lines, [], settings)
+
+    assert spans[0][0] == 0 and spans[-1][1] == 99
+    assert all(b - a + 1 <= 20 // 3 for a, b in spans)
+    assert all(b2 >= a2 >= a1 for (a1, b1), (a2, b2) in zip(spans, spans[1:]))
+    assert all(a2 <= b1 for (_, b1), (a2, _) in zip(spans, spans[1:]))
+
+
+class OfflineEmbeddings(FlakyEmbeddings):
+    def embed_query(self, text: str) -> list[float]:
+        raise AssertionError("the embedding API was called")
+
+
+def test_get_context_answers_keywords_offline(store, use_settings):
+    use_settings(window_mode="lines", retrieval_mode="hybrid")
+    chat_video.upsert_documents(store, "abc", FlakyEmbeddings())
+
+    context = chat_video.get_context(
+        "number 123", "abc", embeddings=OfflineEmbeddings(), k=1, store=store
+    )
+    assert context == "line number 123"
+
+    # the number of a line that does not exist needs the vector index
+    context = chat_video.get_context(
+        "number 77 and 400",
+        "abc",
+        embeddings=FlakyEmbeddings(),
+        k=2,
+        store=store,
+    )
+    assert context.splitlines()[0] == "line number 77"
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, question: str, context: str) -> str:
+        self.calls.append(context)
+        return f"answer {len(self.calls)}"
+
+
+def test_main_reuses_answers_to_similar_questions(
+    store, use_settings, monkeypatch
+):
+    use_settings(window_mode="lines", retrieval_mode="vector")
+    cache = SemanticCache(threshold=0.999)
+    monkeypatch.setattr(chat_video, "get_answer_cache", lambda: cache)
+    model = CountingModel()
+
+    def ask(query: str, **kwargs) -> str:
+        return chat_video.main(
+            query,
+            "abc",
+            embeddings=FlakyEmbeddings(),
+            store=store,
+            model=model,
+            **kwargs,
+        )
+
+    assert ask("what is number 123") == "answer 1"
+    assert model.calls[0].splitlines()[0] == "line number 123"
+
+    # "number 123.1" is less than 0.001 radians away from "number 123"
+    assert ask("tell me about number 123.1") == "answer 1"
+    assert ask("what is number 200") == "answer 2"
+    assert len(model.calls) == 2
+
+    # re-indexing the video drops its answers
+    assert ask("what is number 123", delete_index=True) == "answer 3"
+    assert cache.get_stats()["invalidations"] == 2
+
+
+class Chunk:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StreamingModel:
+    def __init__(self):
+        self.prompts = []
+
+    def stream(self, prompt: str):
+        self.prompts.append(prompt)
+        for word in f"answer {len(self.prompts)}".split():
+            yield Chunk(word + " ")
+
+
+def test_chat_sessions_keep_videos_warm(store, use_settings, monkeypatch):
+    use_settings(window_mode="lines", retrieval_mode="vector")
+    cache = SemanticCache(threshold=0.999)
+    monkeypatch.setattr(chat_video, "get_answer_cache", lambda: cache)
+    embeddings = FlakyEmbeddings()
+    llm = StreamingModel()
+
+    def create(video_id: str) -> chat_sessions.ChatSession:
+        return chat_sessions.ChatSession(video_id, store, embeddings, llm)
+
+    sessions = chat_sessions.ChatSessions(
+        create, max_sessions=1, history_turns=1, max_conversations=2
+    )
+    session = sessions.get("abc")
+    alice = sessions.get_conversation("alice", "abc")
+
+    # the video is ingested once, when its session is created
+    assert store.count("abc") == 250
+    assert list(session.stream("number 12", alice)) == ["answer ", "1 "]
+    assert sessions.get("abc") is session
+    assert sessions.get_conversation("alice", "abc") is alice
+    assert len(embeddings.embedded) == 250
+
+    # follow-ups are sent with the conversation and skip the answer cache
+    assert "".join(session.stream("number 12", alice)) == "answer 2 "
+    assert "user: number 12\nassistant: answer 1" in llm.prompts[1]
+    assert "line number 12" in llm.prompts[1]
+
+    # other clients do not see the conversation, and resetting it does not
+    # affect them
+    bob = sessions.get_conversation("bob", "abc")
+    assert "".join(session.stream("number 12", bob)) == "answer 1 "
+    assert "".join(session.stream("number 13", bob)) == "answer 3 "
+    assert "assistant: answer 2" not in llm.prompts[2]
+
+    alice.reset()
+    assert "".join(session.stream("number 12", alice)) == "answer 1 "
+    assert list(bob.history) == [("number 13", "answer 3 ")]
+    assert len(llm.prompts) == 3
+
+    # the least recently used conversation is forgotten first
+    sessions.get_conversation("carol", "abc")
+    assert sessions.get_conversation("bob", "abc") is bob
+    assert sessions.get_conversation("alice", "abc") is not alice
+
+    sessions.get("xyz")
+    assert sessions.get("abc") is not session
+    assert sessions.get_stats() == {
+        "sessions": 1,
+        "conversations": 2,
+        "hits": 1,
+        "misses": 3,
+    }
+
+
+class CountingEmbeddings(FlakyEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def embed_query(self, text: str) -> list[float]:
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+def test_lexical_answers_skip_the_embedding_api(
+    store, use_settings, monkeypatch
+):
+    use_settings(window_mode="lines", retrieval_mode="hybrid")
+    cache = SemanticCache(threshold=0.999)
+    monkeypatch.setattr(chat_video, "get_answer_cache", lambda: cache)
+    embeddings = CountingEmbeddings()
+
+    session = chat_sessions.ChatSession(
+        "abc", store, embeddings, StreamingModel()
+    )
+    answer = session.stream("number 12")
+
+    # the first token is sent before the question is embedded for the
+    # answer cache
+    assert next(answer) == "answer "
+    assert embeddings.queries == []
+    assert list(answer) == ["1 "]
+    assert embeddings.queries == ["number 12"]
+
+    # a question embedded for the answer cache is not embedded again
+    model = CountingModel()
+    chat_video.main(
+        "number 200", "abc", embeddings=embeddings, store=store, model=model
+    )
+    assert model.calls[0].splitlines()[0] == "line number 200"
+    assert embeddings.queries == ["number 12", "number 200"]
+
+
+class SlowStore(LocalVectorStore):
+    """Records the largest number of queries running at once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def query(self, *args, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.02)
+        try:
+            return super().query(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_retrieve_many_merges_videos(tmp_path, use_settings, monkeypatch):
+    # the transcript of video i has lines i, i + 10, i + 20...
+    def get_document(video_id: str) -> dict:
+        start = int(video_id[1:])
+        return {"transcript": TRANSCRIPT[start::10]}
+
+    monkeypatch.setattr(chat_video, "get_document", get_document)
+    use_settings(window_mode="lines", search_workers=4)
+    store = SlowStore(tmp_path / "vectors")
+    video_ids = [f"v{i}" for i in range(8)]
+
+    matches = chat_video.retrieve_many(
+        "number 123", video_ids, k=3, embeddings=FlakyEmbeddings(), store=store
+    )
+
+    assert [m["metadata"]["text"] for m in matches] == [
+        "line number 123",
+        "line number 122",
+        "line number 124",
+    ]
+    assert [m["video_id"] for m in matches] == ["v3", "v2", "v4"]
+    assert store.peak > 1
+
+    assert chat_video.get_source(matches[0]) == {
+        "video_id": "v3",
+        "timestamp": "0:02:03",
+        "url": "https://www.youtube.com/watch?v=v3&t=123s",
+        "score": matches[0]["score"],
+    }
+    assert chat_video.format_sourced_context(matches[:1]) == (
+        "[v3 0:02:03] line number 123"
+    )
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+import yaml
+from pydantic import ValidationError
+
+from video_summarizer.backend.configs.config import (
+    ModelParams,
+    PipelineSettings,
+    SettingsRegistry,
+    get_registry,
+)
+
+MODEL_PARAMS = {
+    "MODEL": "gpt-4",
+    "CHUNK_SIZE": 10,
+    "SUMMARY_LIMIT": 150,
+    "BULLETS": 5,
+    "BATCH_CHUNKS": 2,
+}
+
+
+def write_params(path, **sections):
+    with open(path, "w") as f:
+        yaml.safe_dump(sections, f)
+
+
+def test_registry_parses_once(tmp_path, monkeypatch):
+    path = tmp_path / "params.yaml"
+    write_params(path, model_params=MODEL_PARAMS)
+
+    registry = SettingsRegistry(path)
+    first = registry.get("model_params", ModelParams)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("settings file parsed again")
+
+    monkeypatch.setattr(yaml, "safe_load", fail)
+
+    assert registry.get("model_params", ModelParams) is first
+
+
+def test_registry_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "params.yaml"
+    write_params(path, pipeline={"fetch_workers": 4})
+
+    registry = SettingsRegistry(path)
+    assert registry.get("pipeline", PipelineSettings).fetch_workers == 4
+
+    write_params(path, pipeline={"fetch_workers": 16})
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert registry.get("pipeline", PipelineSettings).fetch_workers == 16
+
+
+def test_snapshots_are_immutable():
+    params = ModelParams.load()
+
+    with pytest.raises(ValidationError):
+        params.CHUNK_TOKENS = 10
+
+    assert get_registry().get_section("model_params") is not None
+
+
+def test_model_params_overrides():
+    base = ModelParams.load()
+    params = ModelParams.load(
+        overrides={"CHUNK_TOKENS": base.CHUNK_TOKENS + 1}
+    )
+
+    assert params.CHUNK_TOKENS == base.CHUNK_TOKENS + 1
+    assert params.MODEL == base.MODEL
+    assert ModelParams.load() is base
+
+    with pytest.raises(ValidationError):
+        ModelParams.load(overrides={"NOT_A_PARAM": 1})
+
+    with pytest.raises(ValidationError):
+        ModelParams.load(overrides={"CHUNK_TOKENS": "many"})
@@ -0,0 +1,138 @@
+"""This module tests the incremental channel crawler"""
+
+from video_summarizer.backend.configs.config import CrawlSettings
+from video_summarizer.backend.src import crawl_channels
+
+SETTINGS = CrawlSettings(max_videos=3, keep_seen=2)
+
+
+class FakeChannels:
+    """Lists the videos of channels newest first, counting the videos read"""
+
+    def __init__(self, videos: dict[str, list[str]]):
+        self.videos = videos
+        self.read = 0
+
+    def upload(self, channel_url: str, video_id: str) -> None:
+        self.videos[channel_url].insert(0, video_id)
+
+    def __call__(self, channel_url: str):
+        if channel_url not in self.videos:
+            raise ConnectionError("channel not found")
+
+        for video_id in self.videos[channel_url]:
+            self.read += 1
+            yield {"videoId": video_id}
+
+
+def test_crawl_stops_at_known_videos():
+    channels = FakeChannels({"a": [f"a{i}" for i in range(10, 0, -1)]})
+    store = crawl_channels.MemoryCursorStore()
+
+    def crawl(consumer: str = "digest") -> list[str]:
+        video_ids = crawl_channels.crawl_channel(
+            "a", store, consumer, channels, SETTINGS
+        )
+        store.commit(consumer, video_ids)
+        return video_ids
+
+    assert crawl() == ["a10", "a9", "a8"]
+    assert crawl() == []
+    assert channels.read == 4 + 1
+
+    channels.upload("a", "a11")
+    channels.upload("a", "a12")
+    assert crawl() == ["a12", "a11"]
+
+    # the newest video was deleted: older seen ids still stop the crawl
+    channels.videos["a"].remove("a12")
+    channels.read = 0
+    assert crawl() == []
+    assert channels.read == 1
+
+    # each consumer has its own cursor
+    assert crawl("prefetch") == ["a11", "a10", "a9"]
+
+    cursor = store.get("digest|a")
+    assert cursor["seen_ids"] == ["a12", "a11"]
+    assert cursor["pending_ids"] == []
+    assert cursor["crawled_at"] is not None
+
+
+def test_uncommitted_videos_stay_pending():
+    channels = FakeChannels({"a": ["a3", "a2", "a1"]})
+    store = crawl_channels.MemoryCursorStore()
+
+    def crawl(consumer: str = "digest") -> list[str]:
+        return crawl_channels.crawl_channel(
+            "a", store, consumer, channels, SETTINGS
+        )
+
+    assert crawl() == ["a3", "a2", "a1"]
+
+    # a2 failed downstream, so it is returned again after the new uploads
+    store.commit("digest", ["a3", "a1"])
+    channels.upload("a", "a4")
+    assert crawl() == ["a4", "a2"]
+    assert crawl() == ["a4", "a2"]
+
+    # only the consumer's own cursors are committed
+    assert crawl("prefetch") == ["a4", "a3", "a2"]
+    store.commit("prefetch", ["a4", "a3", "a2"])
+    assert crawl("prefetch") == []
+    assert crawl() == ["a4", "a2"]
+
+    # at most `max_videos` ids are kept pending
+    for video_id in ["a5", "a6"]:
+        channels.upload("a", video_id)
+    assert crawl() == ["a6", "a5", "a4"]
+
+
+def test_crawl_channels_and_prefetch():
+    channels = FakeChannels({"a": ["a2", "a1"], "b": ["b1"]})
+    store = crawl_channels.MemoryCursorStore()
+    ingested = []
+
+    def ingest(urls: list[str]) -> list[dict]:
+        ingested.append(urls)
+        return [
+            {
+                "video_id": url.split("=")[-1],
+                "status": "failed" if url.endswith("b3") else "downloaded",
+            }
+            for url in urls
+        ]
+
+    new = crawl_channels.crawl_channels(
+        ["a", "b", "missing"], store, "digest", channels, SETTINGS
+    )
+    assert new == {
+        "a": [
+            "https://www.youtube.com/watch?v=a2",
+            "https://www.youtube.com/watch?v=a1",
+        ],
+        "b": ["https://www.youtube.com/watch?v=b1"],
+        "missing": [],
+    }
+    assert store.get("digest|missing") is None
+
+    prefetcher = crawl_channels.TranscriptPrefetcher(
+        ["b"], store, ingest, list_videos=channels
+    )
+    assert len(prefetcher.run_once()) == 1
+    assert prefetcher.run_once() == []
+
+    channels.upload("b", "b2")
+    prefetcher.start()
+    prefetcher.stop(timeout=5)
+
+    assert ingested == [
+        ["https://www.youtube.com/watch?v=b1"],
+        ["https://www.youtube.com/watch?v=b2"],
+    ]
+
+    # a video that fails to download is tried again by the next crawl
+    channels.upload("b", "b3")
+    assert [r["status"] for r in prefetcher.run_once()] == ["failed"]
+    assert [r["status"] for r in prefetcher.run_once()] == ["failed"]
+    assert store.get("prefetch|b")["pending_ids"] == ["b3"]
@@ -4,7 +4,11 @@ import os
 
 import pytest
 
+from tests.fakes import FakeCollection
+from video_summarizer.backend.configs.config import IngestSettings
 from video_summarizer.backend.src import extract_transcript
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.cache import MemoryCache
 
 URL = "https://www.youtube.com/watch?v=JEBDfGqrAUA"
 VIDEO_ID = "JEBDfGqrAUA"
@@ -28,3 +32,127 @@ def test_get_transcript_from_db():
 def test_get_video_transcript():
     transcript = extract_transcript.get_video_transcript(VIDEO_ID)
     assert len(transcript) == 604
+
+
+class FlakyYouTube:
+    """Fails the first `failures` requests for each video"""
+
+    def __init__(self, failures: dict[str, int]):
+        self.failures = dict(failures)
+        self.timeouts = set()
+
+    def fetch_transcript(self, video_id: str, timeout: float) -> list[dict]:
+        self.timeouts.add(timeout)
+
+        if video_id == "private":
+            raise ValueError("transcripts are disabled")
+
+        if self.failures.get(video_id, 0) > 0:
+            self.failures[video_id] -= 1
+            raise ConnectionResetError("connection reset")
+
+        return [
+            {"text": f"transcript of {video_id}", "start": 0.5, "duration": 2}
+        ]
+
+    def fetch_metadata(self, video_url: str, timeout: float) -> dict:
+        self.timeouts.add(timeout)
+        video_id = extract_transcript.get_video_id(video_url)
+
+        if self.failures.get(video_url, 0) > 0:
+            self.failures[video_url] -= 1
+            raise ConnectionResetError("connection reset")
+
+        return {"video_title": f"title of {video_id}", "channel_name": "c"}
+
+
+def test_ingest_urls_retries_and_reports():
+    collection = FakeCollection(docs=[{"video_id": "old"}])
+    settings = IngestSettings(workers=4, timeout_seconds=3, backoff_seconds=0)
+    youtube = FlakyYouTube({"a": 2, "b": 5})
+    urls = [
+        f"https://www.youtube.com/watch?v={v}"
+        for v in ["a", "b", "old", "private", "a"]
+    ]
+
+    reports = extract_transcript.ingest_urls(
+        urls,
+        youtube.fetch_transcript,
+        youtube.fetch_metadata,
+        repository.VideoRepository(collection),
+        settings,
+        MemoryCache(),
+    )
+
+    assert [r["status"] for r in reports] == [
+        "downloaded",
+        "failed",
+        "exists",
+        "failed",
+        "downloaded",
+    ]
+    assert [r.get("requests") for r in reports] == [4, 4, None, 1, 4]
+    assert "connection reset" in reports[1]["error"]
+    assert "disabled" in reports[3]["error"]
+    assert youtube.timeouts == {3}
+
+    doc = collection.find_one({"video_id": "a"})
+    assert doc["video_title"] == "title of a"
+    assert doc["channel_name"] == "c"
+    assert doc["thumbnail_url"] is None
+    assert extract_transcript.load_transcript(doc).lines() == [
+        "\n0:00:00 - transcript of a"
+    ]
+    assert len(collection.docs) == 2
+
+
+def test_download_transcript_without_metadata():
+    settings = IngestSettings(attempts=2, backoff_seconds=0)
+    youtube = FlakyYouTube({"https://www.youtube.com/watch?v=a": 2})
+    cache = MemoryCache()
+
+    doc = extract_transcript.download_transcript(
+        "a", youtube.fetch_transcript, youtube.fetch_metadata, settings, cache
+    )
+
+    assert doc["video_title"] == "Unknown Video Title"
+    assert doc["channel_name"] is None
+    assert extract_transcript.load_transcript(doc).lines() == [
+        "\n0:00:00 - transcript of a"
+    ]
+
+    # the defaults are not cached
+    doc = extract_transcript.download_transcript(
+        "a", youtube.fetch_transcript, youtube.fetch_metadata, settings, cache
+    )
+    assert doc["video_title"] == "title of a"
+
+
+def test_videos_metadata_is_fetched_once():
+    settings = IngestSettings(workers=4, backoff_seconds=0)
+    youtube = FlakyYouTube({"https://www.youtube.com/watch?v=b": 1})
+    cache = MemoryCache()
+    urls = [f"https://www.youtube.com/watch?v={v}" for v in "abc"]
+
+    metadata = extract_transcript.get_videos_metadata(
+        urls[:2], youtube.fetch_metadata, cache, settings
+    )
+    assert metadata[urls[1]]["video_title"] == "title of b"
+
+    def fetch_once(video_url: str, timeout: float) -> dict:
+        assert video_url == urls[2], "cached videos are not requested"
+        return youtube.fetch_metadata(video_url, timeout)
+
+    metadata = extract_transcript.get_videos_metadata(
+        urls, fetch_once, cache, settings
+    )
+    assert [m["video_title"] for m in metadata.values()] == [
+        "title of a",
+        "title of b",
+        "title of c",
+    ]
+    cached = extract_transcript.get_video_metadata(
+        urls[0], fetch_once, cache, settings
+    )
+    assert cached == metadata[urls[0]]
+    assert cache.get_stats()["hits"] == 3
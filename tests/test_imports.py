@@ -0,0 +1,22 @@
+"""This module tests that heavy libraries are only imported when used"""
+
+import subprocess
+import sys
+
+HEAVY = ["fastapi", "langchain", "pandas", "pinecone", "scrapetube"]
+
+
+def test_chat_video_imports_lazily():
+    code = (
+        "import sys\n"
+        "import video_summarizer.backend.src.chat_video\n"
+        f"print(sorted(set({HEAVY}) & set(sys.modules)))"
+    )
+    res = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert res.stdout.splitlines()[-1] == "[]"
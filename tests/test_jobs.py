@@ -0,0 +1,77 @@
+"""This module tests the background job subsystem"""
+
+import time
+
+from video_summarizer.backend.src import jobs
+
+REQUEST = {"videos": ["a", "b", "c"], "limit_transcript": 0.25}
+
+
+def resolve(request: dict) -> list[str]:
+    return request["videos"]
+
+
+def summarise(url: str, request: dict) -> list[dict]:
+    if url == "b":
+        raise ValueError("no transcript")
+    return [{"video_id": url, "summary": f"summary of {url}"}]
+
+
+def wait_for(manager: jobs.JobManager, job_id: str, timeout: float = 5):
+    start = time.time()
+    while time.time() - start < timeout:
+        job = manager.get(job_id)
+        if job["status"] not in jobs.UNFINISHED:
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+def test_job_reports_each_video():
+    manager = jobs.JobManager(jobs.MemoryJobStore(), resolve, summarise)
+    job_id = manager.submit(REQUEST)
+
+    job = wait_for(manager, job_id)
+
+    assert job["status"] == "partial"
+    assert [v["status"] for v in job["videos"]] == ["done", "failed", "done"]
+    assert job["videos"][0]["result"][0]["summary"] == "summary of a"
+    assert job["videos"][1]["error"] == "no transcript"
+
+
+def test_job_fails_when_every_video_fails():
+    manager = jobs.JobManager(jobs.MemoryJobStore(), resolve, summarise)
+
+    job = wait_for(manager, manager.submit({"videos": ["b", "b"]}))
+
+    assert job["status"] == "failed"
+    assert job["error"] is None
+
+
+def test_unfinished_jobs_are_resumed():
+    store = jobs.MemoryJobStore()
+    store.create(
+        {
+            "_id": "job",
+            "status": "running",
+            "request": REQUEST,
+            "videos": [
+                {"url": "a", "status": "done", "result": []},
+                {"url": "c", "status": "running"},
+            ],
+            "error": None,
+        }
+    )
+
+    calls = []
+
+    def track(url, request):
+        calls.append(url)
+        return summarise(url, request)
+
+    manager = jobs.JobManager(store, resolve, track)
+    assert manager.resume() == ["job"]
+
+    job = wait_for(manager, "job")
+    assert job["status"] == "done"
+    assert calls == ["c"]
@@ -0,0 +1,65 @@
+"""This module tests the BM25 index and rank fusion"""
+
+from video_summarizer.backend.utils.lexical import (
+    BM25Index,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+TEXTS = [
+    "we load the data with pandas and plot it",
+    "pandas pandas pandas everywhere",
+    "a vector store keeps the embeddings",
+    "the weather is nice today",
+]
+
+
+def build() -> BM25Index:
+    ids = [f"doc-{i}" for i in range(len(TEXTS))]
+    return BM25Index.build(ids, TEXTS, [{"text": t} for t in TEXTS])
+
+
+def test_tokenize():
+    assert tokenize("What is a Vector store?") == ["vector", "store"]
+
+
+def test_search_ranks_by_bm25():
+    index = build()
+
+    matches = index.search("pandas", top_k=5)
+    assert [m["id"] for m in matches] == ["doc-1", "doc-0"]
+    assert matches[0]["score"] > matches[1]["score"]
+    assert all(m["coverage"] == 1.0 for m in matches)
+
+    assert index.search("what is the vector store")[0]["id"] == "doc-2"
+    assert index.search("the") == []
+
+
+def test_coverage_counts_missing_terms():
+    matches = build().search("pandas plot numpy")
+
+    assert matches[0]["id"] == "doc-0"
+    assert 0 < matches[0]["coverage"] < 1
+    assert matches[1]["coverage"] < matches[0]["coverage"]
+
+
+def test_save_and_load(tmp_path):
+    index = build()
+    index.save(tmp_path / "index.npz")
+
+    loaded = BM25Index.load(tmp_path / "index.npz")
+
+    assert loaded.ids == index.ids
+    assert loaded.search("vector embeddings") == index.search(
+        "vector embeddings"
+    )
+
+
+def test_reciprocal_rank_fusion():
+    lexical = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    vector = [{"id": "c"}, {"id": "d"}, {"id": "a"}]
+
+    fused = reciprocal_rank_fusion([lexical, vector], top_k=3, k=60)
+
+    assert [m["id"] for m in fused] == ["a", "c", "b"]
+    assert fused[0]["score"] == 1 / 61 + 1 / 63
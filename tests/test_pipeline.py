@@ -0,0 +1,253 @@
+"""This module tests the staged pipeline and the batch used to summarise
+many videos"""
+
+import threading
+from functools import partial
+
+import pytest
+
+from tests.fakes import FakeCollection
+from video_summarizer.backend import main
+from video_summarizer.backend.configs.config import (
+    IngestSettings,
+    PipelineSettings,
+)
+from video_summarizer.backend.src.extract_transcript import (
+    download_transcript,
+)
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.cache import MemoryCache
+from video_summarizer.backend.utils.concurrency import Stage, run_pipeline
+from video_summarizer.backend.utils.repository import VideoRepository
+
+
+def test_pipeline_keeps_input_order():
+    stages = [
+        Stage("list", lambda n: [n * 10 + j for j in range(n)], fan_out=True),
+        Stage("square", lambda x: x * x, workers=3),
+    ]
+
+    result = run_pipeline([3, 1, 2], stages)
+
+    assert result == [30**2, 31**2, 32**2, 10**2, 20**2, 21**2]
+
+
+def test_pipeline_overlaps_stages():
+    # each fetch after the first one waits until the summarise stage is
+    # running, or a timeout passes, so the test does not depend on how fast
+    # the machine is
+    summarising = threading.Event()
+    overlapped = []
+
+    def fetch(x):
+        if x > 0:
+            overlapped.append(summarising.wait(timeout=5))
+        return x
+
+    def summarise(x):
+        summarising.set()
+        return x
+
+    stages = [Stage("fetch", fetch), Stage("summarise", summarise)]
+
+    result = run_pipeline(range(5), stages)
+
+    assert result == list(range(5))
+    # the summarise stage ran while the fetch stage still had items
+    assert overlapped == [True] * 4
+
+
+def test_pipeline_raises_stage_errors():
+    def fail(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    with pytest.raises(ValueError, match="bad item"):
+        run_pipeline(range(10), [Stage("fail", fail, workers=2)], queue_size=1)
+
+
+def test_pipeline_finishes_queued_items_on_error():
+    saved = []
+
+    def produce(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    stages = [
+        Stage("produce", produce),
+        Stage("save", saved.append, finish_on_error=True),
+    ]
+
+    with pytest.raises(ValueError, match="bad item"):
+        run_pipeline(range(10), stages)
+
+    assert saved == [0, 1, 2]
+
+
+class FakeVideos:
+    """50 videos: v00-v39 have a stored transcript, v00-v19 a summary (5 of
+    them with another limit), v48 fails to be summarised and v49 to be
+    downloaded"""
+
+    def __init__(self):
+        self.video_ids = [f"v{i:02d}" for i in range(50)]
+        self.urls = [
+            f"https://www.youtube.com/watch?v={v}" for v in self.video_ids
+        ]
+        self.transcripts = FakeCollection(
+            "transcripts",
+            docs=[
+                {"video_id": v, "video_title": v} for v in self.video_ids[:40]
+            ],
+        )
+        self.summaries = FakeCollection(
+            "summaries",
+            docs=[
+                {"video_id": v, "limit_transcript": 0.5 if i < 15 else 1}
+                for i, v in enumerate(self.video_ids[:20])
+            ],
+        )
+        self.summarised = []
+        self.summarising = threading.Event()
+        self.overlapped = []
+
+    def fetch_transcript(self, video_id: str, timeout: float) -> list[dict]:
+        if video_id == "v49":
+            # videos are summarised while the last one is still fetched
+            self.overlapped.append(self.summarising.wait(timeout=5))
+            raise ValueError("transcripts are disabled")
+        return [{"text": "hello", "start": 0, "duration": 1}]
+
+    def fetch_metadata(self, video_url: str, timeout: float) -> dict:
+        return {"video_title": video_url}
+
+    def summarise(self, limit, video_id, on_progress, overrides, transcript):
+        assert transcript["video_id"] == video_id
+        self.summarising.set()
+        if video_id == "v48":
+            raise RuntimeError("LLM error")
+
+        self.summarised.append(video_id)
+        return {"video_id": video_id, "summary": "s", "limit_transcript": 0.5}
+
+
+@pytest.fixture
+def videos(monkeypatch):
+    videos = FakeVideos()
+
+    monkeypatch.setattr(
+        repository,
+        "get_transcripts",
+        lambda: VideoRepository(videos.transcripts),
+    )
+    monkeypatch.setattr(
+        repository,
+        "get_summaries",
+        lambda: VideoRepository(videos.summaries),
+    )
+    monkeypatch.setattr(
+        main,
+        "download_transcript",
+        partial(
+            download_transcript,
+            fetch_transcript=videos.fetch_transcript,
+            fetch_metadata=videos.fetch_metadata,
+            settings=IngestSettings(backoff_seconds=0),
+            cache=MemoryCache(),
+        ),
+    )
+    monkeypatch.setattr(main, "summarise_video", videos.summarise)
+
+    return videos
+
+
+@pytest.fixture
+def use_settings(monkeypatch):
+    def use(**kwargs):
+        settings = PipelineSettings(**kwargs)
+        monkeypatch.setattr(
+            PipelineSettings, "load_settings", lambda: settings
+        )
+
+    return use
+
+
+def test_summarise_urls_batches_round_trips(videos, use_settings):
+    use_settings(persist_batch_size=20, persist_interval_seconds=3600)
+
+    msgs, failed = main.summarise_urls(videos.urls + videos.urls[:2], 0.5)
+
+    # each video is in a list of its own, as streamed summaries are
+    assert [[m["video_id"] for m in msg] for msg in msgs] == [
+        [v] for v in videos.video_ids[:48]
+    ]
+    assert sorted(videos.summarised) == videos.video_ids[15:48]
+    assert videos.overlapped == [True]
+
+    # the videos that failed to download or summarise are reported
+    assert [(f["video_id"], f["stage"]) for f in failed] == [
+        ("v48", "summarise"),
+        ("v49", "fetch"),
+    ]
+    assert failed[1]["url"] == videos.urls[49]
+    assert "disabled" in failed[1]["error"]
+
+    # one read of the stored transcripts and of the summaries, then one
+    # bulk write of each per 20 videos
+    assert videos.transcripts.round_trips <= 1 + 3
+    assert len(videos.transcripts.docs) == 49
+    assert videos.summaries.round_trips == 1 + 3
+    assert len(videos.summaries.docs) == 48
+
+
+def test_summaries_are_saved_in_micro_batches(videos, use_settings):
+    use_settings(
+        persist_batch_size=5, persist_interval_seconds=3600, fetch_workers=1
+    )
+    events = main.iter_summaries([], videos.urls[15:40], 0.5, 0, "newest")
+
+    # the batch stops early, e.g. its client went away: the videos written
+    # so far and the ones in flight are kept
+    for _ in range(12):
+        next(events)
+    events.close()
+
+    saved = [
+        d["video_id"]
+        for d in videos.summaries.docs
+        if d["limit_transcript"] == 0.5 and d["video_id"] >= "v15"
+    ]
+    assert sorted(saved) == sorted(videos.summarised)
+    assert 12 <= len(saved) < 25
+
+
+def test_stream_reports_failed_videos(videos, use_settings, monkeypatch):
+    use_settings()
+
+    def get_videos_from_channel(channel_url: str, **kwargs) -> list[str]:
+        raise ConnectionError("channel not found")
+
+    monkeypatch.setattr(
+        main, "get_videos_from_channel", get_videos_from_channel
+    )
+
+    events = list(
+        main.iter_summaries(
+            ["https://www.youtube.com/@missing"],
+            videos.urls[46:],
+            0.5,
+            2,
+            "newest",
+        )
+    )
+
+    assert [e for e, _ in events].count("summary") == 2
+    failed = sorted(
+        (data["stage"], data["video_id"])
+        for event, data in events
+        if event == "failed"
+    )
+    assert failed == [("fetch", "v49"), ("list", None), ("summarise", "v48")]
+    assert len(videos.summaries.docs) == 22
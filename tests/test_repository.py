@@ -0,0 +1,60 @@
+"""This module tests the MongoDB data access layer"""
+
+from types import SimpleNamespace
+
+from tests.fakes import FakeCollection
+from video_summarizer.backend.utils.repository import (
+    DatabaseMetrics,
+    VideoRepository,
+)
+
+
+def test_find_many_uses_one_query():
+    collection = FakeCollection(
+        docs=[{"video_id": v, "summary": v.upper()} for v in "abc"]
+    )
+    repo = VideoRepository(collection)
+
+    docs = repo.find_many(["a", "c", "z"])
+
+    assert set(docs) == {"a", "c"}
+    assert docs["c"]["summary"] == "C"
+    assert repo.existing_ids(["b", "z"]) == {"b"}
+    assert collection.round_trips == 2
+
+
+def test_upsert_many_uses_one_bulk_write():
+    collection = FakeCollection(docs=[{"video_id": "a", "summary": "old"}])
+    repo = VideoRepository(collection)
+
+    count = repo.upsert_many(
+        [{"video_id": "a", "summary": "new"}, {"video_id": "b"}]
+    )
+
+    assert count == 2
+    assert collection.round_trips == 1
+    assert repo.find_one("a")["summary"] == "new"
+    assert len(collection.docs) == 2
+
+
+def test_database_metrics():
+    metrics = DatabaseMetrics()
+
+    for micros in (1000, 3000):
+        metrics.succeeded(
+            SimpleNamespace(command_name="find", duration_micros=micros)
+        )
+    metrics.failed(SimpleNamespace(command_name="insert", duration_micros=500))
+    metrics.connection_created(SimpleNamespace(connection_id=1))
+    metrics.connection_ready(SimpleNamespace(connection_id=1))
+
+    result = metrics.to_dict()
+
+    assert result["commands"]["find"] == {
+        "count": 2,
+        "seconds": 0.004,
+        "avg_ms": 2.0,
+    }
+    assert result["round_trips"] == 3
+    assert result["failures"] == 1
+    assert result["connections_created"] == 1
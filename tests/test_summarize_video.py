@@ -0,0 +1,308 @@
+"""This module tests the map and reduce phases of summarising a video"""
+
+import threading
+import time
+
+import pytest
+
+from video_summarizer.backend.configs.config import ModelParams
+from video_summarizer.backend.src import summarize_video
+from video_summarizer.backend.src.summary_state import (
+    SummaryState,
+    get_params_hash,
+)
+from video_summarizer.backend.utils.concurrency import (
+    RateLimiter,
+    map_concurrently,
+)
+from video_summarizer.backend.utils.utils import estimate_tokens
+
+
+class FakeModel:
+    """Stands in for an LLMChain, answering every question after a delay"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def predict(self, question: str) -> str:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        time.sleep(self.latency)
+
+        with self._lock:
+            self.in_flight -= 1
+
+        return f"summary of {len(question)} chars"
+
+
+class OverlapModel(FakeModel):
+    """Holds each call until `expected` calls are in flight at once, or a
+    timeout passes, so the test does not depend on how fast the machine is"""
+
+    def __init__(self, expected: int, timeout: float = 10):
+        super().__init__()
+        self.expected = expected
+        self.timeout = timeout
+        self.overlapped = threading.Event()
+
+    def predict(self, question: str) -> str:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.in_flight == self.expected:
+                self.overlapped.set()
+
+        self.overlapped.wait(self.timeout)
+
+        with self._lock:
+            self.in_flight -= 1
+
+        return f"summary of {len(question)} chars"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, secs: float) -> None:
+        self.now += secs
+
+
+def test_map_concurrently_keeps_order():
+    def work(i):
+        time.sleep(0.01 * (5 - i % 5))
+        return i * 2
+
+    result = map_concurrently(work, range(20), max_workers=5)
+    assert result == [i * 2 for i in range(20)]
+
+
+def test_summarize_list_of_transcripts_concurrently():
+    model = OverlapModel(expected=4)
+    transcripts = [[f"\n0:00:{i:02d} - line {i}"] for i in range(16)]
+
+    summaries = summarize_video.summarize_list_of_transcripts(
+        transcripts, bullets=5, model=model, limit=150, max_concurrency=4
+    )
+
+    assert len(summaries) == len(transcripts)
+    assert model.calls == len(transcripts)
+    # 4 calls were in flight at once, and never more
+    assert model.overlapped.is_set()
+    assert model.max_in_flight == 4
+
+
+def test_rate_limiter_requests_per_minute():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        requests_per_minute=3, clock=clock.time, sleep=clock.sleep
+    )
+
+    waits = [limiter.acquire() for _ in range(7)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] == 60
+    assert clock.now == 120
+
+
+def test_rate_limiter_tokens_per_minute():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        tokens_per_minute=1000, clock=clock.time, sleep=clock.sleep
+    )
+
+    assert limiter.acquire(600) == 0
+    assert limiter.acquire(600) == 60
+
+    # a request larger than the limit still runs once the window is empty
+    assert limiter.acquire(5000) == 60
+
+
+def test_reduce_summaries_is_logarithmic():
+    model = FakeModel()
+    summaries = [f"summary {i}" for i in range(64)]
+
+    summary, stats = summarize_video.reduce_summaries(
+        summaries,
+        bullets=5,
+        model=model,
+        limit=150,
+        fan_in=4,
+        token_budget=4000,
+        max_concurrency=4,
+    )
+
+    assert summary.startswith("summary of")
+    assert [s["outputs"] for s in stats] == [16, 4, 1]
+    assert model.calls == 16 + 4 + 1
+
+
+def test_reduce_summaries_respects_token_budget():
+    model = FakeModel()
+    summaries = ["x" * 2000 for _ in range(10)]
+    token_budget = 1000
+
+    prompts = []
+    model.predict = lambda question: prompts.append(question) or "short"
+
+    summarize_video.reduce_summaries(
+        summaries,
+        bullets=5,
+        model=model,
+        limit=150,
+        fan_in=4,
+        token_budget=token_budget,
+    )
+
+    assert prompts
+    assert all(estimate_tokens(p) <= token_budget for p in prompts)
+    # summaries too long to pair are summarised alone rather than cut
+    assert sum("x" * 2000 in p for p in prompts) == 10
+
+
+def test_reduce_summaries_warns_when_truncating(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(summarize_video.logger, "warning", warnings.append)
+    model = FakeModel()
+    model.predict = lambda question: "short"
+
+    summarize_video.reduce_summaries(
+        ["x" * 8000, "short"],
+        bullets=5,
+        model=model,
+        limit=150,
+        fan_in=4,
+        token_budget=1000,
+        video_id="abc",
+    )
+
+    assert len(warnings) == 1
+    assert "video_id='abc'" in warnings[0]
+
+
+def make_lines(n: int) -> list[str]:
+    return [
+        f"\n0:{i // 60:02d}:{i % 60:02d} - " + "word " * (i % 7 + 1)
+        for i in range(n)
+    ]
+
+
+def test_chunk_by_tokens_respects_budget():
+    lines = make_lines(500)
+    chunks = summarize_video.chunk_by_tokens(lines, max_tokens=200)
+
+    assert [line for chunk in chunks for line in chunk] == lines
+    assert all(
+        sum(estimate_tokens(line) for line in chunk) <= 200 for chunk in chunks
+    )
+    assert len(chunks) < len(summarize_video.chunk_a_list(lines, 10))
+
+
+def test_chunk_by_tokens_overlap():
+    lines = make_lines(100)
+    chunks = summarize_video.chunk_by_tokens(lines, max_tokens=100, overlap=20)
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk[0] in previous
+        assert all(line.startswith("\n0:") for line in chunk)
+
+    assert chunks[-1][-1] == lines[-1]
+
+
+def summarise_with_state(lines, n_chunks, model, state):
+    transcripts, spans = summarize_video.chunk_transcript(
+        lines,
+        ModelParams(
+            MODEL="gpt",
+            CHUNK_SIZE=10,
+            SUMMARY_LIMIT=150,
+            BULLETS=5,
+            BATCH_CHUNKS=2,
+        ),
+    )
+    transcripts, spans = transcripts[:n_chunks], spans[:n_chunks]
+
+    summaries = summarize_video.summarize_list_of_transcripts(
+        transcripts, 5, model, 150, spans=spans, state=state
+    )
+    return summarize_video.reduce_summaries(
+        summaries,
+        5,
+        model,
+        150,
+        fan_in=4,
+        token_budget=4000,
+        spans=spans,
+        state=state,
+    )
+
+
+def test_summary_state_resumes_and_extends():
+    lines = make_lines(160)  # 16 chunks of 10 lines
+    state = SummaryState("video", "params")
+
+    model = FakeModel()
+    summary, _ = summarise_with_state(lines, 16, model, state)
+    assert model.calls == 16 + 4 + 1
+
+    # a rerun reuses every node
+    model = FakeModel()
+    assert summarise_with_state(lines, 16, model, state)[0] == summary
+    assert model.calls == 0
+
+    # summarising more of the transcript only summarises the new chunks and
+    # the reduce nodes that changed: 4 chunks, 1 node at each of 3 levels
+    lines = make_lines(200)
+    model = FakeModel()
+    summarise_with_state(lines, 20, model, state)
+    assert model.calls == 4 + 1 + 1 + 1
+
+
+def test_summary_state_depends_on_reduce_params():
+    params = ModelParams.load()
+    same = ModelParams.load(overrides={"MAX_CONCURRENCY": 8})
+    fan_in = ModelParams.load(overrides={"REDUCE_FAN_IN": 2})
+
+    # the reduce tree has other nodes with another fan-in
+    assert get_params_hash(same) == get_params_hash(params)
+    assert get_params_hash(fan_in) != get_params_hash(params)
+
+
+def test_map_concurrently_reports_progress():
+    events = []
+    map_concurrently(
+        lambda i: i,
+        range(5),
+        max_workers=2,
+        on_progress=lambda completed, total: events.append((completed, total)),
+    )
+
+    assert events == [(i, 5) for i in range(1, 6)]
+
+
+def test_map_concurrently_stops_on_first_error():
+    calls = []
+
+    def work(i):
+        calls.append(i)
+        if i == 1:
+            raise ValueError("bad item")
+        time.sleep(0.01)
+        return i
+
+    with pytest.raises(ValueError, match="bad item"):
+        map_concurrently(work, range(100), max_workers=2)
+
+    # the items queued behind the failure were cancelled
+    assert len(calls) < 100
@@ -0,0 +1,124 @@
+"""This module tests the columnar transcript format and its migration"""
+
+import numpy as np
+import pytest
+
+from tests.fakes import FakeCollection
+from video_summarizer.backend.src import migrate_transcripts
+from video_summarizer.backend.utils.repository import VideoRepository
+from video_summarizer.backend.utils.transcripts import Transcript, is_columnar
+
+SEGMENTS = [
+    {"text": f"line\nnumber {i}", "start": 1.5 * i, "duration": 1.5}
+    for i in range(100)
+]
+
+
+@pytest.mark.parametrize("compression", ["zlib", "none"])
+def test_encode_round_trip(compression):
+    transcript = Transcript.from_segments(SEGMENTS)
+    stored = transcript.encode(compression)
+
+    assert is_columnar(stored)
+    decoded = Transcript.decode(stored)
+    assert decoded.texts == transcript.texts
+    np.testing.assert_array_equal(decoded.starts, transcript.starts)
+    np.testing.assert_array_equal(decoded.durations, transcript.durations)
+    assert decoded.lines()[3] == "\n0:00:04 - line\nnumber 3"
+
+    assert len(Transcript.decode(Transcript([], [], []).encode())) == 0
+
+
+def test_encode_edge_lines():
+    empty = Transcript.from_segments([{"text": "", "start": 0}])
+    assert Transcript.decode(empty.encode()).texts == [""]
+
+    # NUL separates the lines, so it is removed from their text
+    nul = Transcript.from_segments([{"text": "a\0b", "start": 0}] * 2)
+    assert Transcript.decode(nul.encode()).texts == ["ab", "ab"]
+
+
+def test_decode_legacy_lines():
+    legacy = Transcript.from_segments(SEGMENTS).lines()
+    transcript = Transcript.decode([None, "not a line", *legacy])
+
+    assert transcript.lines() == legacy
+    assert transcript.texts[3] == "line\nnumber 3"
+    assert transcript.durations[:3].tolist() == [1, 2, 1]
+
+
+def test_migrate_transcripts():
+    legacy = Transcript.from_segments(SEGMENTS).lines()
+    columnar = Transcript.from_segments(SEGMENTS).encode()
+    collection = FakeCollection(
+        docs=[
+            {"_id": 1, "video_id": "a", "transcript": legacy},
+            {"_id": 2, "video_id": "b", "transcript": columnar},
+            {"_id": 3, "video_id": "c", "transcript": legacy[:10]},
+        ]
+    )
+
+    report = migrate_transcripts.migrate(
+        VideoRepository(collection), batch_size=1
+    )
+
+    assert report["migrated"] == 2
+    assert report["after"] < report["before"]
+    assert all(is_columnar(doc["transcript"]) for doc in collection.docs)
+    assert Transcript.decode(collection.docs[0]["transcript"]).lines() == (
+        legacy
+    )
+
+    # a second run has nothing left to migrate
+    assert migrate_transcripts.migrate(VideoRepository(collection)) == {
+        "migrated": 0,
+        "before": 0,
+        "after": 0,
+        "failed": [],
+    }
+
+
+def test_migrate_reports_failed_transcripts():
+    legacy = Transcript.from_segments(SEGMENTS).lines()
+    collection = FakeCollection(
+        docs=[
+            {"_id": 1, "video_id": "a", "transcript": [42]},
+            {"_id": 2, "video_id": "b", "transcript": legacy},
+        ]
+    )
+
+    report = migrate_transcripts.migrate(VideoRepository(collection))
+
+    # the other documents are still migrated
+    assert report["migrated"] == 1
+    assert report["failed"] == [1]
+    assert collection.docs[0]["transcript"] == [42]
+    assert is_columnar(collection.docs[1]["transcript"])
+
+
+class ConcurrentRun(FakeCollection):
+    """Converts a document as soon as the ids to migrate have been read, as
+    another run of the migration would"""
+
+    def find(self, query: dict, projection=None):
+        docs = super().find(query, projection)
+        if projection:
+            self.docs[0]["transcript"] = Transcript.from_lines(
+                self.docs[0]["transcript"]
+            ).encode()
+        return docs
+
+
+def test_migrate_skips_converted_transcripts():
+    legacy = Transcript.from_segments(SEGMENTS).lines()
+    collection = ConcurrentRun(
+        docs=[
+            {"_id": 1, "video_id": "a", "transcript": legacy},
+            {"_id": 2, "video_id": "b", "transcript": legacy},
+        ]
+    )
+
+    report = migrate_transcripts.migrate(VideoRepository(collection))
+
+    assert report["migrated"] == 1
+    assert all(is_columnar(doc["transcript"]) for doc in collection.docs)
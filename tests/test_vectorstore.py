@@ -0,0 +1,133 @@
+"""This module tests the vector store backends"""
+
+import numpy as np
+import pytest
+
+from tests.fakes import FakePinecone, FakePineconeIndex
+from video_summarizer.backend.src.migrate_vectors import migrate
+from video_summarizer.backend.utils.vectorstore import (
+    LocalVectorStore,
+    PineconeVectorStore,
+)
+
+DIM = 16
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalVectorStore(tmp_path / "vectors")
+
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, DIM))
+
+
+def add(store, video_id: str, vectors: np.ndarray, start: int = 0):
+    ids = [f"{video_id}-{i}" for i in range(start, start + len(vectors))]
+    metadata = [{"text": id_} for id_ in ids]
+    store.upsert(video_id, ids, vectors.tolist(), metadata)
+    return ids
+
+
+def test_query_matches_brute_force(store):
+    vectors = random_vectors(200)
+    ids = add(store, "abc", vectors)
+    query = random_vectors(1, seed=1)[0]
+
+    matches = store.query("abc", query.tolist(), top_k=5)
+
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    cosine = (vectors @ query) / norms
+    expected = [ids[i] for i in np.argsort(-cosine)[:5]]
+
+    assert [m["id"] for m in matches] == expected
+    assert [m["metadata"]["text"] for m in matches] == expected
+    assert matches[0]["score"] == pytest.approx(cosine.max(), abs=1e-5)
+
+
+def test_upsert_appends_and_replaces(store):
+    vectors = random_vectors(10)
+    add(store, "abc", vectors)
+    add(store, "abc", random_vectors(5, seed=2), start=8)
+
+    assert store.count("abc") == 13
+
+    # row 9 was replaced, so it is its own best match
+    replaced = random_vectors(5, seed=2)[1]
+    assert store.query("abc", replaced.tolist(), top_k=1)[0]["id"] == "abc-9"
+
+
+def test_videos_are_separate_and_persisted(store, tmp_path):
+    add(store, "abc", random_vectors(10))
+    add(store, "xyz", random_vectors(3, seed=3))
+
+    reopened = LocalVectorStore(tmp_path / "vectors")
+
+    assert reopened.count("abc") == 10
+    assert reopened.count("xyz") == 3
+    assert reopened.count("missing") == 0
+    assert reopened.query("missing", [1.0] * DIM) == []
+    assert len(reopened.query("xyz", [1.0] * DIM, top_k=10)) == 3
+
+
+def test_delete(store):
+    add(store, "abc", random_vectors(10))
+    store.delete("abc")
+
+    assert store.count("abc") == 0
+    assert store.query("abc", [1.0] * DIM) == []
+
+
+def test_pinecone_uses_one_index_with_namespaces():
+    client = FakePinecone()
+    store = PineconeVectorStore(client, "shared", dimension=DIM)
+
+    add(store, "abc", random_vectors(10))
+    add(store, "xyz", random_vectors(3, seed=3))
+
+    assert client.created == 1
+    assert list(client.indexes) == ["shared"]
+    assert store.count("abc") == 10
+    assert store.count("xyz") == 3
+    assert store.count("missing") == 0
+
+    matches = store.query("xyz", [1.0] * DIM, top_k=10)
+    assert {m["id"] for m in matches} == {"xyz-0", "xyz-1", "xyz-2"}
+
+    store.delete("abc")
+    assert store.count("abc") == 0
+    assert store.count("xyz") == 3
+
+
+def test_migrate_legacy_indexes():
+    legacy = FakePineconeIndex()
+    vectors = random_vectors(250).tolist()
+    legacy.upsert(zip(map(str, range(250)), vectors, [{}] * 250))
+
+    client = FakePinecone({"abcdef": legacy, "unrelated": FakePineconeIndex()})
+    store = PineconeVectorStore(client, "shared", dimension=DIM)
+    reembedded = []
+
+    def reembed(video_id: str) -> int:
+        # the legacy vectors are never copied, only embedded again
+        reembedded.append(video_id)
+        ids = [f"{video_id}-{i}" for i in range(250)]
+        new = [i for i in ids if i not in store.existing_ids(video_id, ids)]
+        add(store, video_id, random_vectors(len(new)))
+        return len(new)
+
+    moved = migrate(client, store, ["AbCdEf"], reembed=reembed)
+
+    assert moved == {"AbCdEf": 250}
+    assert reembedded == ["AbCdEf"]
+    assert set(client.indexes) == {"abcdef", "shared", "unrelated"}
+
+    # a rerun embeds nothing new and deletes the moved index
+    moved = migrate(client, store, ["AbCdEf"], reembed=reembed, delete=True)
+
+    assert moved == {"AbCdEf": 250}
+    assert store.count("AbCdEf") == 250
+    assert set(client.indexes) == {"shared", "unrelated"}
+
+    # running it again does nothing
+    assert migrate(client, store, ["AbCdEf"], reembed=reembed) == {}
@@ -1,14 +1,36 @@
 import configparser
+import json
+import queue
+import threading
+import uuid
+from contextlib import asynccontextmanager
 
-import yaml
-from fastapi import APIRouter, Depends, FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from main import main
-from pydantic import BaseModel
+from main import (
+    commit_new,
+    iter_summaries,
+    load_urls,
+    main,
+    summarise_url,
+)
+from pydantic import BaseModel, ConfigDict, field_validator
 
 from video_summarizer.backend.configs import config
-from video_summarizer.backend.utils import auth
+from video_summarizer.backend.src import (
+    chat_sessions,
+    chat_video,
+    crawl_channels,
+    jobs,
+)
+from video_summarizer.backend.src.extract_transcript import (
+    get_video_id,
+    get_videos_metadata,
+    ingest_urls,
+)
+from video_summarizer.backend.utils import auth, repository
 from video_summarizer.backend.utils.utils import logger
 
 API_PREFIX = config.ApiSettings.load_settings().api_prefix
@@ -20,15 +42,115 @@ description = parser["tool.poetry"]["description"].replace('"', "")
 
 
 class VideoUrls(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
     channels: list[str] = []
     videos: list[str] = []
     limit_transcript: float | int | None = 0.25
     top_n: int = 2
     sort_by: str = "newest"
+    model_params: dict | None = None
+    new_only: bool = False
+
+    @field_validator("model_params")
+    @classmethod
+    def check_model_params(cls, v: dict | None) -> dict | None:
+        """Rejects overrides that are not valid model params"""
+
+        if v:
+            config.ModelParams.load(overrides=v)
+
+        return v
+
+
+class ChatRequest(BaseModel):
+    question: str
+    conversation_id: str | None = None
+    new_conversation: bool = False
+
+
+class MultiChatRequest(BaseModel):
+    question: str
+    channels: list[str] = []
+    videos: list[str] = []
+    top_n: int = 10
+    sort_by: str = "newest"
+    k: int | None = None
+
+
+def resolve_job_urls(request: dict) -> list[str]:
+    """Returns the video urls of a job request"""
+
+    video_urls = {
+        "channels": request["channels"],
+        "videos": list(request["videos"]),
+        "top_n": request["top_n"],
+    }
+    urls = load_urls(
+        video_urls,
+        sort_by=request["sort_by"],
+        new_only=request.get("new_only", False),
+    )
+    return sorted(urls)
+
+
+def summarise_job_url(url: str, request: dict) -> list[dict]:
+    summaries = summarise_url(
+        url,
+        request["limit_transcript"],
+        overrides=request.get("model_params"),
+    )
+
+    if request.get("new_only", False):
+        commit_new([get_video_id(url)])
+
+    return summaries
+
+
+job_manager: jobs.JobManager | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts the job workers and the transcript prefetcher, and resumes
+    unfinished jobs"""
+
+    global job_manager
+
+    repository.ensure_indexes()
+
+    crawl_settings = config.CrawlSettings.load_settings()
+    prefetcher = None
+    if crawl_settings.prefetch and crawl_settings.prefetch_channels:
+        prefetcher = crawl_channels.TranscriptPrefetcher(
+            crawl_settings.prefetch_channels,
+            crawl_channels.get_cursor_store(),
+            ingest_urls,
+            crawl_settings.prefetch_interval_seconds,
+        )
+        prefetcher.start()
+
+    job_manager = jobs.JobManager(
+        store=jobs.MongoJobStore(repository.get_database().jobs),
+        resolve=resolve_job_urls,
+        summarise=summarise_job_url,
+        max_workers=config.ApiSettings.load_settings().job_workers,
+    )
+    job_manager.resume()
+
+    yield
+
+    job_manager.shutdown()
+    if prefetcher is not None:
+        prefetcher.stop(timeout=5)
+    repository.get_client().close()
 
 
 app = FastAPI(
-    title="ChatGPT Video Summarizer", description=description, version=version
+    title="ChatGPT Video Summarizer",
+    description=description,
+    version=version,
+    lifespan=lifespan,
 )
 
 router_v1 = APIRouter()
@@ -67,27 +189,33 @@ def fetch_video_summary(video_urls: VideoUrls):
     * limit_transcript: portion of the video transcript to summarise
     (None=full, <1 = partial, >=1 = number of chuncks)\n
     * top_n: retrieves this number of video from a channel to summarise\n
-    * sort_by: sorts `top_n`
+    * sort_by: sorts `top_n`\n
+    * model_params: overrides some of the model params for this request,
+    e.g. `{"CHUNK_TOKENS": 800}`\n
+    * new_only: only summarise the videos `channels` published since the
+    last request with `new_only`, e.g. for scheduled digests
 
     Returns:
     ---
-    A list of video summaries
+    The summaries of the videos, and the `video_id`, `url`, `stage` and
+    `error` of the videos that could not be summarised
     """
 
-    with open(config.params_path, "r") as f:
-        responses = yaml.safe_load(f).get("responses")
+    responses = config.get_responses()
 
     try:
-        summaries = main(
+        summaries, failed = main(
             channels=video_urls.channels,
             videos=video_urls.videos,
             LIMIT_TRANSCRIPT=video_urls.limit_transcript,
             sort_by=video_urls.sort_by,
             top_n=video_urls.top_n,
+            overrides=video_urls.model_params,
+            new_only=video_urls.new_only,
         )
 
-        data = {"data": {"summaries": summaries}}
-        status = responses.get("SUCCESS")
+        data = {"data": {"summaries": summaries, "failed": failed}}
+        status = responses.get("PARTIAL" if failed else "SUCCESS")
         status_code = config.statuses.SUCCESS.value
 
     except Exception as e:
@@ -99,6 +227,263 @@ def fetch_video_summary(video_urls: VideoUrls):
     return JSONResponse(content={**data, **status}, status_code=status_code)
 
 
+def stream_video_summaries(video_urls: VideoUrls, progress: bool):
+    """Runs the summaries in a background thread and yields each event as a
+    line of JSON as soon as it is available"""
+
+    responses = config.get_responses()
+
+    events = queue.Queue()
+
+    def run():
+        try:
+            for event, data in iter_summaries(
+                channels=video_urls.channels,
+                videos=video_urls.videos,
+                LIMIT_TRANSCRIPT=video_urls.limit_transcript,
+                sort_by=video_urls.sort_by,
+                top_n=video_urls.top_n,
+                on_progress=events.put if progress else None,
+                overrides=video_urls.model_params,
+                new_only=video_urls.new_only,
+            ):
+                events.put({"event": event, "data": data})
+
+            events.put({"event": "done", **responses.get("SUCCESS")})
+
+        except Exception as e:
+            logger.exception(e)
+            events.put({"event": "error", **responses.get("ERROR")})
+
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    while (event := events.get()) is not None:
+        yield json.dumps(event) + "\n"
+
+
+@router_v1.post(
+    path="/summarize_video/stream",
+    dependencies=[Depends(auth.get_current_active_user)],
+)
+def stream_video_summary(video_urls: VideoUrls, progress: bool = False):
+    """Summarize videos using AI, streaming each video's summary as soon as
+    it is ready.
+
+    Args:
+    ---
+    Same as `/summarize_video`, plus:
+    * progress: whether to also stream map/reduce progress events
+
+    Returns:
+    ---
+    Newline delimited JSON events: `summary` for each video, `failed` with
+    the `video_id`, `url`, `stage` and `error` of each video that could not
+    be summarised, `progress` if requested and a final `done` or `error`
+    event
+    """
+
+    return StreamingResponse(
+        stream_video_summaries(video_urls, progress),
+        media_type="application/x-ndjson",
+    )
+
+
+def stream_chat_answer(video_id: str, chat: ChatRequest):
+    """Yields the answer to a question about a video as lines of JSON: a
+    `token` event for each part of the answer and a final `done` or `error`
+    event carrying the id of the conversation"""
+
+    responses = config.get_responses()
+    conversation_id = chat.conversation_id or uuid.uuid4().hex
+
+    try:
+        sessions = chat_sessions.get_chat_sessions()
+        session = sessions.get(video_id)
+        conversation = sessions.get_conversation(conversation_id, video_id)
+        if chat.new_conversation:
+            conversation.reset()
+
+        for token in session.stream(chat.question, conversation):
+            yield json.dumps({"event": "token", "data": token}) + "\n"
+
+        yield json.dumps(
+            {"event": "done", "conversation_id": conversation_id}
+        ) + "\n"
+
+    except Exception as e:
+        logger.exception(e)
+        yield json.dumps(
+            {
+                "event": "error",
+                "conversation_id": conversation_id,
+                **responses.get("CHAT_ERROR"),
+            }
+        ) + "\n"
+
+
+@router_v1.post(
+    path="/chat/{video_id}",
+    dependencies=[Depends(auth.get_current_active_user)],
+)
+def chat_with_video(video_id: str, chat: ChatRequest):
+    """Answers a question about a video, streaming the answer as it is
+    generated. Questions about the same video reuse its warm session, and
+    follow-up questions sent with a conversation id are answered with the
+    earlier questions and answers of that conversation only.
+
+    Args:
+    ---
+    * video_id: the id of a video whose transcript is stored\n
+    * question: the question to ask\n
+    * conversation_id: the conversation to continue, a new one is started
+    if not given\n
+    * new_conversation: whether to forget the earlier questions of the
+    conversation
+
+    Returns:
+    ---
+    Newline delimited JSON events: `token` for each part of the answer and
+    a final `done` or `error` event with the `conversation_id` to send with
+    follow-up questions
+    """
+
+    return StreamingResponse(
+        stream_chat_answer(video_id, chat),
+        media_type="application/x-ndjson",
+    )
+
+
+@router_v1.post(
+    path="/chat",
+    dependencies=[Depends(auth.get_current_active_user)],
+)
+def chat_with_videos(chat: MultiChatRequest):
+    """Answers a question using the transcripts of many videos, e.g. every
+    video of a channel. The videos are searched concurrently and the best
+    matching windows across all of them make up the context.
+
+    Args:
+    ---
+    * question: the question to ask\n
+    * channels: channels whose `top_n` videos (sorted by `sort_by`) are
+    searched\n
+    * videos: video urls to search\n
+    * k: number of transcript windows in the context, defaults to `top_k`
+    in the chat settings
+
+    Returns:
+    ---
+    The answer and, for each window in its context, the video, its title,
+    channel and thumbnail, the timestamps and a link to that moment of the
+    video
+    """
+
+    video_urls = {
+        "channels": chat.channels,
+        "videos": list(chat.videos),
+        "top_n": chat.top_n,
+    }
+    urls = load_urls(video_urls, sort_by=chat.sort_by)
+    video_ids = sorted({get_video_id(url) for url in urls})
+
+    # only the videos whose transcript has been downloaded can be searched
+    stored = repository.get_transcripts().existing_ids(video_ids)
+    video_ids = [v for v in video_ids if v in stored]
+
+    if not video_ids:
+        raise HTTPException(
+            status_code=config.statuses.NOT_FOUND.value,
+            detail="None of the videos have a transcript",
+        )
+
+    try:
+        data = chat_video.ask_videos(chat.question, video_ids, k=chat.k)
+
+        urls = {v: f"https://www.youtube.com/watch?v={v}" for v in video_ids}
+        metadata = get_videos_metadata(list(urls.values()))
+        for source in data["sources"]:
+            source.update(metadata.get(urls[source["video_id"]], {}))
+
+        status_code = config.statuses.SUCCESS.value
+
+    except Exception as e:
+        logger.exception(e)
+        data = config.get_responses().get("CHAT_ERROR")
+        status_code = config.statuses.ERROR.value
+
+    return JSONResponse(content=data, status_code=status_code)
+
+
+@router_v1.post(
+    path="/transcripts",
+    dependencies=[Depends(auth.get_current_active_user)],
+)
+def download_transcripts(video_urls: VideoUrls):
+    """Downloads and stores the transcripts of many videos concurrently,
+    without summarising them. Takes the same fields as `/summarize_video`.
+
+    Returns:
+    ---
+    A report for each video: whether its transcript was `downloaded`,
+    already `exists` or `failed` (with the error), and the number of
+    requests it took
+    """
+
+    request = video_urls.model_dump()
+    return {"data": ingest_urls(resolve_job_urls(request))}
+
+
+@router_v1.post(
+    path="/jobs",
+    dependencies=[Depends(auth.get_current_active_user)],
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def submit_job(video_urls: VideoUrls):
+    """Queues a batch of videos to summarise in the background. Takes the
+    same fields as `/summarize_video`.
+
+    Returns:
+    ---
+    The id of the job, used to check its status via `/jobs/{job_id}`
+    """
+
+    job_id = job_manager.submit(video_urls.model_dump())
+    return {"job_id": job_id, "status": jobs.JobStatus.QUEUED.value}
+
+
+@router_v1.get(
+    path="/jobs/{job_id}",
+    dependencies=[Depends(auth.get_current_active_user)],
+)
+def get_job(job_id: str):
+    """Returns the status of a job, `partial` if some of its videos failed,
+    and the status and summary of each of its videos"""
+
+    job = job_manager.get(job_id)
+
+    if job is None:
+        raise HTTPException(
+            status_code=config.statuses.NOT_FOUND.value,
+            detail=f"Job {job_id} not found",
+        )
+
+    job["job_id"] = job.pop("_id")
+    return JSONResponse(content=jsonable_encoder(job))
+
+
+@router_v1.get(path="/metrics", dependencies=[Depends(auth.validate_api_key)])
+def read_metrics():
+    """Returns database command and connection timings"""
+
+    return {
+        "database": repository.get_metrics(),
+        "chat_sessions": chat_sessions.get_chat_sessions().get_stats(),
+    }
+
+
 @router_v1.get(path="/items", dependencies=[Depends(auth.validate_api_key)])
 def read_items(something: str):
     return {"success": something}
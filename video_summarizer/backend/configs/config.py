@@ -1,9 +1,13 @@
+import copy
+import os
+import threading
 from enum import Enum
+from http import HTTPStatus
 from pathlib import Path
+from typing import TypeVar
 
 import yaml
-from fastapi import status
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 ROOT_DIR = Path(__file__).parent.parent.parent.parent.resolve()
 
@@ -12,35 +16,211 @@ video_keys = ["video_id", "video_url", "video_title", "summary"]
 
 
 class statuses(Enum):
-    SUCCESS = status.HTTP_200_OK
-    ERROR = status.HTTP_400_BAD_REQUEST
-    NOT_FOUND = status.HTTP_404_NOT_FOUND
+    SUCCESS = HTTPStatus.OK.value
+    ERROR = HTTPStatus.BAD_REQUEST.value
+    NOT_FOUND = HTTPStatus.NOT_FOUND.value
+
+
+S = TypeVar("S", bound=BaseSettings)
+
+
+class SettingsRegistry:
+    """Parses a settings file once and re-parses it only when the file's
+    modification time changes. Sections are returned as typed, immutable
+    snapshots that are shared until the next reload."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._mtime = None
+        self._data = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        mtime = os.stat(self.path).st_mtime_ns
+
+        if mtime != self._mtime:
+            with open(self.path, "r") as f:
+                self._data = yaml.safe_load(f)
+
+            self._mtime = mtime
+            self._snapshots = {}
+
+    def get_section(self, name: str) -> dict:
+        """Returns a copy of a section of the settings file"""
+
+        with self._lock:
+            self._refresh()
+            return copy.deepcopy(self._data.get(name))
+
+    def get(self, name: str, cls: type[S]) -> S:
+        """Returns the snapshot of a section parsed into `cls`"""
+
+        with self._lock:
+            self._refresh()
+
+            snapshot = self._snapshots.get(name)
+            if snapshot is None:
+                snapshot = cls(**self._data[name])
+                self._snapshots[name] = snapshot
+
+            return snapshot
+
+
+_registries: dict[Path, SettingsRegistry] = {}
+
+
+def get_registry(path: Path = params_path) -> SettingsRegistry:
+    """Returns the registry of a settings file"""
+
+    registry = _registries.get(path)
+    if registry is None:
+        registry = _registries.setdefault(path, SettingsRegistry(path))
+
+    return registry
 
 
 class ModelParams(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
     MODEL: str
     CHUNK_SIZE: int
+    CHUNK_MODE: str = "lines"
+    CHUNK_TOKENS: int = 1500
+    CHUNK_OVERLAP: int = 0
     SUMMARY_LIMIT: int
     BULLETS: int
     BATCH_CHUNKS: int
+    MAX_CONCURRENCY: int = 1
+    REQUESTS_PER_MINUTE: int | None = None
+    TOKENS_PER_MINUTE: int | None = None
+    REDUCE_FAN_IN: int = 4
+    REDUCE_TOKEN_BUDGET: int = 4000
 
-    def load(path: Path = params_path):
-        with open(path, mode="r") as f:
-            params = yaml.safe_load(f).get("model_params")
+    def load(path: Path = params_path, overrides: dict | None = None):
+        """Returns the model params. `overrides` replaces some of the params
+        for one caller without changing the shared settings"""
 
-        return ModelParams(**params)
+        params = get_registry(path).get("model_params", ModelParams)
+
+        if overrides:
+            params = ModelParams(**{**params.model_dump(), **overrides})
+
+        return params
 
 
 class ApiSettings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
     api_prefix: str
     algorithm: str
     access_token_expire_minutes: int
     token_method: str
+    job_workers: int = 2
+
+    def load_settings():
+        return get_registry().get("endpoint", ApiSettings)
+
+
+class PipelineSettings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
+    list_workers: int = 2
+    fetch_workers: int = 4
+    summarise_workers: int = 2
+    persist_workers: int = 1
+    persist_batch_size: int = 10
+    persist_interval_seconds: float = 5
+    queue_size: int = 8
 
     def load_settings():
-        with open(params_path, "r") as f:
-            api_settings = yaml.safe_load(f)["endpoint"]
-            return ApiSettings(**api_settings)
+        return get_registry().get("pipeline", PipelineSettings)
+
+
+class IngestSettings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
+    workers: int = 8
+    timeout_seconds: float = 10
+    attempts: int = 4
+    backoff_seconds: float = 1
+    max_backoff_seconds: float = 30
+    compression: str = "zlib"
+
+    def load_settings():
+        return get_registry().get("ingest", IngestSettings)
+
+
+class CrawlSettings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
+    workers: int = 4
+    max_videos: int = 50
+    keep_seen: int = 20
+    prefetch: bool = False
+    prefetch_channels: list[str] = []
+    prefetch_interval_seconds: float = 3600
+
+    def load_settings():
+        return get_registry().get("crawl", CrawlSettings)
+
+
+class CacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
+    backend: str
+    path: str
+    ttl_seconds: int | None = None
+    max_entries: int | None = None
+    namespaces: dict[str, dict] = {}
+
+    def load_settings():
+        return get_registry().get("cache", CacheSettings)
+
+
+class VectorStoreSettings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
+    backend: str
+    path: str = ".cache/vectors"
+    index_name: str = "video-summarizer"
+    dimension: int = 1536
+
+    def load_settings():
+        return get_registry().get("vectorstore", VectorStoreSettings)
+
+
+class ChatSettings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
+    window_mode: str = "tokens"
+    window_size: float = 200
+    window_overlap: float = 40
+    top_k: int = 4
+    retrieval_mode: str = "hybrid"
+    fusion_candidates: int = 20
+    rrf_k: int = 60
+    lexical_threshold: float = 0.75
+    lexical_path: str = ".cache/lexical"
+    embed_batch_size: int = 100
+    embed_workers: int = 4
+    upsert_workers: int = 2
+    answer_cache_threshold: float = 0.95
+    answer_cache_ttl_seconds: int | None = 86400
+    answer_cache_max_entries: int | None = 256
+    max_sessions: int = 32
+    max_conversations: int = 1024
+    history_turns: int = 3
+    search_workers: int = 8
+
+    def load_settings():
+        return get_registry().get("chat", ChatSettings)
+
+
+def get_responses() -> dict:
+    """Returns the status messages returned by the API"""
+
+    return get_registry().get_section("responses")
 
 
 prompt_template = """system: You are a helpful assistant who provides useful summaries 
@@ -60,6 +240,20 @@ augmented_prompt = """system: You are a helpful assistant. Please answer the
     assistant:
     """
 
+chat_prompt = """system: You are a helpful assistant. Please answer the
+    question about a video using the conversation so far and the context
+    from the video's transcript below:
+
+    Conversation:
+    {history}
+
+    Context:
+    {context}
+
+    user: {question}
+    assistant:
+    """
+
 if __name__ == "__main__":
     print(ROOT_DIR)
     print(ModelParams.load().BATCH_CHUNKS)
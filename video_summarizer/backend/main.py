@@ -1,11 +1,36 @@
+import threading
+import time
 from pprint import pprint
+from typing import Callable, Iterator
 
-from scrapetube import get_channel
-
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.src.crawl_channels import (
+    crawl_channel,
+    crawl_channels,
+    get_cursor_store,
+)
+from video_summarizer.backend.src.extract_transcript import (
+    download_transcript,
+    get_video_id,
+)
 from video_summarizer.backend.src.extract_transcript import (
     main as extract_main,
 )
+from video_summarizer.backend.src.summarize_video import (
+    check_if_summarised,
+    find_summarised,
+    save_summary,
+)
 from video_summarizer.backend.src.summarize_video import main as summarise_main
+from video_summarizer.backend.src.summarize_video import (
+    summarise as summarise_video,
+)
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.concurrency import (
+    Stage,
+    iter_pipeline,
+    map_concurrently,
+)
 from video_summarizer.backend.utils.utils import logger
 
 
@@ -14,6 +39,8 @@ def get_videos_from_channel(
 ) -> list[str]:
     """Returns a list of video urls from a YouTube channel"""
 
+    from scrapetube import get_channel
+
     videos = get_channel(channel_url=channel_url, sort_by=sort_by)
 
     vids = []
@@ -28,13 +55,18 @@ def get_videos_from_channel(
     return [f"https://www.youtube.com/watch?v={v}" for v in vids]
 
 
-def load_urls(video_urls: dict, sort_by: str) -> list[str] | set:
-    """Extracts videos to be summarised.
+def load_urls(
+    video_urls: dict, sort_by: str, new_only: bool = False
+) -> list[str] | set:
+    """Extracts videos to be summarised. Channels are listed concurrently.
 
     Args:
     ---
     top_n: maximum number of videos to load from a channel
     sort_by: sort videos by
+    new_only: only load the videos channels published since the last
+    crawl with `new_only`, ignoring `top_n` and `sort_by`. They are loaded
+    again until they are committed with `commit_new`
 
     Returns:
     ---
@@ -45,12 +77,20 @@ def load_urls(video_urls: dict, sort_by: str) -> list[str] | set:
     channels = video_urls.get("channels", [])
     c_urls = []
 
-    if len(channels) > 0:
-        for channel in channels:
-            u = get_videos_from_channel(
+    if len(channels) > 0 and new_only:
+        new = crawl_channels(channels, get_cursor_store(), consumer="digest")
+        c_urls = [url for urls in new.values() for url in urls]
+
+    elif len(channels) > 0:
+        listed = map_concurrently(
+            lambda channel: get_videos_from_channel(
                 channel_url=channel, top_n=top_n, sort_by=sort_by
-            )
-            c_urls.extend(u)
+            ),
+            channels,
+            max_workers=config.CrawlSettings.load_settings().workers,
+            show_progress=False,
+        )
+        c_urls = [url for urls in listed for url in urls]
 
     v_urls: list = video_urls.get("videos", [])
 
@@ -59,40 +99,429 @@ def load_urls(video_urls: dict, sort_by: str) -> list[str] | set:
     return set(v_urls)
 
 
+def commit_new(video_ids: list[str]) -> None:
+    """Marks the new videos loaded with `new_only` as summarised, so that
+    later crawls stop returning them"""
+
+    if video_ids:
+        get_cursor_store().commit("digest", video_ids)
+
+
+def summarise_url(
+    url: str,
+    LIMIT_TRANSCRIPT: int | float | None,
+    on_progress: Callable[[dict], None] | None = None,
+    overrides: dict | None = None,
+) -> list[dict]:
+    """Downloads the transcript of a video and summarises it"""
+
+    video_id = extract_main(url=url)
+    return summarise_main(LIMIT_TRANSCRIPT, video_id, on_progress, overrides)
+
+
+def failure(video_id: str | None, url: str, stage: str, error) -> dict:
+    """Logs a video that could not be summarised and returns its report"""
+
+    logger.error(f"Could not {stage} {video_id=} {url=}: {error!r}")
+    return {
+        "video_id": video_id,
+        "url": url,
+        "stage": stage,
+        "error": repr(error),
+    }
+
+
+class SummaryWriter:
+    """Saves the transcripts downloaded and the summaries made by the
+    pipeline in micro-batches: one bulk write of each once `batch_size`
+    videos are waiting or `interval` seconds have passed since the last
+    write, and a last one when the pipeline ends. A batch that stops early
+    only loses the videos not written yet, and other requests see the
+    summaries without waiting for the whole batch.
+
+    Args:
+    ---
+    batch_size: number of videos written at once
+    interval: maximum number of seconds between writes
+    on_saved: called with the ids of the videos saved, including the
+    videos that were already summarised
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 10,
+        interval: float = 5,
+        on_saved: Callable[[list[str]], None] | None = None,
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_saved = on_saved
+        self.transcripts = []
+        self.summaries = []
+        self.videos = {}
+        self.last_write = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        url: str,
+        video_id: str,
+        transcript: dict | None = None,
+        summary: dict | None = None,
+    ) -> list[dict]:
+        """Queues a video's downloaded transcript and new summary, writing
+        the queue if it is due.
+
+        Returns:
+        ---
+        The failure of each video that could not be written
+        """
+
+        with self._lock:
+            self.videos[video_id] = url
+            if transcript is not None:
+                self.transcripts.append(transcript)
+            if summary is not None:
+                self.summaries.append(summary)
+
+            due = time.monotonic() - self.last_write >= self.interval
+            if len(self.videos) >= self.batch_size or due:
+                return self._write()
+
+        return []
+
+    def flush(self) -> list[dict]:
+        """Writes the queued videos. Returns the failures, as `add`"""
+
+        with self._lock:
+            return self._write()
+
+    def _write(self) -> list[dict]:
+        videos = self.videos
+        transcripts, summaries = self.transcripts, self.summaries
+        self.videos, self.transcripts, self.summaries = {}, [], []
+        self.last_write = time.monotonic()
+
+        try:
+            repository.get_transcripts().upsert_many(transcripts)
+            if summaries:
+                save_summary(summaries)
+        except Exception as e:
+            return [
+                failure(video_id, url, "persist", e)
+                for video_id, url in videos.items()
+            ]
+
+        if self.on_saved is not None and videos:
+            self.on_saved(list(videos))
+
+        return []
+
+
+def build_pipeline(
+    channels: list,
+    videos: list,
+    LIMIT_TRANSCRIPT: int | float | None,
+    top_n: int,
+    sort_by: str,
+    on_progress: Callable[[dict], None] | None = None,
+    overrides: dict | None = None,
+    new_only: bool = False,
+    summarised: dict[str, dict] | None = None,
+    transcripts: dict[str, dict] | None = None,
+) -> tuple[list[tuple[str, str]], list[Stage], SummaryWriter]:
+    """Builds the stages that summarise videos: channel listing -> transcript
+    fetch -> summarise -> persist. While one video is being summarised the
+    next one's transcript is downloaded. `overrides` replaces some of the
+    model params for these videos. See `load_urls` for `new_only`.
+
+    A video that fails at any stage is passed on as a failure, so that the
+    other videos are still summarised. `summarised` and `transcripts` are
+    the summaries and stored transcripts of the videos, keyed by video id,
+    when they have been looked up for the whole batch, otherwise each video
+    is looked up on its own.
+
+    Returns:
+    ---
+    The (kind, url) sources to feed the pipeline, its stages, which output
+    lists of `summary` and `failed` events, and the writer to flush once
+    the pipeline ends
+    """
+
+    settings = config.PipelineSettings.load_settings()
+    writer = SummaryWriter(
+        settings.persist_batch_size,
+        settings.persist_interval_seconds,
+        commit_new if new_only else None,
+    )
+
+    seen = set()
+    lock = threading.Lock()
+
+    def list_videos(source: tuple[str, str]) -> list[dict]:
+        kind, url = source
+
+        try:
+            if kind == "channel" and new_only:
+                video_ids = crawl_channel(url, get_cursor_store(), "digest")
+                urls = [
+                    f"https://www.youtube.com/watch?v={v}" for v in video_ids
+                ]
+            elif kind == "channel":
+                urls = get_videos_from_channel(
+                    channel_url=url, top_n=top_n, sort_by=sort_by
+                )
+            else:
+                urls = [url]
+        except Exception as e:
+            return [{"url": url, "failed": failure(None, url, "list", e)}]
+
+        with lock:
+            urls = [u for u in dict.fromkeys(urls) if u not in seen]
+            seen.update(urls)
+
+        return [{"url": u, "video_id": get_video_id(u)} for u in urls]
+
+    def fetch_transcript(video: dict) -> dict:
+        if "failed" in video:
+            return video
+
+        video_id = video["video_id"]
+
+        try:
+            if summarised is None:
+                is_summarised, data = check_if_summarised(
+                    video_id, LIMIT_TRANSCRIPT, overrides
+                )
+            else:
+                data = summarised.get(video_id)
+                is_summarised = data is not None
+
+            if is_summarised:
+                logger.info(f"{video_id=}' has already been summarised")
+                return {**video, "summary": data, "is_new": False}
+
+            if transcripts is None:
+                doc = repository.get_transcripts().find_one(video_id)
+            else:
+                doc = transcripts.get(video_id)
+
+            if doc is None:
+                doc = download_transcript(video_id)
+                video = {**video, "downloaded": doc}
+
+        except Exception as e:
+            return {
+                **video,
+                "failed": failure(video_id, video["url"], "fetch", e),
+            }
+
+        return {**video, "transcript": doc}
+
+    def summarise(video: dict) -> dict:
+        if "failed" in video or "summary" in video:
+            return video
+
+        video_id = video["video_id"]
+
+        try:
+            data = summarise_video(
+                LIMIT_TRANSCRIPT,
+                video_id,
+                on_progress,
+                overrides,
+                video["transcript"],
+            )
+        except Exception as e:
+            return {
+                **video,
+                "failed": failure(video_id, video["url"], "summarise", e),
+            }
+
+        return {**video, "summary": data, "is_new": True}
+
+    def persist(video: dict) -> list[tuple[str, dict | list[dict]]]:
+        events = []
+
+        if "summary" in video:
+            data = video["summary"]
+            events.append(
+                ("summary", [{k: data.get(k) for k in config.video_keys}])
+            )
+
+        # a downloaded transcript is saved even if its video failed later
+        if "summary" in video or "downloaded" in video:
+            failed = writer.add(
+                video["url"],
+                video["video_id"],
+                video.get("downloaded"),
+                video["summary"] if video.get("is_new") else None,
+            )
+            events.extend(("failed", f) for f in failed)
+
+        if "failed" in video:
+            events.append(("failed", video["failed"]))
+
+        return events
+
+    sources = [("video", url) for url in videos]
+    sources.extend(("channel", url) for url in channels)
+
+    stages = [
+        Stage("list", list_videos, settings.list_workers, fan_out=True),
+        Stage("fetch", fetch_transcript, settings.fetch_workers),
+        Stage("summarise", summarise, settings.summarise_workers),
+        Stage(
+            "persist",
+            persist,
+            settings.persist_workers,
+            fan_out=True,
+            finish_on_error=True,
+        ),
+    ]
+
+    return sources, stages, writer
+
+
+def iter_summaries(
+    channels: list,
+    videos: list,
+    LIMIT_TRANSCRIPT: int | float | None,
+    top_n: int,
+    sort_by: str,
+    on_progress: Callable[[dict], None] | None = None,
+    overrides: dict | None = None,
+    new_only: bool = False,
+    summarised: dict[str, dict] | None = None,
+    transcripts: dict[str, dict] | None = None,
+) -> Iterator[tuple[str, dict | list[dict]]]:
+    """Summarises videos, yielding each video's summary as soon as it is
+    ready. See `main` and `build_pipeline` for the arguments.
+
+    Yields:
+    ---
+    ("summary", [summary]) for each video summarised, and ("failed",
+    failure) with the `video_id`, `url`, `stage` and `error` of each video
+    or channel that could not be summarised
+    """
+
+    sources, stages, writer = build_pipeline(
+        channels,
+        videos,
+        LIMIT_TRANSCRIPT,
+        top_n,
+        sort_by,
+        on_progress,
+        overrides,
+        new_only,
+        summarised,
+        transcripts,
+    )
+    queue_size = config.PipelineSettings.load_settings().queue_size
+
+    try:
+        for _, event in iter_pipeline(sources, stages, queue_size):
+            yield event
+    finally:
+        # also when the caller stops early, so the videos done are kept
+        failures = writer.flush()
+
+    for failed in failures:
+        yield "failed", failed
+
+
+def summarise_urls(
+    urls: list[str],
+    LIMIT_TRANSCRIPT: int | float | None,
+    on_progress: Callable[[dict], None] | None = None,
+    overrides: dict | None = None,
+    new_only: bool = False,
+) -> tuple[list[list[dict]], list[dict]]:
+    """Summarises a batch of videos with the pipeline of `iter_summaries`,
+    looking the videos up with one query for the summaries and one for the
+    stored transcripts instead of two per video. The results are written in
+    micro-batches (see `SummaryWriter`). `new_only` commits the videos once
+    they are saved, see `load_urls`.
+
+    Returns:
+    ---
+    The summary of each video, in the order of `urls` and in a list of its
+    own as with `iter_summaries`, and the failure of each video that could
+    not be summarised
+    """
+
+    urls = list(dict.fromkeys(urls))
+    video_ids = [get_video_id(url) for url in urls]
+
+    summarised = find_summarised(video_ids, LIMIT_TRANSCRIPT, overrides)
+    missing = [v for v in video_ids if v not in summarised]
+    logger.info(
+        f"{len(summarised)} videos have already been summarised, "
+        f"summarising {len(missing)}"
+    )
+
+    events = iter_summaries(
+        [],
+        urls,
+        LIMIT_TRANSCRIPT,
+        0,
+        "newest",
+        on_progress,
+        overrides,
+        new_only,
+        summarised,
+        repository.get_transcripts().find_many(missing),
+    )
+
+    msgs, failed = {}, {}
+    for event, data in events:
+        if event == "summary":
+            msgs[data[0]["video_id"]] = data
+        else:
+            failed[data["video_id"]] = data
+            msgs.pop(data["video_id"], None)
+
+    return (
+        [msgs[v] for v in dict.fromkeys(video_ids) if v in msgs],
+        [failed[v] for v in dict.fromkeys(video_ids) if v in failed],
+    )
+
+
 def main(
     channels: list,
     videos: list,
     LIMIT_TRANSCRIPT: int | float | None,
     top_n: int,
     sort_by: str,
+    overrides: dict | None = None,
+    new_only: bool = False,
 ):
     """
     Use one of the following values for `LIMIT_TRANSCRIPT_`
     None to process entire video transcript
     (0-1) for a proportion of the transcript
     >=1 for a hardcorded number of transcript lines
-    """
 
-    video_urls = {}
-    video_urls["channels"] = channels
-    video_urls["videos"] = videos
-    video_urls["top_n"] = top_n
+    `overrides` replaces some of the model params, e.g. {"CHUNK_TOKENS": 800}
 
-    yt_urls = load_urls(video_urls, sort_by=sort_by)
+    `new_only` only summarises the videos channels published since the last
+    such request
 
-    logger.info(f"Summarising {len(yt_urls)} videos")
+    The videos are summarised as one batch, see `summarise_urls` for the
+    summaries and failures returned
+    """
 
-    video_ids = []
-    for url in yt_urls:
-        vid = extract_main(url=url)
-        video_ids.append(vid)
+    video_urls = {"channels": channels, "videos": list(videos), "top_n": top_n}
+    urls = sorted(load_urls(video_urls, sort_by, new_only))
 
-    msgs = []
-    for video_id in video_ids:
-        msg = summarise_main(LIMIT_TRANSCRIPT, video_id)
-        msgs.append(msg)
+    # videos that fail are not committed, so the next request loads them
+    # again
+    msgs, failed = summarise_urls(
+        urls, LIMIT_TRANSCRIPT, overrides=overrides, new_only=new_only
+    )
+    logger.info(f"Summarised {len(msgs)} videos, {len(failed)} failed")
 
-    return msgs
+    return msgs, failed
 
 
 if __name__ == "__main__":
@@ -105,9 +534,9 @@ if __name__ == "__main__":
         "https://www.youtube.com/watch?v=TRjq7t2Ms5I",
     ]
 
-    msgs = main(
+    msgs, failed = main(
         channels, videos, LIMIT_TRANSCRIPT=0.25, top_n=2, sort_by="newest"
     )
-    for msg in msgs:
+    for msg in msgs + failed:
         pprint(msg)
         print("\n\n")
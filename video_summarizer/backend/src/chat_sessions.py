@@ -0,0 +1,273 @@
+"""Warm chat sessions used by the chat endpoint.
+
+A session holds everything needed to answer a question about a video: the
+vector store, the embeddings and the lexical index. It is shared by every
+client asking about the video, while each conversation keeps its own
+questions and answers. Both are kept in LRUs, so a follow-up question goes
+straight to retrieval and the LLM without reloading anything.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Callable, Iterator
+
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.src import chat_video
+from video_summarizer.backend.utils.utils import logger
+from video_summarizer.backend.utils.vectorstore import (
+    BaseVectorStore,
+    get_vector_store,
+)
+
+
+@lru_cache
+def get_chat_model():
+    """Returns the process-wide streaming chat model"""
+
+    from langchain.chat_models import ChatOpenAI
+
+    return ChatOpenAI(model=config.ModelParams.load().MODEL, streaming=True)
+
+
+class Conversation:
+    """The questions asked about a video by one client and their answers.
+
+    Args:
+    ---
+    history_turns: number of earlier questions and answers sent with a
+    question
+    """
+
+    def __init__(self, history_turns: int = 3):
+        self.history = deque(maxlen=history_turns)
+        # questions of a conversation are answered one at a time, so that
+        # each sees the answers before it
+        self.lock = threading.Lock()
+
+    def format_history(self) -> str:
+        return "\n".join(
+            f"user: {question}\nassistant: {answer}"
+            for question, answer in self.history
+        )
+
+    def reset(self) -> None:
+        """Forgets the questions and answers"""
+
+        with self.lock:
+            self.history.clear()
+
+
+class ChatSession:
+    """Answers questions about a video, streaming the answer.
+
+    The video is ingested when the session is created if it has not been
+    already.
+
+    Args:
+    ---
+    video_id: the video to chat with
+    store: the vector store holding the video's windows
+    embeddings: the embeddings used for the questions
+    llm: a chat model with a `stream` method
+    """
+
+    def __init__(
+        self,
+        video_id: str,
+        store: BaseVectorStore,
+        embeddings,
+        llm,
+    ):
+        self.video_id = video_id
+        self.store = store
+        self.embeddings = embeddings
+        self.llm = llm
+
+        self.lexical = chat_video.load_lexical_index(video_id)
+        if self.lexical is None:
+            chat_video.upsert_documents(store, video_id, embeddings)
+            self.lexical = chat_video.load_lexical_index(video_id)
+
+    def stream(
+        self, question: str, conversation: Conversation | None = None
+    ) -> Iterator[str]:
+        """Yields the answer to a question as it is generated.
+
+        Only the first question of a conversation is looked up in the answer
+        cache, since a follow-up may depend on what was said before it.
+        Without a conversation the question is answered on its own.
+        """
+
+        conversation = conversation or Conversation(history_turns=0)
+
+        with conversation.lock:
+            settings = config.ChatSettings.load_settings()
+            cache = chat_video.get_answer_cache()
+            start = time.perf_counter()
+
+            vector = chat_video.embed_query_lazily(self.embeddings, question)
+            first = not conversation.history
+
+            if first:
+                cached = cache.get(self.video_id, vector)
+
+                if cached is not None:
+                    logger.info(f"Answering {question=} from the answer cache")
+                    conversation.history.append((question, cached.answer))
+                    yield cached.answer
+                    return
+
+            matches = chat_video.retrieve(
+                question,
+                self.embeddings,
+                self.store,
+                self.video_id,
+                settings.top_k,
+                self.lexical,
+                settings.retrieval_mode,
+                vector,
+            )
+            prompt = config.chat_prompt.format(
+                history=conversation.format_history(),
+                context=chat_video.format_context(matches),
+                question=question,
+            )
+
+            parts = []
+            for chunk in self.llm.stream(prompt):
+                if not parts:
+                    logger.info(
+                        f"First token for {self.video_id=} after "
+                        f"{time.perf_counter() - start:.3f}s"
+                    )
+                parts.append(chunk.content)
+                yield chunk.content
+
+            answer = "".join(parts)
+            conversation.history.append((question, answer))
+
+            # the answer is already sent, so embedding the question for the
+            # cache does not delay it
+            if first:
+                cache.set(
+                    self.video_id,
+                    chat_video.normalise_text(question),
+                    vector(),
+                    [d["id"] for d in matches],
+                    answer,
+                )
+
+
+class ChatSessions:
+    """LRU of chat sessions, one per video, and of conversations, one per
+    client and video.
+
+    Args:
+    ---
+    create: creates the session of a video
+    max_sessions: number of sessions kept warm
+    history_turns: number of earlier questions and answers sent with a
+    question
+    max_conversations: number of conversations remembered
+    """
+
+    def __init__(
+        self,
+        create: Callable[[str], ChatSession],
+        max_sessions: int = 32,
+        history_turns: int = 3,
+        max_conversations: int = 1024,
+    ):
+        self.create = create
+        self.max_sessions = max_sessions
+        self.history_turns = history_turns
+        self.max_conversations = max_conversations
+        self.hits = 0
+        self.misses = 0
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._conversations: OrderedDict[tuple[str, str], Conversation] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, video_id: str) -> ChatSession:
+        """Returns the session of a video, creating it if needed"""
+
+        with self._lock:
+            session = self._sessions.get(video_id)
+            if session is not None:
+                self._sessions.move_to_end(video_id)
+                self.hits += 1
+                return session
+
+            self.misses += 1
+
+        # ingesting a video can take a while, so other videos' sessions are
+        # not blocked while it runs
+        session = self.create(video_id)
+
+        with self._lock:
+            session = self._sessions.setdefault(video_id, session)
+            self._sessions.move_to_end(video_id)
+
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.info(f"Closed the chat session of {evicted=}")
+
+        return session
+
+    def get_conversation(
+        self, conversation_id: str, video_id: str
+    ) -> Conversation:
+        """Returns a conversation about a video, starting it if needed"""
+
+        key = (conversation_id, video_id)
+
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                conversation = Conversation(self.history_turns)
+                self._conversations[key] = conversation
+
+            self._conversations.move_to_end(key)
+
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+
+        return conversation
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "conversations": len(self._conversations),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+@lru_cache
+def get_chat_sessions() -> ChatSessions:
+    """Returns the process-wide chat sessions"""
+
+    settings = config.ChatSettings.load_settings()
+
+    def create(video_id: str) -> ChatSession:
+        return ChatSession(
+            video_id,
+            get_vector_store(),
+            chat_video.get_embeddings(),
+            get_chat_model(),
+        )
+
+    return ChatSessions(
+        create,
+        settings.max_sessions,
+        settings.history_turns,
+        settings.max_conversations,
+    )
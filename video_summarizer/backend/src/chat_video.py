@@ -1,143 +1,505 @@
 """Module for chatting with a video via a RAG"""
 
-import os
-import time
-from uuid import uuid4
+from __future__ import annotations
 
-import pandas as pd
+import heapq
+import time
+import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
 from dotenv import load_dotenv
-from langchain.embeddings.openai import OpenAIEmbeddings
-from pinecone import Pinecone, PodSpec
-from pinecone.data.index import Index
-from tqdm.auto import tqdm
 
-from video_summarizer.backend.configs.config import augmented_prompt
-from video_summarizer.backend.src.summarize_video import init_model
-from video_summarizer.backend.utils.utils import get_mongodb_client, logger
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.src.extract_transcript import load_transcript
+from video_summarizer.backend.src.summarize_video import (
+    chunk_indices_by_tokens,
+    init_model,
+)
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.cache import (
+    BaseCache,
+    get_cache,
+    make_key,
+)
+from video_summarizer.backend.utils.concurrency import (
+    Stage,
+    iter_pipeline,
+    map_concurrently,
+)
+from video_summarizer.backend.utils.lexical import (
+    BM25Index,
+    reciprocal_rank_fusion,
+)
+from video_summarizer.backend.utils.semantic_cache import SemanticCache
+from video_summarizer.backend.utils.transcripts import parse_video_ts
+from video_summarizer.backend.utils.utils import logger
+from video_summarizer.backend.utils.vectorstore import (
+    BaseVectorStore,
+    get_vector_store,
+)
+
+if TYPE_CHECKING:
+    from langchain.embeddings.openai import OpenAIEmbeddings
 
 load_dotenv()
 
-PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
-PINECONE_ENVIRONMENT = os.environ.get("PINECONE_ENVIRONMENT")
 
-pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
+def normalise_text(text: str) -> str:
+    """Normalises unicode and whitespace so that the same caption is cached
+    once"""
 
+    return " ".join(unicodedata.normalize("NFKC", text).split())
 
-def get_create_pinecone_index(index_name: str):
-    """Retrieve an index from Pinecode vectorstore"""
 
-    available_idx = [i.get("name") for i in pc.list_indexes().get("indexes")]
+class CachedEmbeddings:
+    """Wraps an embedding model so that a text that has already been
+    embedded is read from a cache instead of the embedding API.
 
-    if index_name not in available_idx:
-        pc.create_index(
-            name=index_name,
-            dimension=1536,  # https://www.pinecone.io/learn/openai-embeddings-v3/
-            metric="cosine",
-            spec=PodSpec(environment="gcp-starter"),
-        )
+    Embeddings are stored as float32 bytes keyed by a hash of the model
+    name and the normalised text. Only the texts missing from the cache are
+    sent to the API.
+    """
 
-        while not pc.describe_index(index_name).status["ready"]:
-            time.sleep(1)
+    def __init__(self, embeddings, cache: BaseCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def _key(self, kind: str, text: str) -> str:
+        return make_key(self.model_name, kind, normalise_text(text))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key("document", text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # embed each missing text once, even if it is repeated
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            embeds = self.embeddings.embed_documents(list(missing.values()))
+            new = {
+                k: np.asarray(e, dtype=np.float32).tobytes()
+                for k, e in zip(missing, embeds)
+            }
+            self.cache.set_many(new)
+            found.update(new)
+
+        return [
+            np.frombuffer(found[k], dtype=np.float32).tolist() for k in keys
+        ]
 
-    # get the created index
-    index = pc.Index(index_name)
-    logger.info(f"Pinecone index stats:\n {index.describe_index_stats()}")
+    def embed_query(self, text: str) -> list[float]:
+        key = self._key("query", text)
 
-    return index
+        blob = self.cache.get(key)
+        if blob is None:
+            embed = self.embeddings.embed_query(text)
+            blob = np.asarray(embed, dtype=np.float32).tobytes()
+            self.cache.set(key, blob)
+
+        return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+@lru_cache
+def get_embeddings() -> CachedEmbeddings:
+    """Returns the process-wide cached OpenAI embeddings"""
+
+    from langchain.embeddings.openai import OpenAIEmbeddings
+
+    embeddings = OpenAIEmbeddings()
+    return CachedEmbeddings(
+        embeddings, get_cache("embeddings"), embeddings.model
+    )
+
+
+@lru_cache
+def get_answer_cache() -> SemanticCache:
+    """Returns the process-wide cache of the answers given about videos"""
+
+    settings = config.ChatSettings.load_settings()
+    return SemanticCache(
+        settings.answer_cache_threshold,
+        settings.answer_cache_ttl_seconds,
+        settings.answer_cache_max_entries,
+    )
 
 
 def get_document(video_id: str):
     """Get a document related to a video from Mongodb"""
 
-    client, db = get_mongodb_client()
-    db = client[db]
-    transcripts = db.transcripts
-    result = transcripts.find_one({"video_id": video_id})
-    return result
+    return repository.get_transcripts().find_one(video_id)
 
 
-def upsert_documents_to_pinecone(
-    idx: Index, video_id: str, index_name: str, embeddings: OpenAIEmbeddings
-):
-    """Inserts document to an index associated with a video id"""
+def window_indices_by_seconds(
+    starts: list[float], size: float, overlap: float = 0
+) -> list[list[int]]:
+    """Groups consecutive lines into windows spanning at most `size`
+    seconds, each starting `overlap` seconds before the previous one ends.
 
-    # check that the index for this video is not empty
-    stats = idx.describe_index_stats()
-    total_vector_count = stats.get("total_vector_count")
+    Args:
+    ---
+    starts: the start time of each line in seconds, in increasing order
+    size: length of a window in seconds
+    overlap: number of seconds shared by consecutive windows
 
-    if total_vector_count > 0:
-        logger.info(f"{index_name=} for is already populated")
-        return
+    Returns:
+    ---
+    The indices of the lines in each window
+    """
 
-    # convert transcript to dataframe
-    res = get_document(video_id)
-    transcript = res.get("transcript")
+    if overlap >= size:
+        raise ValueError(f"{overlap=} must be smaller than {size=}")
 
-    df = pd.DataFrame(transcript)
-    if df.isnull().values.any():
-        logger.error("df contains null values")
-        return
+    windows = []
+    first = 0
 
-    data = df[0].str.extract(r"\n(\d+:\d{2}:\d{2})\s-\s(.*)")
-    data.columns = ["timestamp", "text"]
+    while first < len(starts):
+        end = bisect_left(starts, starts[first] + size, lo=first + 1)
+        windows.append(list(range(first, end)))
 
-    # upload transcript to pinecone index
-    batch_size = 100
-    for i in tqdm(range(0, len(data), batch_size)):
-        i_end = min(len(data), i + batch_size)
-        batch = data.iloc[i:i_end]
+        if end == len(starts):
+            break
 
-        texts = [str(x["text"]) for _, x in batch.iterrows()]
-        ids = [uuid4().hex for _ in range(len(texts))]
+        # the next window starts with the lines in the last `overlap` secs
+        next_first = bisect_left(starts, starts[end] - overlap, lo=first)
+        first = max(first + 1, min(next_first, end))
 
-        embeds = embeddings.embed_documents(texts)
+    return windows
 
-        metadata = [
-            {"text": x["text"], "timestamp": str(x["timestamp"])}
-            for _, x in batch.iterrows()
-        ]
 
-        idx.upsert(vectors=zip(ids, embeds, metadata))
+def segment_transcript(
+    texts: list[str], starts: list[float], settings: config.ChatSettings
+) -> list[tuple[int, int]]:
+    """Merges adjacent transcript lines into overlapping windows, sized by
+    the window mode in the chat settings: `tokens`, `seconds` or `lines`
+    (one window per line).
 
-    logger.info(f"Successfully added content to {index_name=}")
+    Returns:
+    ---
+    The (first, last) line index of each window
+    """
 
+    if settings.window_mode == "lines":
+        indices = [[i] for i in range(len(texts))]
 
-def query_vectorstore(
+    elif settings.window_mode == "tokens":
+        indices = chunk_indices_by_tokens(
+            texts, int(settings.window_size), int(settings.window_overlap)
+        )
+
+    elif settings.window_mode == "seconds":
+        indices = window_indices_by_seconds(
+            starts, settings.window_size, settings.window_overlap
+        )
+
+    else:
+        raise ValueError(f"Unknown {settings.window_mode=}")
+
+    return [(window[0], window[-1]) for window in indices]
+
+
+def get_vector_id(video_id: str, first: int, last: int) -> str:
+    """Returns the id of the vector of a window of transcript lines"""
+
+    return f"{video_id}-{first}-{last}"
+
+
+def get_lexical_path(video_id: str) -> Path:
+    settings = config.ChatSettings.load_settings()
+    return config.ROOT_DIR / settings.lexical_path / f"{video_id}.npz"
+
+
+def load_lexical_index(video_id: str) -> BM25Index | None:
+    """Loads the lexical index of a video, if it has been ingested"""
+
+    path = get_lexical_path(video_id)
+    return BM25Index.load(path) if path.exists() else None
+
+
+def save_lexical_index(
+    video_id: str, ids: list[str], texts: list[str], metadata: list[dict]
+) -> BM25Index:
+    """Builds the lexical index of a video unless it is up to date"""
+
+    index = load_lexical_index(video_id)
+
+    if index is None or index.ids != ids:
+        index = BM25Index.build(ids, texts, metadata)
+        index.save(get_lexical_path(video_id))
+        logger.info(f"Built lexical index of {len(ids)} windows {video_id=}")
+
+    return index
+
+
+def upsert_documents(
+    store: BaseVectorStore,
+    video_id: str,
+    embeddings: CachedEmbeddings | OpenAIEmbeddings,
+) -> int:
+    """Inserts the transcript of a video into the vector store.
+
+    Adjacent lines are merged into windows (see `segment_transcript`).
+    Batches of windows are embedded concurrently while earlier batches are
+    written to the store. Each vector's id is derived from the video id and
+    the lines in its window, so rerunning after a failure only embeds and
+    writes the windows that are missing.
+
+    Returns:
+    ---
+    The number of windows written
+    """
+
+    from tqdm.auto import tqdm
+
+    settings = config.ChatSettings.load_settings()
+
+    transcript = load_transcript(get_document(video_id))
+    lines = transcript.texts
+    timestamps = transcript.timestamps
+
+    spans = segment_transcript(lines, transcript.starts.tolist(), settings)
+    texts = [" ".join(lines[a : b + 1]) for a, b in spans]
+    metadata = [
+        {
+            "text": text,
+            "timestamp": timestamps[a],
+            "end_timestamp": timestamps[b],
+        }
+        for text, (a, b) in zip(texts, spans)
+    ]
+    ids = [get_vector_id(video_id, a, b) for a, b in spans]
+
+    existing = store.existing_ids(video_id, ids)
+
+    # vectors of an earlier segmentation of the video are replaced
+    stale = store.count(video_id) - len(existing)
+    if stale > 0:
+        logger.info(f"Replacing {stale} vectors of {video_id=}")
+        store.delete(video_id)
+        existing = set()
+
+    if len(existing) == len(ids):
+        logger.info(f"{video_id=} is already populated")
+        save_lexical_index(video_id, ids, texts, metadata)
+        return 0
+
+    # answers given from the previous vectors may no longer hold
+    get_answer_cache().invalidate(video_id)
+
+    missing = [i for i, id_ in enumerate(ids) if id_ not in existing]
+
+    size = settings.embed_batch_size
+    batches = [missing[i : i + size] for i in range(0, len(missing), size)]
+
+    def embed(batch: list[int]) -> tuple[list[int], list[list[float]]]:
+        return batch, embeddings.embed_documents([texts[i] for i in batch])
+
+    def upsert(embedded: tuple[list[int], list[list[float]]]) -> int:
+        batch, embeds = embedded
+        store.upsert(
+            video_id,
+            [ids[i] for i in batch],
+            embeds,
+            [metadata[i] for i in batch],
+        )
+        return len(batch)
+
+    stages = [
+        Stage("embed", embed, settings.embed_workers),
+        # batches that were embedded before a failure are still saved
+        Stage("upsert", upsert, settings.upsert_workers, finish_on_error=True),
+    ]
+
+    start = time.perf_counter()
+    written = 0
+
+    with tqdm(total=len(missing)) as progress:
+        for _, count in iter_pipeline(batches, stages):
+            written += count
+            progress.update(count)
+
+    elapsed = time.perf_counter() - start
+    lines_written = sum(spans[i][1] - spans[i][0] + 1 for i in missing)
+    logger.info(
+        f"Added {written} windows ({lines_written} lines) for {video_id=} in "
+        f"{elapsed:.2f}s ({lines_written / max(elapsed, 1e-9):.1f} lines/s), "
+        f"{len(existing)} windows were already stored"
+    )
+
+    if isinstance(embeddings, CachedEmbeddings):
+        logger.info(f"Embedding cache stats: {embeddings.cache.get_stats()}")
+
+    # the lexical index is only written once every vector is stored, so it
+    # also marks the video as ingested
+    save_lexical_index(video_id, ids, texts, metadata)
+
+    return written
+
+
+def embed_query_lazily(
+    embeddings: CachedEmbeddings | OpenAIEmbeddings, query: str
+) -> Callable[[], list[float]]:
+    """Returns a function that embeds the query on its first call and
+    returns the same vector on later calls, so that a question answered
+    from the lexical index is not sent to the embedding API"""
+
+    return lru_cache(maxsize=None)(lambda: embeddings.embed_query(query))
+
+
+def format_timestamps(metadata: dict) -> str:
+    """Formats the start and, for a window of lines, end timestamps"""
+
+    start = metadata["timestamp"]
+    end = metadata.get("end_timestamp", start)
+
+    return start if end == start else f"{start} to {end}"
+
+
+def retrieve(
     query: str,
-    embeddings: OpenAIEmbeddings,
-    index: Index,
+    embeddings: CachedEmbeddings | OpenAIEmbeddings,
+    store: BaseVectorStore,
+    video_id: str,
     k: int = 5,
-    include_timestamp: bool = False,
-) -> str:
+    lexical: BM25Index | None = None,
+    mode: str = "vector",
+    vector: Callable[[], list[float]] | None = None,
+) -> list[dict]:
+    """Returns the `k` transcript windows that best match a query.
 
-    vector = embeddings.embed_query(query)
+    The query is only embedded when the mode needs it, with `vector` if
+    given (see `embed_query_lazily`).
 
-    query_res = index.query(
-        vector=vector, top_k=k, include_metadata=True, include_values=False
+    Modes:
+    ---
+    * vector: nearest neighbours of the query's embedding
+    * lexical: BM25 matches from the lexical index, without network calls
+    * hybrid: vector and lexical rankings fused with reciprocal rank fusion.
+    When the best lexical match covers enough of the query (see
+    `lexical_threshold` in the chat settings) it is answered from the
+    lexical index alone
+    """
+
+    vector = vector or embed_query_lazily(embeddings, query)
+
+    if lexical is None or mode == "vector":
+        return store.query(video_id, vector(), top_k=k)
+
+    settings = config.ChatSettings.load_settings()
+    candidates = max(k, settings.fusion_candidates)
+
+    lexical_matches = lexical.search(query, top_k=candidates)
+
+    if mode == "lexical":
+        return lexical_matches[:k]
+
+    if mode != "hybrid":
+        raise ValueError(f"Unknown retrieval {mode=}")
+
+    if (
+        lexical_matches
+        and lexical_matches[0]["coverage"] >= settings.lexical_threshold
+    ):
+        logger.info(f"Answering {query=} from the lexical index")
+        return lexical_matches[:k]
+
+    vector_matches = store.query(video_id, vector(), top_k=candidates)
+
+    return reciprocal_rank_fusion(
+        [lexical_matches, vector_matches], top_k=k, k=settings.rrf_k
     )
 
-    logger.info(f"{query=}")
-    logger.info(f"{query_res=}")
 
-    context = [
-        f'{d["metadata"]["text"]} - {d["metadata"]["timestamp"]}'
-        for d in query_res.get("matches")
-    ]
+def format_context(
+    matches: list[dict], include_timestamp: bool = False
+) -> str:
+    """Joins the text of the matched transcript windows"""
 
     if include_timestamp is False:
+        context = [f'{d["metadata"]["text"]}' for d in matches]
+    else:
         context = [
-            f'{d["metadata"]["text"]}' for d in query_res.get("matches")
+            f'{d["metadata"]["text"]} - {format_timestamps(d["metadata"])}'
+            for d in matches
         ]
 
     return "\n".join(context)
 
 
+def query_vectorstore(
+    query: str,
+    embeddings: CachedEmbeddings | OpenAIEmbeddings,
+    store: BaseVectorStore,
+    video_id: str,
+    k: int = 5,
+    include_timestamp: bool = False,
+    lexical: BM25Index | None = None,
+    mode: str = "vector",
+) -> str:
+
+    matches = retrieve(query, embeddings, store, video_id, k, lexical, mode)
+
+    logger.info(f"{query=}")
+    logger.info(f"{matches=}")
+
+    return format_context(matches, include_timestamp)
+
+
+def get_matches(
+    query: str,
+    video_id: str,
+    delete_index=False,
+    embeddings=None,
+    k=None,
+    store: BaseVectorStore | None = None,
+    mode: str | None = None,
+    vector: Callable[[], list[float]] | None = None,
+) -> list[dict]:
+    """Given a video id and a query, retrieves the transcript windows that
+    match the query, ingesting the video first if needed. The arguments are
+    those of `get_context` and `retrieve`"""
+
+    settings = config.ChatSettings.load_settings()
+    k = k or settings.top_k
+    mode = mode or settings.retrieval_mode
+    embeddings = embeddings or get_embeddings()
+    store = store or get_vector_store()
+
+    # a video with a lexical index has already been ingested
+    lexical = None if delete_index else load_lexical_index(video_id)
+
+    if lexical is None:
+        # delete the stored vectors
+        if delete_index:
+            store.delete(video_id)
+            get_answer_cache().invalidate(video_id)
+
+        # insert content to vectorstore
+        upsert_documents(store=store, video_id=video_id, embeddings=embeddings)
+        lexical = load_lexical_index(video_id)
+
+    matches = retrieve(
+        query, embeddings, store, video_id, k, lexical, mode, vector
+    )
+
+    logger.info(f"{query=}")
+    logger.info(f"{matches=}")
+
+    return matches
+
+
 def get_context(
     query: str,
     video_id: str,
     delete_index=False,
-    embeddings=OpenAIEmbeddings(),
-    k=15,
+    embeddings=None,
+    k=None,
+    store: BaseVectorStore | None = None,
+    mode: str | None = None,
 ):
     """Given a video id and a query, retrieves the vectors that match the query.
 
@@ -145,58 +507,197 @@ def get_context(
     ---
     query: A user provided query or question
     video_id: The video id to query from
-    delete_index: Whether to replace the current index with that of a new video id
-    embeddings: The vector embeddings to use
-    k: The number of lines of a transcript to use. The higher the number, the richer the context
+    delete_index: Whether to replace the stored vectors of the video
+    embeddings: The vector embeddings to use, defaults to the cached OpenAI embeddings
+    k: The number of transcript windows to use, defaults to `top_k` in the chat settings. The higher the number, the richer the context
+    store: The vector store to use, defaults to the configured backend
+    mode: The retrieval mode (vector, lexical or hybrid), defaults to `retrieval_mode` in the chat settings
 
     Returns:
     ---
     Lines from the transctipt that closest match the query
     """
 
-    index_name = video_id.lower()
+    matches = get_matches(
+        query, video_id, delete_index, embeddings, k, store, mode
+    )
 
-    # delete the index
-    if delete_index:
-        try:
-            pc.delete_index(index_name)
-            logger.info(f"Successfully deleted {index_name=}")
-        except:
-            logger.info(f"{index_name=} already deleted")
+    return format_context(matches)
 
-    # create an index
-    index = get_create_pinecone_index(index_name=index_name)
 
-    # insert content to vectorstore
-    upsert_documents_to_pinecone(
-        idx=index,
-        video_id=video_id,
-        index_name=index_name,
-        embeddings=embeddings,
+def ensure_ingested(
+    store: BaseVectorStore,
+    video_id: str,
+    embeddings: CachedEmbeddings | OpenAIEmbeddings,
+) -> None:
+    """Ingests a video unless its lexical index shows it already is"""
+
+    if not get_lexical_path(video_id).exists():
+        upsert_documents(store=store, video_id=video_id, embeddings=embeddings)
+
+
+def retrieve_many(
+    query: str,
+    video_ids: list[str],
+    k: int | None = None,
+    embeddings=None,
+    store: BaseVectorStore | None = None,
+) -> list[dict]:
+    """Returns the `k` transcript windows that best match a query across
+    many videos.
+
+    The query is embedded once, then each video is queried for its own top
+    `k` concurrently (ingesting the videos that are not stored yet). The
+    per-video rankings are merged with a heap, by cosine similarity, which
+    unlike BM25 or fused scores can be compared between videos.
+
+    Returns:
+    ---
+    The matches, best first, each with the `video_id` it belongs to
+    """
+
+    settings = config.ChatSettings.load_settings()
+    k = k or settings.top_k
+    embeddings = embeddings or get_embeddings()
+    store = store or get_vector_store()
+
+    video_ids = list(dict.fromkeys(video_ids))
+    vector = embeddings.embed_query(query)
+
+    def search(video_id: str) -> list[dict]:
+        ensure_ingested(store, video_id, embeddings)
+        return [
+            {**match, "video_id": video_id}
+            for match in store.query(video_id, vector, top_k=k)
+        ]
+
+    start = time.perf_counter()
+    rankings = map_concurrently(
+        search,
+        video_ids,
+        max_workers=settings.search_workers,
+        show_progress=False,
+    )
+
+    merged = heapq.merge(*rankings, key=lambda match: -match["score"])
+    matches = list(islice(merged, k))
+
+    logger.info(
+        f"Searched {len(video_ids)} videos for {query=} in "
+        f"{time.perf_counter() - start:.2f}s"
     )
 
-    # use RAG ("text" is from the metadata)
-    # vectorstore = PineconeVectorStore(
-    #     index=index, embedding=embeddings, text_key="text"
-    # )
-    # query_res = vectorstore.similarity_search({"query": query, "k": 3})
-    # query_res = vectorstore.similarity_search(query=query)
+    return matches
+
+
+def get_source(match: dict) -> dict:
+    """Returns the video, timestamps and link of a match"""
+
+    metadata = match["metadata"]
+    seconds = parse_video_ts(metadata["timestamp"])
+
+    return {
+        "video_id": match["video_id"],
+        "timestamp": format_timestamps(metadata),
+        "url": (
+            f"https://www.youtube.com/watch?v={match['video_id']}&t={seconds}s"
+        ),
+        "score": match["score"],
+    }
+
+
+def format_sourced_context(matches: list[dict]) -> str:
+    """Joins the text of windows from many videos, each prefixed with the
+    video and timestamps it comes from"""
+
+    return "\n".join(
+        f'[{d["video_id"]} {format_timestamps(d["metadata"])}] '
+        f'{d["metadata"]["text"]}'
+        for d in matches
+    )
+
+
+def ask_videos(
+    query: str,
+    video_ids: list[str],
+    k: int | None = None,
+    embeddings=None,
+    store: BaseVectorStore | None = None,
+    model=None,
+) -> dict:
+    """Answers a question using the transcripts of many videos.
+
+    Returns:
+    ---
+    The answer and the source of each window in its context
+    """
+
+    matches = retrieve_many(query, video_ids, k, embeddings, store)
+    context = format_sourced_context(matches)
 
-    return query_vectorstore(query, embeddings=embeddings, index=index, k=k)
+    logger.info(f"{context=}")
 
+    model = model or init_model(template=config.augmented_prompt)
+    res = model.predict(question=query, context=context)
+
+    return {"answer": res, "sources": [get_source(d) for d in matches]}
+
+
+def main(
+    query: str,
+    video_id: str,
+    delete_index: bool = False,
+    embeddings=None,
+    store: BaseVectorStore | None = None,
+    model=None,
+):
+    """Answers a question about a video. An answer already given to a
+    similar question about the same video is returned from the answer cache
+    without retrieving a context or calling the LLM"""
+
+    embeddings = embeddings or get_embeddings()
+    cache = get_answer_cache()
+
+    # the question is only embedded if the answer cache or the retrieval
+    # needs it
+    vector = embed_query_lazily(embeddings, query)
+    cached = None if delete_index else cache.get(video_id, vector)
+
+    if cached is not None:
+        logger.info(
+            f"Answering {query=} with the answer to {cached.question=}, "
+            f"answer cache stats: {cache.get_stats()}"
+        )
+        return cached.answer
 
-def main(query: str, video_id: str, delete_index: bool = False):
-    context = get_context(query, video_id=video_id, delete_index=delete_index)
+    matches = get_matches(
+        query,
+        video_id=video_id,
+        delete_index=delete_index,
+        embeddings=embeddings,
+        store=store,
+        vector=vector,
+    )
+    context = format_context(matches)
 
     logger.info(f"{context=}")
 
-    model = init_model(template=augmented_prompt)
+    model = model or init_model(template=config.augmented_prompt)
 
     logger.info("Connecting to ChatGPT...")
     res = model.predict(question=query, context=context)
 
     logger.info(res)
 
+    cache.set(
+        video_id,
+        normalise_text(query),
+        vector(),
+        [d["id"] for d in matches],
+        res,
+    )
+    logger.info(f"Answer cache stats: {cache.get_stats()}")
+
     return res
 
 
@@ -209,9 +710,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--video_id", help="The video id to chat with", required=True
     )
+    parser.add_argument(
+        "--query",
+        help="The question to ask",
+        default="What is a vector store?",
+    )
     parser.add_argument(
         "--delete_index",
-        help="Delete the Pinecone index",
+        help="Delete the stored vectors of the video",
         action="store_true",
         default=False,
     )
@@ -220,6 +726,7 @@ if __name__ == "__main__":
 
     logger.info(args)
 
-    QUERY = "What is a vector store?"
-    res = main(QUERY, video_id=args.video_id, delete_index=args.delete_index)
+    res = main(
+        args.query, video_id=args.video_id, delete_index=args.delete_index
+    )
     print(res)
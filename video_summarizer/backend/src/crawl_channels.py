@@ -0,0 +1,262 @@
+"""Finds the videos a YouTube channel has published since it was last
+crawled.
+
+Each channel has a cursor holding the ids of the newest videos seen by the
+last crawl. A crawl walks the channel newest first and stops at the first
+video it has already seen, so it only requests the pages with new uploads.
+Cursors are kept per consumer (e.g. the scheduled digests and the
+transcript prefetcher), so one consumer's crawl does not hide new videos
+from another.
+
+The videos a crawl finds stay pending, and are returned again by later
+crawls, until the consumer commits them once it has processed them.
+"""
+
+import copy
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Callable, Iterable
+
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.concurrency import map_concurrently
+from video_summarizer.backend.utils.utils import logger
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def list_channel_videos(channel_url: str) -> Iterable[dict]:
+    """Lists the videos of a channel, newest first. Pages are requested as
+    the videos are iterated"""
+
+    from scrapetube import get_channel
+
+    return get_channel(channel_url=channel_url, sort_by="newest")
+
+
+def get_cursor_id(channel_url: str, consumer: str) -> str:
+    return f"{consumer}|{channel_url}"
+
+
+class MongoCursorStore:
+    """Stores crawl cursors in a MongoDB collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, cursor_id: str) -> dict | None:
+        return self.collection.find_one({"_id": cursor_id})
+
+    def save(self, cursor: dict) -> None:
+        self.collection.replace_one(
+            {"_id": cursor["_id"]}, cursor, upsert=True
+        )
+
+    def commit(self, consumer: str, video_ids: list[str]) -> None:
+        self.collection.update_many(
+            {"consumer": consumer},
+            {"$pull": {"pending_ids": {"$in": list(video_ids)}}},
+        )
+
+
+class MemoryCursorStore:
+    """Stores crawl cursors in memory"""
+
+    def __init__(self):
+        self.cursors: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, cursor_id: str) -> dict | None:
+        with self._lock:
+            return copy.deepcopy(self.cursors.get(cursor_id))
+
+    def save(self, cursor: dict) -> None:
+        with self._lock:
+            self.cursors[cursor["_id"]] = copy.deepcopy(cursor)
+
+    def commit(self, consumer: str, video_ids: list[str]) -> None:
+        video_ids = set(video_ids)
+
+        with self._lock:
+            for cursor in self.cursors.values():
+                if cursor["consumer"] == consumer:
+                    cursor["pending_ids"] = [
+                        v for v in cursor["pending_ids"] if v not in video_ids
+                    ]
+
+
+@lru_cache
+def get_cursor_store() -> MongoCursorStore:
+    return MongoCursorStore(repository.get_database().crawl_cursors)
+
+
+def crawl_channel(
+    channel_url: str,
+    store: MongoCursorStore | MemoryCursorStore,
+    consumer: str = "default",
+    list_videos: Callable[[str], Iterable[dict]] = list_channel_videos,
+    settings: config.CrawlSettings | None = None,
+) -> list[str]:
+    """Returns the ids of the videos a channel published since the last
+    crawl by `consumer`, newest first, and moves the cursor past them.
+
+    The first crawl of a channel returns its `max_videos` newest videos.
+    Later crawls stop at the first video already seen. The ids of the
+    `keep_seen` newest videos are kept in the cursor, so that the crawl
+    still stops if the newest one is deleted.
+
+    The ids returned stay pending, and are returned again after the new
+    ones, until they are committed with `store.commit(consumer, ids)`.
+    At most `max_videos` ids are returned, the oldest pending ones are
+    dropped.
+    """
+
+    settings = settings or config.CrawlSettings.load_settings()
+
+    cursor_id = get_cursor_id(channel_url, consumer)
+    cursor = store.get(cursor_id) or {"seen_ids": [], "pending_ids": []}
+    seen = set(cursor["seen_ids"])
+
+    new_ids = []
+    for video in list_videos(channel_url):
+        video_id = video["videoId"]
+        if video_id in seen or len(new_ids) == settings.max_videos:
+            break
+        new_ids.append(video_id)
+
+    seen_ids = new_ids + cursor["seen_ids"]
+    pending_ids = list(dict.fromkeys(new_ids + cursor.get("pending_ids", [])))
+
+    dropped = pending_ids[settings.max_videos :]
+    if dropped:
+        logger.warning(
+            f"Dropping {len(dropped)} uncommitted videos of {channel_url=}"
+        )
+    pending_ids = pending_ids[: settings.max_videos]
+
+    store.save(
+        {
+            "_id": cursor_id,
+            "channel_url": channel_url,
+            "consumer": consumer,
+            "seen_ids": seen_ids[: settings.keep_seen],
+            "pending_ids": pending_ids,
+            "crawled_at": now(),
+        }
+    )
+
+    logger.info(
+        f"Found {len(new_ids)} new videos on {channel_url=}, "
+        f"{len(pending_ids) - len(new_ids)} still pending"
+    )
+    return pending_ids
+
+
+def crawl_channels(
+    channels: list[str],
+    store: MongoCursorStore | MemoryCursorStore,
+    consumer: str = "default",
+    list_videos: Callable[[str], Iterable[dict]] = list_channel_videos,
+    settings: config.CrawlSettings | None = None,
+) -> dict[str, list[str]]:
+    """Crawls many channels concurrently. A channel that fails to crawl is
+    logged and returns no videos, leaving its cursor where it was.
+
+    Returns:
+    ---
+    The urls of the new and still pending videos of each channel
+    """
+
+    settings = settings or config.CrawlSettings.load_settings()
+
+    def crawl(channel_url: str) -> list[str]:
+        try:
+            video_ids = crawl_channel(
+                channel_url, store, consumer, list_videos, settings
+            )
+        except Exception as e:
+            logger.error(f"Could not crawl {channel_url=}: {e!r}")
+            return []
+
+        return [f"https://www.youtube.com/watch?v={v}" for v in video_ids]
+
+    urls = map_concurrently(
+        crawl, channels, max_workers=settings.workers, show_progress=False
+    )
+    return dict(zip(channels, urls))
+
+
+class TranscriptPrefetcher:
+    """Periodically crawls channels in a background thread and downloads the
+    transcripts of their new uploads, so that they are ready before anyone
+    asks for them.
+
+    Args:
+    ---
+    channels: the channels to watch
+    store: where the crawl cursors are kept
+    ingest: downloads and stores the transcripts of video urls
+    interval: number of seconds between crawls
+    """
+
+    consumer = "prefetch"
+
+    def __init__(
+        self,
+        channels: list[str],
+        store: MongoCursorStore | MemoryCursorStore,
+        ingest: Callable[[list[str]], list[dict]],
+        interval: float = 3600,
+        list_videos: Callable[[str], Iterable[dict]] = list_channel_videos,
+    ):
+        self.channels = channels
+        self.store = store
+        self.ingest = ingest
+        self.interval = interval
+        self.list_videos = list_videos
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> list[dict]:
+        """Crawls the channels and downloads the new transcripts. Returns
+        the ingestion report of each new video. Videos that fail to download
+        are tried again by the next crawl"""
+
+        new = crawl_channels(
+            self.channels, self.store, self.consumer, self.list_videos
+        )
+        urls = [url for urls in new.values() for url in urls]
+        if not urls:
+            return []
+
+        reports = self.ingest(urls)
+        self.store.commit(
+            self.consumer,
+            [r["video_id"] for r in reports if r["status"] != "failed"],
+        )
+
+        return reports
+
+    def _run(self) -> None:
+        # crawls once on start, then every `interval` seconds until stopped
+        while True:
+            try:
+                reports = self.run_once()
+                logger.info(f"Prefetched {len(reports)} transcripts")
+            except Exception as e:
+                logger.exception(e)
+
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -1,12 +1,33 @@
 """Extract transcript from a YouTube video"""
 
 import json
-import urllib.parse
-import urllib.request
-
-from youtube_transcript_api import YouTubeTranscriptApi
-
-from video_summarizer.backend.utils.utils import get_mongodb_client, logger
+import time
+import urllib.error
+from functools import lru_cache
+from typing import Callable
+
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.cache import (
+    BaseCache,
+    get_cache,
+    make_key,
+)
+from video_summarizer.backend.utils.concurrency import (
+    call_with_retries,
+    map_concurrently,
+)
+from video_summarizer.backend.utils.transcripts import Transcript
+from video_summarizer.backend.utils.utils import logger
+
+OEMBED_URL = "https://www.youtube.com/oembed"
+METADATA_KEYS = ["video_title", "channel_name", "channel_url", "thumbnail_url"]
+DEFAULT_METADATA = {
+    "video_title": "Unknown Video Title",
+    "channel_name": None,
+    "channel_url": None,
+    "thumbnail_url": None,
+}
 
 
 def get_video_id(url: str) -> str:
@@ -15,84 +36,324 @@ def get_video_id(url: str) -> str:
     return url.split("?v=", 1)[-1]
 
 
-def get_video_transcript(video_id: str) -> list[str]:
-    """Extract video transcript and save as text file"""
-
-    yt = YouTubeTranscriptApi()
-    transcript = yt.get_transcript(video_id)
-
-    tr = []
-    for i in transcript:
-        t = i.get("text")
-        s = i.get("start")
-        ts = convert_video_ts(s)
-        tr.append(f"\n{ts} - {t}")
-
-    return tr
-
-
-def get_video_title(video_url: str) -> str:
-    """Get the title of a YouTube video"""
+def get_video_transcript(
+    video_id: str, timeout: float | None = None
+) -> list[dict]:
+    """Downloads the English transcript of a video, as segments with a
+    `text`, `start` and `duration`. `timeout` applies to each request made
+    to YouTube"""
+
+    import requests
+    from youtube_transcript_api import YouTubeTranscriptApi
+
+    try:
+        # private, see the version pinned in pyproject.toml
+        from youtube_transcript_api._transcripts import TranscriptListFetcher
+    except ImportError:
+        logger.warning(
+            "youtube_transcript_api has no TranscriptListFetcher, "
+            f"downloading {video_id=} without a timeout"
+        )
+        return YouTubeTranscriptApi.get_transcript(video_id, ("en",))
+
+    class Session(requests.Session):
+        def request(self, *args, **kwargs):
+            kwargs.setdefault("timeout", timeout)
+            return super().request(*args, **kwargs)
+
+    # `YouTubeTranscriptApi.get_transcript` without its fixed http client,
+    # which has no timeout
+    with Session() as http_client:
+        transcripts = TranscriptListFetcher(http_client).fetch(video_id)
+        return transcripts.find_transcript(("en",)).fetch()
+
+
+@lru_cache
+def get_http_session():
+    """Returns the process-wide HTTP session, so that requests to YouTube
+    reuse open connections instead of connecting each time"""
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    settings = config.IngestSettings.load_settings()
+    adapter = HTTPAdapter(pool_maxsize=settings.workers)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_video_metadata(
+    video_url: str, timeout: float | None = None, base_url: str = OEMBED_URL
+) -> dict:
+    """Requests the title, channel and thumbnail of a YouTube video from
+    its oEmbed endpoint"""
+
+    response = get_http_session().get(
+        base_url,
+        params={"format": "json", "url": video_url},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    data = response.json()
+
+    return {
+        "video_title": data.get("title", DEFAULT_METADATA["video_title"]),
+        "channel_name": data.get("author_name"),
+        "channel_url": data.get("author_url"),
+        "thumbnail_url": data.get("thumbnail_url"),
+    }
 
-    params = {"format": "json", "url": video_url}
-    base_url = "https://www.youtube.com/oembed"
-    query_str = urllib.parse.urlencode(params)
-    url = base_url + "?" + query_str
 
-    with urllib.request.urlopen(url) as response:
-        resp_txt = response.read()
-        data = json.loads(resp_txt.decode())
+def with_retries(fetch: Callable, settings: config.IngestSettings) -> Callable:
+    """Wraps a download so that each request times out after
+    `timeout_seconds` and transient failures are retried with exponential
+    backoff"""
+
+    def call(*args):
+        return call_with_retries(
+            lambda: fetch(*args, timeout=settings.timeout_seconds),
+            attempts=settings.attempts,
+            backoff=settings.backoff_seconds,
+            max_backoff=settings.max_backoff_seconds,
+            should_retry=is_transient,
+        )
+
+    return call
+
+
+def get_video_metadata(
+    video_url: str,
+    fetch: Callable[..., dict] = fetch_video_metadata,
+    cache: BaseCache | None = None,
+    settings: config.IngestSettings | None = None,
+) -> dict:
+    """Returns the title, channel and thumbnail of a video. Only the first
+    lookup of a video makes a request, later ones are read from the cache"""
+
+    settings = settings or config.IngestSettings.load_settings()
+    if cache is None:
+        cache = get_cache("video_metadata")
+
+    key = make_key(get_video_id(video_url))
+    cached = cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    metadata = with_retries(fetch, settings)(video_url)
+    cache.set(key, json.dumps(metadata))
+
+    return metadata
+
+
+def get_videos_metadata(
+    video_urls: list[str],
+    fetch: Callable[..., dict] = fetch_video_metadata,
+    cache: BaseCache | None = None,
+    settings: config.IngestSettings | None = None,
+) -> dict[str, dict]:
+    """Returns the metadata of many videos, keyed by url.
+
+    The cached videos are read with a single lookup and the others are
+    requested concurrently by `workers` threads (see the ingest settings).
+    A video whose metadata cannot be fetched is logged and left out.
+    """
+
+    settings = settings or config.IngestSettings.load_settings()
+    if cache is None:
+        cache = get_cache("video_metadata")
+
+    keys = {url: make_key(get_video_id(url)) for url in video_urls}
+    cached = cache.get_many(list(keys.values()))
+    metadata = {
+        url: json.loads(cached[key])
+        for url, key in keys.items()
+        if key in cached
+    }
 
-    return data.get("title", "Unknown Video Title")
+    def request(video_url: str) -> dict | None:
+        try:
+            return with_retries(fetch, settings)(video_url)
+        except Exception as e:
+            logger.error(
+                f"Could not fetch the metadata of {video_url=}: {e!r}"
+            )
+            return None
+
+    missing = [url for url in keys if url not in metadata]
+    results = map_concurrently(
+        request, missing, max_workers=settings.workers, show_progress=False
+    )
+    fetched = {url: m for url, m in zip(missing, results) if m is not None}
 
+    cache.set_many({keys[url]: json.dumps(m) for url, m in fetched.items()})
+    metadata.update(fetched)
 
-def save_trancript(transcript: list[str], video_id: str) -> None:
-    """Saves a transcript to the database"""
+    return metadata
 
-    video_url = f"https://www.youtube.com/watch?v={video_id}"
-    video_title = get_video_title(video_url)
 
-    data = {
+def make_transcript_doc(
+    transcript: Transcript,
+    video_id: str,
+    metadata: dict,
+    compression: str = "zlib",
+) -> dict:
+    return {
         "video_id": video_id,
-        "video_url": video_url,
-        "video_title": video_title,
-        "transcript": transcript,
+        "video_url": f"https://www.youtube.com/watch?v={video_id}",
+        **{key: metadata.get(key) for key in METADATA_KEYS},
+        "transcript": transcript.encode(compression),
     }
 
-    client, db = get_mongodb_client()
 
-    with client:
-        db = client[db]
-        transcripts = db.transcripts
-        result = transcripts.insert_one(data)
-
-    logger.info(
-        f"Record {result.inserted_id} successfully saved to {transcripts.name} collection in {db.name} database"
-    )
+def load_transcript(doc: dict) -> Transcript:
+    """Returns the transcript of a video's document, whichever format it was
+    stored in"""
 
+    return Transcript.decode(doc["transcript"])
 
-def convert_video_ts(s: float) -> str:
-    """Converts a video time stamp in secs to H:M:S"""
 
-    hour, remainder_secs = divmod(s, 3600)
-    mins, secs = divmod(remainder_secs, 60)
+def get_transcript_from_db(video_id: str) -> dict | None:
+    return repository.get_transcripts().find_one(video_id)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed download is worth retrying: network errors, time
+    outs, rate limiting and server errors"""
+
+    import requests
+    from youtube_transcript_api import TooManyRequests, YouTubeRequestFailed
+
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+
+    return isinstance(error, (OSError, TooManyRequests, YouTubeRequestFailed))
+
+
+def download_transcript(
+    video_id: str,
+    fetch_transcript: Callable[..., list[dict]] = get_video_transcript,
+    fetch_metadata: Callable[..., dict] = fetch_video_metadata,
+    settings: config.IngestSettings | None = None,
+    cache: BaseCache | None = None,
+) -> dict:
+    """Downloads the transcript and metadata of a video, retrying transient
+    failures with exponential backoff. A video whose metadata cannot be
+    fetched is saved with `DEFAULT_METADATA`. Returns the transcript
+    document"""
+
+    settings = settings or config.IngestSettings.load_settings()
+
+    segments = with_retries(fetch_transcript, settings)(video_id)
+
+    try:
+        metadata = get_video_metadata(
+            f"https://www.youtube.com/watch?v={video_id}",
+            fetch_metadata,
+            cache,
+            settings,
+        )
+    except Exception as e:
+        # the defaults are not cached, so the next lookup tries again
+        logger.warning(f"Using default metadata for {video_id=}: {e!r}")
+        metadata = DEFAULT_METADATA
+
+    return make_transcript_doc(
+        Transcript.from_segments(segments),
+        video_id,
+        metadata,
+        settings.compression,
+    )
 
-    hour = int(hour)
-    minutes = str(int(mins)).zfill(2)
-    seconds = str(int(secs)).zfill(2)
 
-    res = f"{hour}:{minutes}:{seconds}"
-    return res
+def ingest_urls(
+    urls: list[str],
+    fetch_transcript: Callable[..., list[dict]] = get_video_transcript,
+    fetch_metadata: Callable[..., dict] = fetch_video_metadata,
+    repo: repository.VideoRepository | None = None,
+    settings: config.IngestSettings | None = None,
+    cache: BaseCache | None = None,
+) -> list[dict]:
+    """Downloads the transcripts of many videos concurrently and saves them.
+
+    The videos that are already stored are found with a single query, the
+    others are downloaded by `workers` threads (see the ingest settings)
+    and the transcripts are saved with a single bulk write.
+
+    Args:
+    ---
+    urls: YouTube video urls
+    fetch_transcript, fetch_metadata: download the transcript segments and
+    the metadata of a video, given its id or url and a `timeout`
+    repo: where the transcripts are saved, defaults to the transcripts
+    collection
+    cache: where the video metadata is cached, see `get_video_metadata`
+
+    Returns:
+    ---
+    A report for each url, in order: its `video_id`, `status` (`exists`,
+    `downloaded` or `failed`), the number of `requests` made, the `error`
+    of a failed download and the `seconds` it took
+    """
+
+    settings = settings or config.IngestSettings.load_settings()
+    repo = repo or repository.get_transcripts()
+
+    video_ids = [get_video_id(url) for url in urls]
+    existing = repo.existing_ids(list(set(video_ids)))
+    missing = [v for v in dict.fromkeys(video_ids) if v not in existing]
+
+    def download(video_id: str) -> dict:
+        start = time.perf_counter()
+        report = {"video_id": video_id, "status": "downloaded", "requests": 0}
+
+        def counted(fetch: Callable) -> Callable:
+            def call(*args, **kwargs):
+                report["requests"] += 1
+                return fetch(*args, **kwargs)
+
+            return call
+
+        try:
+            report["doc"] = download_transcript(
+                video_id,
+                counted(fetch_transcript),
+                counted(fetch_metadata),
+                settings,
+                cache,
+            )
+        except Exception as e:
+            logger.error(f"Could not download {video_id=}: {e!r}")
+            report.update(status="failed", error=repr(e))
+
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        return report
+
+    downloads = map_concurrently(
+        download, missing, max_workers=settings.workers, show_progress=False
+    )
 
+    docs = [r.pop("doc") for r in downloads if r["status"] == "downloaded"]
+    repo.upsert_many(docs)
 
-def get_transcript_from_db(video_id: str) -> dict | None:
-    client, db = get_mongodb_client()
-    with client:
-        db = client[db]
-        transcripts = db.transcripts
-        result = transcripts.find_one({"video_id": video_id})
+    reports = {r["video_id"]: r for r in downloads}
+    reports.update({v: {"video_id": v, "status": "exists"} for v in existing})
+    failed = sum(r["status"] == "failed" for r in downloads)
+    logger.info(
+        f"Ingested {len(docs)} transcripts, {len(existing)} already stored, "
+        f"{failed} failed"
+    )
 
-    return result
+    return [
+        {"url": url, **reports[video_id]}
+        for url, video_id in zip(urls, video_ids)
+    ]
 
 
 def main(url: str):
@@ -102,12 +363,28 @@ def main(url: str):
     if result is not None:
         logger.info(f"{video_id=} transcript has already been downloaded")
     else:
-        transcript = get_video_transcript(video_id)
-        save_trancript(transcript, video_id)
+        doc = download_transcript(video_id)
+
+        transcripts = repository.get_transcripts()
+        transcripts.upsert_one(doc)
+        logger.info(
+            f"Record {video_id} successfully saved to {transcripts.name} collection"
+        )
 
     return video_id
 
 
 if __name__ == "__main__":
-    URL = "https://www.youtube.com/watch?v=JEBDfGqrAUA"
-    main(URL)
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "urls",
+        nargs="*",
+        help="The video urls to download",
+        default=["https://www.youtube.com/watch?v=JEBDfGqrAUA"],
+    )
+    args = parser.parse_args()
+
+    for report in ingest_urls(args.urls):
+        print(report)
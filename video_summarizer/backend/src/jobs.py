@@ -0,0 +1,216 @@
+"""Runs batches of video summaries as background jobs.
+
+A job is submitted with the same fields as the `/summarize_video` endpoint
+and processed by a bounded pool of workers. The job and the status of each of
+its videos are persisted so that queued or interrupted jobs are resumed when
+the API restarts."""
+
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Callable
+from uuid import uuid4
+
+from video_summarizer.backend.utils.utils import logger
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    # some of the videos of the job failed
+    PARTIAL = "partial"
+    FAILED = "failed"
+
+
+UNFINISHED = [JobStatus.QUEUED.value, JobStatus.RUNNING.value]
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class MongoJobStore:
+    """Stores jobs in a MongoDB collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index("status")
+
+    def create(self, job: dict) -> None:
+        self.collection.insert_one(job)
+
+    def update(self, job_id: str, fields: dict) -> None:
+        self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    def get(self, job_id: str) -> dict | None:
+        return self.collection.find_one({"_id": job_id})
+
+    def find_unfinished(self) -> list[dict]:
+        return list(
+            self.collection.find({"status": {"$in": UNFINISHED}}).sort(
+                "created_at", 1
+            )
+        )
+
+
+class MemoryJobStore:
+    """Stores jobs in memory. Field names in updates may be dotted paths as
+    in MongoDB, e.g. `videos.0.status`"""
+
+    def __init__(self):
+        self.jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: dict) -> None:
+        with self._lock:
+            self.jobs[job["_id"]] = copy.deepcopy(job)
+
+    def update(self, job_id: str, fields: dict) -> None:
+        with self._lock:
+            for path, value in fields.items():
+                *parents, key = path.split(".")
+                target = self.jobs[job_id]
+                for p in parents:
+                    target = target[int(p) if p.isdigit() else p]
+                target[int(key) if key.isdigit() else key] = value
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            return copy.deepcopy(self.jobs.get(job_id))
+
+    def find_unfinished(self) -> list[dict]:
+        with self._lock:
+            return [
+                copy.deepcopy(job)
+                for job in self.jobs.values()
+                if job["status"] in UNFINISHED
+            ]
+
+
+class JobManager:
+    """Processes jobs with a bounded pool of workers.
+
+    Args:
+    ---
+    store: where the jobs are persisted
+    resolve: returns the video urls of a job request
+    summarise: summarises a video url for a job request
+    max_workers: number of jobs processed at the same time
+    """
+
+    def __init__(
+        self,
+        store: MongoJobStore | MemoryJobStore,
+        resolve: Callable[[dict], list[str]],
+        summarise: Callable[[str, dict], list[dict]],
+        max_workers: int = 2,
+    ):
+        self.store = store
+        self.resolve = resolve
+        self.summarise = summarise
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+
+    def submit(self, request: dict) -> str:
+        """Queues a job and returns its id"""
+
+        job_id = uuid4().hex
+        self.store.create(
+            {
+                "_id": job_id,
+                "status": JobStatus.QUEUED.value,
+                "request": request,
+                "videos": None,
+                "error": None,
+                "created_at": now(),
+                "updated_at": now(),
+            }
+        )
+
+        self.executor.submit(self.run, job_id)
+        logger.info(f"Queued {job_id=}")
+
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        return self.store.get(job_id)
+
+    def resume(self) -> list[str]:
+        """Requeues the jobs that were queued or running when the process
+        stopped"""
+
+        job_ids = [job["_id"] for job in self.store.find_unfinished()]
+        for job_id in job_ids:
+            self.executor.submit(self.run, job_id)
+
+        if job_ids:
+            logger.info(f"Resumed {len(job_ids)} jobs")
+
+        return job_ids
+
+    def shutdown(self, wait: bool = False) -> None:
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _update(self, job_id: str, fields: dict) -> None:
+        self.store.update(job_id, {**fields, "updated_at": now()})
+
+    def run(self, job_id: str) -> None:
+        """Summarises the videos of a job, skipping those already done. The
+        job is `done` if every video was summarised, `partial` if some
+        failed and `failed` if all of them did"""
+
+        job = self.store.get(job_id)
+        self._update(job_id, {"status": JobStatus.RUNNING.value})
+
+        try:
+            videos = job["videos"]
+            if videos is None:
+                videos = [
+                    {"url": url, "status": JobStatus.QUEUED.value}
+                    for url in self.resolve(job["request"])
+                ]
+                self._update(job_id, {"videos": videos})
+
+            for i, video in enumerate(videos):
+                if video["status"] == JobStatus.DONE.value:
+                    continue
+
+                self._update(
+                    job_id, {f"videos.{i}.status": JobStatus.RUNNING.value}
+                )
+
+                try:
+                    result = self.summarise(video["url"], job["request"])
+                    fields = {
+                        f"videos.{i}.status": JobStatus.DONE.value,
+                        f"videos.{i}.result": result,
+                    }
+                except Exception as e:
+                    logger.exception(e)
+                    fields = {
+                        f"videos.{i}.status": JobStatus.FAILED.value,
+                        f"videos.{i}.error": str(e),
+                    }
+
+                self._update(job_id, fields)
+                video["status"] = fields[f"videos.{i}.status"]
+
+            failed = sum(v["status"] == JobStatus.FAILED.value for v in videos)
+            if not failed:
+                status = JobStatus.DONE
+            elif failed < len(videos):
+                status = JobStatus.PARTIAL
+            else:
+                status = JobStatus.FAILED
+
+            self._update(job_id, {"status": status.value})
+
+        except Exception as e:
+            logger.exception(e)
+            self._update(
+                job_id, {"status": JobStatus.FAILED.value, "error": str(e)}
+            )
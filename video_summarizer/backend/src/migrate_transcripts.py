@@ -0,0 +1,101 @@
+"""Converts the transcripts saved by earlier versions, lists of formatted
+lines, to the compressed columnar format (see `utils/transcripts.py`).
+
+Documents that are already columnar are not read. The ids of the legacy
+documents are read first, then the documents are converted and written back
+in batches, so the migration can be interrupted and rerun. A document that
+cannot be converted is reported and left as it is.
+
+Run: `python -m video_summarizer.backend.src.migrate_transcripts
+[--compression zlib] [--batch-size 100]`
+"""
+
+import bson
+
+from video_summarizer.backend.utils.repository import VideoRepository
+from video_summarizer.backend.utils.transcripts import Transcript
+from video_summarizer.backend.utils.utils import logger
+
+
+def stored_size(transcript) -> int:
+    """Returns the size of a stored transcript in bytes, as BSON"""
+
+    return len(bson.encode({"transcript": transcript}))
+
+
+def migrate(
+    repo: VideoRepository, compression: str = "zlib", batch_size: int = 100
+) -> dict:
+    """Converts every legacy transcript of a collection.
+
+    Returns:
+    ---
+    The number of transcripts `migrated`, their total size in bytes
+    `before` and `after` the migration and the ids of the documents that
+    `failed` to be converted
+    """
+
+    report = {"migrated": 0, "before": 0, "after": 0, "failed": []}
+
+    # the ids are read up front, so that no cursor is open on the documents
+    # being rewritten
+    ids = [
+        doc["_id"]
+        for doc in repo.collection.find(
+            {"transcript": {"$type": "array"}}, {"_id": 1}
+        )
+    ]
+
+    for i in range(0, len(ids), batch_size):
+        query = {"_id": {"$in": ids[i : i + batch_size]}}
+        batch = []
+
+        for doc in repo.collection.find(query):
+            lines = doc["transcript"]
+            # converted by another run since the ids were read
+            if not isinstance(lines, list):
+                continue
+
+            try:
+                transcript = Transcript.from_lines(lines)
+                doc["transcript"] = transcript.encode(compression)
+            except Exception as e:
+                logger.error(f"Could not migrate {doc['_id']=}: {e!r}")
+                report["failed"].append(doc["_id"])
+                continue
+
+            report["before"] += stored_size(lines)
+            report["after"] += stored_size(doc["transcript"])
+            batch.append(doc)
+
+        repo.upsert_many(batch)
+        report["migrated"] += len(batch)
+        logger.info(f"Migrated {report['migrated']} transcripts")
+
+    return report
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    from video_summarizer.backend.configs import config
+    from video_summarizer.backend.utils import repository
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--compression",
+        choices=["zlib", "zstd", "none"],
+        default=config.IngestSettings.load_settings().compression,
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    report = migrate(
+        repository.get_transcripts(), args.compression, args.batch_size
+    )
+    ratio = report["after"] / max(report["before"], 1)
+    logger.info(
+        f"Migrated {report['migrated']} transcripts: {report['before']} bytes "
+        f"to {report['after']} bytes ({ratio:.1%}), "
+        f"{len(report['failed'])} failed"
+    )
@@ -0,0 +1,110 @@
+"""Moves the videos of the per-video Pinecone indexes created by earlier
+versions into the shared index, where each video has its own namespace.
+
+The old vectors are not copied. Their ids are random, while the shared
+index derives a vector's id from the transcript lines it covers, so
+`upsert_documents` would see copied vectors as stale and embed the video
+again anyway. Each video is embedded from its transcript instead. Old
+indexes are only deleted with `--delete`, once their video has been moved.
+
+Run: `python -m video_summarizer.backend.src.migrate_vectors [--delete]`
+"""
+
+from typing import Callable
+
+from pinecone import Pinecone
+
+from video_summarizer.backend.utils.utils import logger
+from video_summarizer.backend.utils.vectorstore import PineconeVectorStore
+
+
+def find_legacy_indexes(
+    client: Pinecone, video_ids: list[str]
+) -> dict[str, str]:
+    """Returns the per-video indexes, mapping each index name to its video.
+    Indexes that do not belong to a known video are left alone"""
+
+    by_name = {video_id.lower(): video_id for video_id in video_ids}
+    names = [i.get("name") for i in client.list_indexes().get("indexes")]
+
+    return {name: by_name[name] for name in names if name in by_name}
+
+
+def migrate(
+    client: Pinecone,
+    store: PineconeVectorStore,
+    video_ids: list[str],
+    reembed: Callable[[str], int],
+    delete: bool = False,
+) -> dict[str, int]:
+    """Moves the videos of the per-video indexes into the shared index.
+
+    Args:
+    ---
+    client: the Pinecone client
+    store: the shared index
+    video_ids: the videos that may have a per-video index
+    reembed: stores a video's vectors from its transcript, skipping the
+    ones already stored, and returns the number of vectors written
+    delete: whether to delete the per-video indexes that were moved
+
+    Returns:
+    ---
+    The number of vectors of each video in the shared index
+    """
+
+    moved = {}
+
+    for name, video_id in find_legacy_indexes(client, video_ids).items():
+        if name == store.index_name:
+            continue
+
+        written = reembed(video_id)
+        moved[video_id] = store.count(video_id)
+        logger.info(
+            f"Moved {video_id=} from {name=}: {moved[video_id]} vectors, "
+            f"{written} embedded"
+        )
+
+        if delete and moved[video_id] > 0:
+            client.delete_index(name)
+            logger.info(f"Deleted index {name=}")
+
+    return moved
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    from video_summarizer.backend.src.chat_video import (
+        get_embeddings,
+        upsert_documents,
+    )
+    from video_summarizer.backend.utils import repository
+    from video_summarizer.backend.utils.vectorstore import get_vector_store
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--delete",
+        help="Delete the per-video indexes once they have been moved",
+        action="store_true",
+        default=False,
+    )
+    args = parser.parse_args()
+
+    store = get_vector_store()
+    if not isinstance(store, PineconeVectorStore):
+        raise SystemExit("The vector store backend is not Pinecone")
+
+    transcripts = repository.get_transcripts().collection
+    video_ids = transcripts.distinct("video_id")
+
+    embeddings = get_embeddings()
+
+    def reembed(video_id: str) -> int:
+        return upsert_documents(store, video_id, embeddings)
+
+    moved = migrate(
+        store.client, store, video_ids, reembed=reembed, delete=args.delete
+    )
+    logger.info(f"Migrated {len(moved)} videos")
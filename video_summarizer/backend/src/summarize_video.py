@@ -1,17 +1,76 @@
+import json
+import time
+from functools import lru_cache
+from typing import Callable
+
 from dotenv import load_dotenv
-from langchain.chains import LLMChain
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from tqdm import tqdm
 
 from video_summarizer.backend.configs import config
 from video_summarizer.backend.src.extract_transcript import (
-    get_transcript_from_db, get_video_title)
-from video_summarizer.backend.utils.utils import get_mongodb_client, logger
+    METADATA_KEYS,
+    get_transcript_from_db,
+    get_video_metadata,
+    load_transcript,
+)
+from video_summarizer.backend.src.summary_state import SummaryState, load_state
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.cache import BaseCache, get_cache, make_key
+from video_summarizer.backend.utils.concurrency import (
+    RateLimiter,
+    map_concurrently,
+)
+from video_summarizer.backend.utils.utils import (
+    estimate_tokens,
+    logger,
+    truncate_to_tokens,
+)
+
+
+class CachedModel:
+    """Wraps an LLM so that a question that has already been asked is
+    answered from a cache instead of the LLM.
+
+    Answers are keyed by a hash of the model name, the prompt template and
+    the question.
+    """
+
+    def __init__(
+        self, model, cache: BaseCache, model_name: str, template: str
+    ):
+        self.model = model
+        self.cache = cache
+        self.model_name = model_name
+        self.template = template
+
+    def predict(self, **kwargs) -> str:
+        key = make_key(
+            self.model_name, self.template, json.dumps(kwargs, sort_keys=True)
+        )
+
+        answer = self.cache.get(key)
+        if answer is None:
+            answer = self.model.predict(**kwargs)
+            self.cache.set(key, answer)
+
+        return answer
+
+
+def init_model(
+    template: str,
+    cache: BaseCache | None = None,
+    model_name: str | None = None,
+):
+    """Initialise an LLM. If a cache is provided, repeated questions are
+    answered from the cache. The model defaults to the one in the model
+    params"""
 
+    # langchain takes seconds to import, so it is only loaded once a model
+    # is needed
+    from langchain.chains import LLMChain
+    from langchain.chat_models import ChatOpenAI
+    from langchain.prompts import PromptTemplate
 
-def init_model(template: str):
-    """Initialise an LLM"""
+    model_name = model_name or config.ModelParams.load().MODEL
 
     prompt_template = PromptTemplate(
         input_variables=["question"],
@@ -19,22 +78,42 @@ def init_model(template: str):
     )
 
     model = LLMChain(
-        llm=ChatOpenAI(model=config.ModelParams.load().MODEL),
+        llm=ChatOpenAI(model=model_name),
         prompt=prompt_template,
     )
 
+    if cache is not None:
+        model = CachedModel(model, cache, model_name, template)
+
     return model
 
 
-def chunk_a_list(data: list[str], chunk_size: int) -> list[list[str]]:
-    """Converts a long list to a smaller one by combining its items"""
+@lru_cache
+def get_rate_limiter(
+    model: str,
+    requests_per_minute: int | None,
+    tokens_per_minute: int | None,
+) -> RateLimiter:
+    """Returns the process-wide rate limiter shared by all calls to a model"""
+
+    return RateLimiter(
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+    )
+
+
+def chunk_indices_by_lines(
+    data: list[str], chunk_size: int
+) -> list[list[int]]:
+    """Groups the indices of the non-empty lines into chunks of `chunk_size`
+    lines"""
 
     result = []
     sublist = []
 
-    for _, t in enumerate(data):
+    for i, t in enumerate(data):
         if t.strip():
-            sublist.append(t)
+            sublist.append(i)
         if len(sublist) == chunk_size:
             result.append(sublist)
             sublist = []
@@ -44,20 +123,150 @@ def chunk_a_list(data: list[str], chunk_size: int) -> list[list[str]]:
     return result
 
 
-def check_if_summarised(video_id: str) -> tuple[bool, None | str]:
-    """Checks if a video has already been summarised"""
+def chunk_a_list(data: list[str], chunk_size: int) -> list[list[str]]:
+    """Converts a long list to a smaller one by combining its items"""
+
+    return [
+        [data[i] for i in chunk]
+        for chunk in chunk_indices_by_lines(data, chunk_size)
+    ]
+
+
+def chunk_indices_by_tokens(
+    data: list[str], max_tokens: int, overlap: int = 0
+) -> list[list[int]]:
+    """Groups the indices of the non-empty lines into chunks of at most
+    `max_tokens` tokens. See `chunk_by_tokens`"""
+
+    if overlap >= max_tokens:
+        raise ValueError(f"{overlap=} must be smaller than {max_tokens=}")
+
+    result = []
+    sublist = []
+    sublist_tokens = 0
+    is_new = False  # whether sublist has lines not in the previous chunk
+
+    for i, t in enumerate(data):
+        if not t.strip():
+            continue
+
+        tokens = estimate_tokens(t)
+
+        if is_new and sublist_tokens + tokens > max_tokens:
+            result.append(sublist)
+
+            # carry over the trailing lines that fit within the overlap
+            carried = []
+            carried_tokens = 0
+            for j in reversed(sublist):
+                line_tokens = estimate_tokens(data[j])
+                if carried_tokens + line_tokens > overlap:
+                    break
+                carried.insert(0, j)
+                carried_tokens += line_tokens
+
+            if carried_tokens + tokens > max_tokens:
+                carried, carried_tokens = [], 0
+
+            sublist, sublist_tokens = carried, carried_tokens
+
+        sublist.append(i)
+        sublist_tokens += tokens
+        is_new = True
+
+    if is_new:
+        result.append(sublist)
+
+    return result
+
+
+def chunk_by_tokens(
+    data: list[str], max_tokens: int, overlap: int = 0
+) -> list[list[str]]:
+    """Packs transcript lines into chunks of at most `max_tokens` tokens.
+
+    Lines are never split, so every chunk starts and ends on a timestamp. A
+    line longer than `max_tokens` becomes a chunk of its own.
+
+    Args:
+    ---
+    data: the transcript lines
+    max_tokens: target number of tokens per chunk
+    overlap: number of tokens from the end of a chunk to repeat at the start
+    of the next one
+
+    Returns:
+    ---
+    A list of chunks, each a list of lines
+    """
+
+    return [
+        [data[i] for i in chunk]
+        for chunk in chunk_indices_by_tokens(data, max_tokens, overlap)
+    ]
+
+
+def chunk_transcript(
+    transcript: list[str], params: config.ModelParams
+) -> tuple[list[list[str]], list[tuple[int, int]]]:
+    """Chunks a transcript using the mode set in the model params.
+
+    Returns:
+    ---
+    The chunks and the (first, last) line index of each chunk
+    """
+
+    if params.CHUNK_MODE == "lines":
+        indices = chunk_indices_by_lines(transcript, params.CHUNK_SIZE)
+
+    elif params.CHUNK_MODE == "tokens":
+        indices = chunk_indices_by_tokens(
+            transcript, params.CHUNK_TOKENS, params.CHUNK_OVERLAP
+        )
+
+    else:
+        raise ValueError(f"Unknown {params.CHUNK_MODE=}")
+
+    chunks = [[transcript[i] for i in chunk] for chunk in indices]
+    spans = [(chunk[0], chunk[-1]) for chunk in indices]
+
+    return chunks, spans
+
+
+def is_current_summary(
+    result: dict,
+    limit_transcript: int | float | None = None,
+    overrides: dict | None = None,
+) -> bool:
+    """Whether a stored summary can be reused. A summary made with a
+    different `limit_transcript` does not count (summaries saved before the
+    limit was recorded always count), nor does one made with params other
+    than `overrides`"""
+
+    limit = result.get("limit_transcript", limit_transcript)
+    params = result.get("params", {})
+
+    return limit == limit_transcript and all(
+        params.get(k) == v for k, v in (overrides or {}).items()
+    )
+
+
+def check_if_summarised(
+    video_id: str,
+    limit_transcript: int | float | None = None,
+    overrides: dict | None = None,
+) -> tuple[bool, None | str]:
+    """Checks if a video has already been summarised. See
+    `is_current_summary`"""
 
     is_summarised = False
     data = None
 
-    client, db = get_mongodb_client()
-
-    with client:
-        db = client[db]
-        summaries = db.summaries
-        result = summaries.find_one({"video_id": video_id})
+    result = repository.get_summaries().find_one(video_id)
 
-    if result is not None:
+    if result is not None and is_current_summary(
+        result, limit_transcript, overrides
+    ):
         is_summarised = True
 
         data = {}
@@ -67,8 +276,30 @@ def check_if_summarised(video_id: str) -> tuple[bool, None | str]:
     return is_summarised, data
 
 
-def summarize_transcript(transcript, bullets, model, limit) -> str:
-    """Provides a summary for a video transcript"""
+def find_summarised(
+    video_ids: list[str],
+    limit_transcript: int | float | None = None,
+    overrides: dict | None = None,
+) -> dict[str, dict]:
+    """Looks up which of many videos have already been summarised with a
+    single query. See `is_current_summary`
+
+    Returns:
+    ---
+    The summaries that can be reused, keyed by video id
+    """
+
+    results = repository.get_summaries().find_many(video_ids)
+
+    return {
+        video_id: {k: result.get(k) for k in config.video_keys}
+        for video_id, result in results.items()
+        if is_current_summary(result, limit_transcript, overrides)
+    }
+
+
+def build_question(transcript, bullets, limit) -> str:
+    """Builds the question used to summarise a video transcript"""
 
     question = f"""Consider the following video transcript: 
     
@@ -80,142 +311,444 @@ def summarize_transcript(transcript, bullets, model, limit) -> str:
     timestamps. The total number of words should not be more than {limit}.
     """
 
+    return question
+
+
+def summarize_transcript(transcript, bullets, model, limit) -> str:
+    """Provides a summary for a video transcript"""
+
+    question = build_question(transcript, bullets, limit)
     summary = model.predict(question=question)
     return summary
 
 
-def summarize_list_of_transcripts(transcripts, bullets, model, limit):
-    """Summarize a list of transcripts into a list of summaries"""
+def summarize_with_state(
+    items: list,
+    summarize: Callable,
+    cost: Callable,
+    level: int = 0,
+    spans: list[tuple[int, int]] | None = None,
+    state: SummaryState | None = None,
+    max_concurrency: int = 1,
+    limiter: RateLimiter | None = None,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> list[str]:
+    """Summarises every item whose node is not already stored in `state` and
+    stores the new nodes as soon as they are ready"""
+
+    use_state = state is not None and spans is not None
+
+    results = [None] * len(items)
+    if use_state:
+        results = [state.get(level, *span) for span in spans]
+
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    def run(i: int) -> str:
+        summary = summarize(items[i])
+        if use_state:
+            state.set(level, *spans[i], summary)
+        return summary
+
+    summaries = map_concurrently(
+        run,
+        pending,
+        max_workers=max_concurrency,
+        limiter=limiter,
+        cost=lambda i: cost(items[i]),
+        on_progress=on_progress,
+    )
 
-    summaries = [
-        summarize_transcript(transcript, bullets, model, limit)
-        for transcript in tqdm(transcripts)
-    ]
+    for i, summary in zip(pending, summaries):
+        results[i] = summary
+
+    return results
+
+
+def summarize_list_of_transcripts(
+    transcripts,
+    bullets,
+    model,
+    limit,
+    max_concurrency: int = 1,
+    limiter: RateLimiter | None = None,
+    spans: list[tuple[int, int]] | None = None,
+    state: SummaryState | None = None,
+    on_progress: Callable[[int, int], None] | None = None,
+):
+    """Summarize a list of transcripts into a list of summaries.
+
+    Up to `max_concurrency` transcripts are summarised at a time and each
+    request passes through `limiter`. The summaries are returned in the same
+    order as the transcripts. If `state` and the line `spans` of the
+    transcripts are provided, chunks that were summarised before are reused.
+    `on_progress` is called with (completed, total) as chunks complete.
+    """
+
+    summaries = summarize_with_state(
+        transcripts,
+        summarize=lambda transcript: summarize_transcript(
+            transcript, bullets, model, limit
+        ),
+        cost=lambda transcript: estimate_tokens(str(transcript)) + limit,
+        level=0,
+        spans=spans,
+        state=state,
+        max_concurrency=max_concurrency,
+        limiter=limiter,
+        on_progress=on_progress,
+    )
     return summaries
 
 
-def summarize_list_of_summaries(summaries, chunk_size, bullets, model, limit):
-    """Summarise a list of summaries into a summary"""
+def group_summaries(
+    summaries: list[str], fan_in: int, token_budget: int
+) -> list[list[str]]:
+    """Groups consecutive summaries so that each group has at most `fan_in`
+    summaries whose combined size is within `token_budget` tokens"""
+
+    groups = []
+    group = []
+    group_tokens = 0
+
+    for summary in summaries:
+        # one extra token covers the separator and rounding of the estimate
+        tokens = estimate_tokens(summary) + 1
+        if group and (
+            len(group) == fan_in or group_tokens + tokens > token_budget
+        ):
+            groups.append(group)
+            group = []
+            group_tokens = 0
+
+        group.append(summary)
+        group_tokens += tokens
+
+    if group:
+        groups.append(group)
+
+    return groups
+
+
+def reduce_summaries(
+    summaries: list[str],
+    bullets,
+    model,
+    limit,
+    fan_in: int,
+    token_budget: int,
+    max_concurrency: int = 1,
+    limiter: RateLimiter | None = None,
+    spans: list[tuple[int, int]] | None = None,
+    state: SummaryState | None = None,
+    on_level: Callable[[dict], None] | None = None,
+    video_id: str | None = None,
+) -> tuple[str, list[dict]]:
+    """Combines a list of summaries into a single summary using a balanced
+    tree of reductions.
+
+    Groups hold fewer than `fan_in` summaries when they would not fit into
+    `token_budget`. A summary too long to be combined with another is
+    summarised on its own first, so that nothing is cut from it. Only a
+    summary that does not fit into a prompt by itself, or that summarising
+    alone did not shorten enough, is truncated, with a warning.
+
+    Args:
+    ---
+    summaries: the summaries of the transcript chunks, in order
+    bullets: number of bullet points in each summary
+    model: the LLM used to summarise
+    limit: maximum number of words in each summary
+    fan_in: maximum number of summaries combined in one prompt
+    token_budget: maximum number of tokens in one prompt
+    max_concurrency: maximum number of reductions in flight per level
+    limiter: rate limiter shared by all the requests
+    spans: the (first, last) transcript line covered by each summary
+    state: stored nodes to reuse and to save new nodes to
+    on_level: called with the statistics of each level once it completes
+    video_id: the video summarised, used in warnings. Defaults to the
+    video of `state`
+
+    Returns:
+    ---
+    The final summary and statistics for each level of the tree
+    """
 
-    # group list of summaries into chunks
-    chunked_summaries = [
-        summaries[i : i + chunk_size]
-        for i in range(0, len(summaries), chunk_size)
-    ]
+    if not summaries:
+        raise ValueError("There are no summaries to reduce")
 
-    # join chunks into a single prompt/string and send to model
-    combined_summaries = [
-        summarize_transcript(" ".join(chunk), bullets, model, limit)
-        for chunk in tqdm(chunked_summaries)
-    ]
+    if fan_in < 2:
+        raise ValueError(f"fan_in must be at least 2, got {fan_in=}")
 
-    # repeat
-    return summarize_transcript(
-        " ".join(combined_summaries), bullets, model, limit
+    # leave room for the instructions
+    budget = (
+        token_budget - estimate_tokens(build_question("", bullets, limit)) - 1
     )
+    if budget < 4:
+        raise ValueError(f"{token_budget=} is too small for a reduce prompt")
+
+    if video_id is None and state is not None:
+        video_id = state.video_id
+
+    def truncate(summary: str, max_tokens: int) -> str:
+        dropped = estimate_tokens(summary) - max_tokens
+        if dropped > 0:
+            logger.warning(
+                f"Dropping {dropped} tokens of a summary of {video_id=} to "
+                f"fit {token_budget=}"
+            )
+        return truncate_to_tokens(summary, max_tokens)
+
+    stats = []
+    level = 0
+    stalled = False
+
+    while len(summaries) > 1:
+        level += 1
+        start = time.perf_counter()
+
+        summaries = [truncate(s, budget - 1) for s in summaries]
+        groups = group_summaries(summaries, fan_in, budget)
+
+        # no two summaries fit together, even after the last level
+        # summarised them one by one, so cut them down to make progress
+        if stalled and len(groups) == len(summaries):
+            summaries = [truncate(s, budget // 2 - 1) for s in summaries]
+            groups = group_summaries(summaries, fan_in, budget)
+
+        stalled = len(groups) == len(summaries)
+
+        group_spans = None
+        if spans is not None:
+            group_spans = []
+            offset = 0
+            for group in groups:
+                first, last = offset, offset + len(group) - 1
+                group_spans.append((spans[first][0], spans[last][1]))
+                offset += len(group)
+
+        reused = state.reused if state is not None else 0
+        reduced = summarize_with_state(
+            groups,
+            summarize=lambda group: summarize_transcript(
+                " ".join(group), bullets, model, limit
+            ),
+            cost=lambda group: estimate_tokens(" ".join(group)) + limit,
+            level=level,
+            spans=group_spans,
+            state=state,
+            max_concurrency=max_concurrency,
+            limiter=limiter,
+        )
+        reused = (state.reused if state is not None else 0) - reused
+
+        latency = time.perf_counter() - start
+        stats.append(
+            {
+                "level": level,
+                "inputs": len(summaries),
+                "outputs": len(reduced),
+                "reused": reused,
+                "latency": round(latency, 3),
+            }
+        )
+        logger.info(
+            f"Reduce {level=}: {len(summaries)} summaries -> {len(reduced)} in {latency:.2f}s"
+        )
+        if on_level is not None:
+            on_level(stats[-1])
 
+        summaries = reduced
+        spans = group_spans
 
-def save_summary(data: dict | list[dict]):
-    """Saves data to a MongoDB database"""
+    return summaries[0], stats
 
-    client, _DB = get_mongodb_client()
 
-    with client:
-        db = client[_DB]  # Establish db connection
-        summaries = db.summaries  # Create a collection
+def save_summary(data: dict | list[dict]):
+    """Saves data to a MongoDB database, replacing older summaries of the
+    same videos"""
 
-        # Insert a record(s)
-        if isinstance(data, dict):
-            result = summaries.insert_one(data)
-            logger.info(
-                f"Record {result.inserted_id} successfully added to {summaries.name} collection in {db.name} db"
-            )
-        elif isinstance(data, list):
-            result = summaries.insert_many(data)
-            logger.info(
-                f"Record {result.inserted_ids} successfully added to {summaries.name} collection in {db.name} db"
-            )
-        else:
-            raise ValueError(f"Cannot save type: {type(data)}")
+    summaries = repository.get_summaries()
 
+    if isinstance(data, dict):
+        summaries.upsert_one(data)
+        logger.info(
+            f"Record {data['video_id']} successfully saved to {summaries.name} collection"
+        )
+    elif isinstance(data, list):
+        count = summaries.upsert_many(data)
+        logger.info(
+            f"{count} records successfully saved to {summaries.name} collection"
+        )
+    else:
+        raise ValueError(f"Cannot save type: {type(data)}")
+
+
+def summarise(
+    LIMIT_TRANSCRIPT: int | float | None,
+    video_id: str,
+    on_progress: Callable[[dict], None] | None = None,
+    overrides: dict | None = None,
+    transcript_doc: dict | None = None,
+) -> dict:
+    """Summarises a video without saving the summary. `on_progress` is called
+    with progress events for the map and reduce phases. `overrides` replaces
+    some of the model params for this video only. `transcript_doc` is the
+    video's transcript document, read from the database if not given.
+
+    Returns:
+    ---
+    The summary document of the video
+    """
 
-def main(LIMIT_TRANSCRIPT: int | float | None, video_id: str):
     load_dotenv()
 
-    model = init_model(config.prompt_template)
-    msgs = []
+    params = config.ModelParams.load(overrides=overrides)
+
+    cache = get_cache("llm_responses")
+    model = init_model(
+        config.prompt_template, cache=cache, model_name=params.MODEL
+    )
 
-    ModelParams = config.ModelParams
+    video_url = f"https://www.youtube.com/watch?v={video_id}"
 
-    is_summarised, data = check_if_summarised(video_id)
+    result = transcript_doc or get_transcript_from_db(video_id=video_id)
 
-    if is_summarised:
-        logger.info(f"{video_id=}' has already been summarised")
-        msgs.append(data)
+    # the metadata is stored with the transcript, only older transcripts
+    # saved without it need a lookup
+    metadata = {k: result[k] for k in METADATA_KEYS if result.get(k)}
+    if "video_title" not in metadata:
+        metadata = get_video_metadata(video_url)
+
+    data = {
+        "video_id": video_id,
+        "video_url": video_url,
+        **metadata,
+        "params": params.model_dump(),
+        "limit_transcript": LIMIT_TRANSCRIPT,
+    }
+
+    missing_keys = []
+    for k in config.video_keys:
+        if k not in data and k != "summary":
+            missing_keys.append(k)
+
+    if missing_keys:
+        raise ValueError(f"Some keys are not included: {missing_keys=}")
+
+    logger.info(f"Summarising {video_id=} ...")
+    transcript = load_transcript(result).lines()
+
+    # Chunk the entire transcript into list of lines
+    transcripts, spans = chunk_transcript(transcript, params)
+
+    if (LIMIT_TRANSCRIPT is not None) & (LIMIT_TRANSCRIPT > 1):
+        transcripts = transcripts[:LIMIT_TRANSCRIPT]
+        spans = spans[:LIMIT_TRANSCRIPT]
+
+    elif LIMIT_TRANSCRIPT <= 1:
+        length = len(transcripts) * LIMIT_TRANSCRIPT
+        transcripts = transcripts[: int(length)]
+        spans = spans[: int(length)]
 
     else:
+        raise ValueError("incorrect value for LIMIT_TRANSCRIPT")
+
+    # Summary of summaries: recursively chunk the list & summarise until len(summaries) == 1
+    # Summarize each transcript
+    limiter = get_rate_limiter(
+        params.MODEL,
+        params.REQUESTS_PER_MINUTE,
+        params.TOKENS_PER_MINUTE,
+    )
 
-        video_url = f"https://www.youtube.com/watch?v={video_id}"
+    def on_map_progress(completed: int, total: int) -> None:
+        if on_progress is not None:
+            on_progress(
+                {
+                    "event": "progress",
+                    "video_id": video_id,
+                    "stage": "map",
+                    "completed": completed,
+                    "total": total,
+                }
+            )
 
-        data = {
-            "video_id": video_id,
-            "video_url": video_url,
-            "video_title": get_video_title(video_url),
-            "params": dict(ModelParams.load()),
-        }
+    def on_reduce_progress(level_stats: dict) -> None:
+        if on_progress is not None:
+            on_progress(
+                {
+                    "event": "progress",
+                    "video_id": video_id,
+                    "stage": "reduce",
+                    **level_stats,
+                }
+            )
 
-        missing_keys = []
-        for k in config.video_keys:
-            if k not in data and k != "summary":
-                missing_keys.append(k)
+    # Chunk and reduce summaries saved by earlier runs are reused
+    state = load_state(video_id, params)
+
+    list_of_summaries = summarize_list_of_transcripts(
+        transcripts,
+        params.BULLETS,
+        model,
+        params.SUMMARY_LIMIT,
+        max_concurrency=params.MAX_CONCURRENCY,
+        limiter=limiter,
+        spans=spans,
+        state=state,
+        on_progress=on_map_progress,
+    )
 
-        if missing_keys:
-            raise ValueError(f"Some keys are not included: {missing_keys=}")
+    # Combine summaries level by level until a single summary is obtained
+    msg, reduce_stats = reduce_summaries(
+        list_of_summaries,
+        params.BULLETS,
+        model,
+        params.SUMMARY_LIMIT,
+        fan_in=params.REDUCE_FAN_IN,
+        token_budget=params.REDUCE_TOKEN_BUDGET,
+        max_concurrency=params.MAX_CONCURRENCY,
+        limiter=limiter,
+        spans=spans,
+        state=state,
+        on_level=on_reduce_progress,
+        video_id=video_id,
+    )
 
-        logger.info(f"Summarising {video_id=} ...")
-        result = get_transcript_from_db(video_id=video_id)
-        transcript = result.get("transcript")
+    logger.info(
+        f"Reduced {video_id=} in {len(reduce_stats)} levels, reusing {state.reused} and creating {state.created} summary nodes"
+    )
+    data.update({"summary": msg, "reduce_stats": reduce_stats})
 
-        # Chunk the entire transcript into list of lines
-        transcripts = chunk_a_list(transcript, ModelParams.load().CHUNK_SIZE)
+    logger.info(f"LLM response cache stats: {cache.get_stats()}")
 
-        if (LIMIT_TRANSCRIPT is not None) & (LIMIT_TRANSCRIPT > 1):
-            transcripts = transcripts[:LIMIT_TRANSCRIPT]
+    return data
 
-        elif LIMIT_TRANSCRIPT <= 1:
-            length = len(transcripts) * LIMIT_TRANSCRIPT
-            transcripts = transcripts[: int(length)]
 
-        else:
-            raise ValueError("incorrect value for LIMIT_TRANSCRIPT")
+def main(
+    LIMIT_TRANSCRIPT: int | float | None,
+    video_id: str,
+    on_progress: Callable[[dict], None] | None = None,
+    overrides: dict | None = None,
+):
+    """Summarises a video and saves the summary, unless it has already been
+    summarised. See `summarise`"""
 
-        # Summary of summaries: recursively chunk the list & summarise until len(summaries) == 1
-        # Summarize each transcript
-        list_of_summaries = summarize_list_of_transcripts(
-            transcripts,
-            ModelParams.load().BULLETS,
-            model,
-            ModelParams.load().SUMMARY_LIMIT,
-        )
+    load_dotenv()
 
-        # Combine summaries in chunks and summarize them iteratively until a single summary is obtained
-        while len(list_of_summaries) > 1:
-            list_of_summaries = [
-                summarize_list_of_summaries(
-                    list_of_summaries,
-                    ModelParams.load().CHUNK_SIZE,
-                    ModelParams.load().BULLETS,
-                    model,
-                    ModelParams.load().SUMMARY_LIMIT,
-                )
-            ]
+    msgs = []
 
-        # Output the final summary
-        assert len(list_of_summaries) == 1, "Not a summary of summaries"
-        msg = list_of_summaries[0]
+    is_summarised, data = check_if_summarised(
+        video_id, LIMIT_TRANSCRIPT, overrides
+    )
 
-        data.update({"summary": msg})
+    if is_summarised:
+        logger.info(f"{video_id=}' has already been summarised")
+        msgs.append(data)
 
+    else:
+        data = summarise(LIMIT_TRANSCRIPT, video_id, on_progress, overrides)
         save_summary(data)
 
         res = {k: v for k, v in data.items() if k in config.video_keys}
@@ -0,0 +1,103 @@
+"""Persists the summary of every chunk (level 0) and every reduce node
+(level >= 1) of a video. An interrupted run resumes from the stored nodes and
+summarising more of a transcript only summarises the new chunks.
+
+A node is identified by its level and the first and last transcript lines it
+covers, for a given hash of the params that affect its summary."""
+
+import threading
+
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.utils import repository
+from video_summarizer.backend.utils.cache import make_key
+from video_summarizer.backend.utils.utils import logger
+
+# params that change the content of a summary node
+STATE_PARAMS = (
+    "MODEL",
+    "CHUNK_MODE",
+    "CHUNK_SIZE",
+    "CHUNK_TOKENS",
+    "CHUNK_OVERLAP",
+    "SUMMARY_LIMIT",
+    "BULLETS",
+    "REDUCE_FAN_IN",
+    "REDUCE_TOKEN_BUDGET",
+)
+
+
+def get_params_hash(params: config.ModelParams) -> str:
+    """Hashes the params that affect the summary of a node"""
+
+    return make_key(*[f"{k}={getattr(params, k)}" for k in STATE_PARAMS])
+
+
+class SummaryState:
+    """The stored summary nodes of a video for a set of params.
+
+    Args:
+    ---
+    video_id: the video the nodes belong to
+    params_hash: hash of the params used to create the nodes
+    nodes: existing nodes keyed by (level, start, end)
+    collection: MongoDB collection that new nodes are saved to
+    """
+
+    def __init__(
+        self,
+        video_id: str,
+        params_hash: str,
+        nodes: dict[tuple[int, int, int], str] | None = None,
+        collection=None,
+    ):
+        self.video_id = video_id
+        self.params_hash = params_hash
+        self.nodes = nodes or {}
+        self.collection = collection
+        self.reused = 0
+        self.created = 0
+        self._lock = threading.Lock()
+
+    def get(self, level: int, start: int, end: int) -> str | None:
+        summary = self.nodes.get((level, start, end))
+
+        if summary is not None:
+            with self._lock:
+                self.reused += 1
+
+        return summary
+
+    def set(self, level: int, start: int, end: int, summary: str) -> None:
+        with self._lock:
+            self.nodes[(level, start, end)] = summary
+            self.created += 1
+
+        if self.collection is not None:
+            key = {
+                "video_id": self.video_id,
+                "params_hash": self.params_hash,
+                "level": level,
+                "start": start,
+                "end": end,
+            }
+            self.collection.update_one(
+                key, {"$set": {"summary": summary}}, upsert=True
+            )
+
+
+def load_state(video_id: str, params: config.ModelParams) -> SummaryState:
+    """Loads the summary nodes already stored for a video"""
+
+    params_hash = get_params_hash(params)
+
+    collection = repository.get_summary_nodes()
+
+    nodes = {
+        (doc["level"], doc["start"], doc["end"]): doc["summary"]
+        for doc in collection.find(
+            {"video_id": video_id, "params_hash": params_hash}
+        )
+    }
+
+    logger.info(f"Loaded {len(nodes)} stored summary nodes for {video_id=}")
+    return SummaryState(video_id, params_hash, nodes, collection)
@@ -14,10 +14,10 @@ from pydantic import BaseModel
 from video_summarizer.backend.configs.config import ApiSettings
 from video_summarizer.backend.utils.utils import logger
 
-SECRET_KEY = os.environ["SECRET_KEY"]
-ALGORITHM = ApiSettings.load_settings().algorithm
-TOKEN_EXPIRY = ApiSettings.load_settings().access_token_expire_minutes
-API_PREFIX = ApiSettings.load_settings().api_prefix
+settings = ApiSettings.load_settings()
+ALGORITHM = settings.algorithm
+TOKEN_EXPIRY = settings.access_token_expire_minutes
+API_PREFIX = settings.api_prefix
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{API_PREFIX}/token")
@@ -67,6 +67,13 @@ class UserInDB(User):
     hashed_password: str
 
 
+def get_secret_key() -> str:
+    """Returns the key tokens are signed with. It is read when a token is
+    first created or checked, so the module can be imported without it"""
+
+    return os.environ["SECRET_KEY"]
+
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -100,7 +107,7 @@ def create_access_token(
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + expires_delta
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, get_secret_key(), algorithm=ALGORITHM)
     logger.info(f"{encoded_jwt=}")
     return encoded_jwt
 
@@ -109,7 +116,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     """Authenticates a user based on the token supplied."""
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, get_secret_key(), algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -0,0 +1,476 @@
+"""Key-value caches with TTL and size based eviction. Used to avoid repeating
+expensive calls such as LLM requests.
+
+Backends:
+---
+* MemoryCache: in-process LRU
+* SQLiteCache: a local SQLite file
+* MongoCache: a collection in the MongoDB database
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable
+
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure
+
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.utils.repository import get_database
+from video_summarizer.backend.utils.utils import logger
+
+
+def make_key(*parts: str) -> str:
+    """Creates a content addressed key from its parts"""
+
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\x1f")
+
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class BaseCache(ABC):
+    """Base class for the cache backends.
+
+    Args:
+    ---
+    ttl: number of seconds an entry is valid for (None = no expiry)
+    max_entries: maximum number of entries kept (None = unbounded)
+    """
+
+    def __init__(
+        self,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl is not None and self._clock() - created_at > self.ttl
+
+    @abstractmethod
+    def _get(self, key: str) -> Any | None:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, value: Any) -> None:
+        pass
+
+    @abstractmethod
+    def _delete(self, key: str) -> None:
+        pass
+
+    def _get_many(self, keys: list[str]) -> dict[str, Any]:
+        found = {}
+        for key in keys:
+            value = self._get(key)
+            if value is not None:
+                found[key] = value
+
+        return found
+
+    def _set_many(self, items: dict[str, Any]) -> None:
+        for key, value in items.items():
+            self._set(key, value)
+
+    def get(self, key: str) -> Any | None:
+        """Returns the value stored under a key or None on a miss"""
+
+        value = self._get(key)
+
+        with self._lock:
+            if value is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+
+        return value
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Looks up many keys at once. Returns the values found keyed by
+        their key, leaving out the misses"""
+
+        keys = list(dict.fromkeys(keys))
+        found = self._get_many(keys) if keys else {}
+
+        with self._lock:
+            self.stats.hits += len(found)
+            self.stats.misses += len(keys) - len(found)
+
+        return found
+
+    def set(self, key: str, value: Any) -> None:
+        self._set(key, value)
+
+    def set_many(self, items: dict[str, Any]) -> None:
+        if items:
+            self._set_many(items)
+
+    def delete(self, key: str) -> None:
+        self._delete(key)
+
+    def get_stats(self) -> dict:
+        return {**asdict(self.stats), "hit_rate": self.stats.hit_rate}
+
+
+class MemoryCache(BaseCache):
+    """In-process LRU cache"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            created_at, value = item
+            if self._is_expired(created_at):
+                del self._data[key]
+                self.stats.evictions += 1
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._data[key] = (self._clock(), value)
+            self._data.move_to_end(key)
+
+            while (
+                self.max_entries is not None
+                and len(self._data) > self.max_entries
+            ):
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteCache(BaseCache):
+    """Cache persisted to a SQLite file. Entries are evicted in least
+    recently used order"""
+
+    def __init__(self, path: str, table: str = "cache", *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.table = table
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value BLOB,
+                    created_at REAL,
+                    accessed_at REAL
+                )"""
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM {self.table}"
+            ).fetchone()[0]
+
+    def _get(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self._is_expired(created_at):
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key = ?", (key,)
+                )
+                self.stats.evictions += 1
+                return None
+
+            self._conn.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                (self._clock(), key),
+            )
+            return value
+
+    def _get_many(self, keys):
+        found = {}
+        expired = []
+        now = self._clock()
+
+        with self._lock, self._conn:
+            # stay below SQLite's limit on the number of query parameters
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"""SELECT key, value, created_at FROM {self.table}
+                    WHERE key IN ({", ".join("?" * len(batch))})""",
+                    batch,
+                ).fetchall()
+
+                for key, value, created_at in rows:
+                    if self._is_expired(created_at):
+                        expired.append((key,))
+                    else:
+                        found[key] = value
+
+            self._conn.executemany(
+                f"DELETE FROM {self.table} WHERE key = ?", expired
+            )
+            self._conn.executemany(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self.stats.evictions += len(expired)
+
+        return found
+
+    def _evict(self) -> None:
+        if self.max_entries is None:
+            return
+
+        excess = (
+            self._conn.execute(
+                f"SELECT COUNT(*) FROM {self.table}"
+            ).fetchone()[0]
+            - self.max_entries
+        )
+
+        if excess > 0:
+            self._conn.execute(
+                f"""DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table}
+                    ORDER BY accessed_at LIMIT ?
+                )""",
+                (excess,),
+            )
+            self.stats.evictions += excess
+
+    def _set(self, key, value):
+        self._set_many({key: value})
+
+    def _set_many(self, items):
+        now = self._clock()
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items.items()],
+            )
+            self._evict()
+
+    def _delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ?", (key,)
+            )
+
+
+# error codes of `create_index` when an index with the same name or keys
+# already exists with other options
+INDEX_CONFLICTS = {85, 86}
+
+
+def to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def to_timestamp(value: datetime | float) -> float:
+    """Reads a `created_at` as a timestamp. Entries written by earlier
+    versions hold a float, and MongoDB returns naive UTC datetimes"""
+
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+
+    return value
+
+
+class MongoCache(BaseCache):
+    """Cache stored in a MongoDB collection. Expired entries are also removed
+    by a TTL index on the server, so `created_at` is stored as a date"""
+
+    def __init__(self, collection, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collection = collection
+
+        self._ensure_ttl_index()
+        self.collection.create_index("accessed_at")
+
+    def _ensure_ttl_index(self) -> None:
+        """Creates the TTL index, or updates it when the TTL has changed
+        since it was created"""
+
+        if self.ttl is None:
+            if "created_at_1" in self.collection.index_information():
+                self.collection.drop_index("created_at_1")
+            return
+
+        try:
+            self.collection.create_index(
+                "created_at", expireAfterSeconds=int(self.ttl)
+            )
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICTS:
+                raise
+
+            self.collection.database.command(
+                "collMod",
+                self.collection.name,
+                index={
+                    "keyPattern": {"created_at": 1},
+                    "expireAfterSeconds": int(self.ttl),
+                },
+            )
+            logger.info(f"Changed the TTL of {self.collection.name} cache")
+
+    def __len__(self) -> int:
+        return self.collection.estimated_document_count()
+
+    def _get(self, key):
+        doc = self.collection.find_one_and_update(
+            {"_id": key}, {"$set": {"accessed_at": self._clock()}}
+        )
+
+        if doc is None:
+            return None
+
+        if self._is_expired(to_timestamp(doc["created_at"])):
+            self.collection.delete_one({"_id": key})
+            with self._lock:
+                self.stats.evictions += 1
+            return None
+
+        return doc["value"]
+
+    def _get_many(self, keys):
+        docs = list(self.collection.find({"_id": {"$in": keys}}))
+
+        found = {}
+        expired = []
+        for doc in docs:
+            if self._is_expired(to_timestamp(doc["created_at"])):
+                expired.append(doc["_id"])
+            else:
+                found[doc["_id"]] = doc["value"]
+
+        if expired:
+            self.collection.delete_many({"_id": {"$in": expired}})
+            with self._lock:
+                self.stats.evictions += len(expired)
+
+        if found:
+            self.collection.update_many(
+                {"_id": {"$in": list(found)}},
+                {"$set": {"accessed_at": self._clock()}},
+            )
+
+        return found
+
+    def _set(self, key, value):
+        self._set_many({key: value})
+
+    def _set_many(self, items):
+        now = self._clock()
+        self.collection.bulk_write(
+            [
+                ReplaceOne(
+                    {"_id": key},
+                    {
+                        "value": value,
+                        "created_at": to_datetime(now),
+                        "accessed_at": now,
+                    },
+                    upsert=True,
+                )
+                for key, value in items.items()
+            ],
+            ordered=False,
+        )
+
+        if self.max_entries is None:
+            return
+
+        excess = self.collection.estimated_document_count() - self.max_entries
+        if excess > 0:
+            oldest = self.collection.find({}, {"_id": 1}).sort(
+                "accessed_at", 1
+            )
+            ids = [doc["_id"] for doc in oldest.limit(excess)]
+            result = self.collection.delete_many({"_id": {"$in": ids}})
+            with self._lock:
+                self.stats.evictions += result.deleted_count
+
+    def _delete(self, key):
+        self.collection.delete_one({"_id": key})
+
+
+@lru_cache
+def get_cache(namespace: str) -> BaseCache:
+    """Returns the process-wide cache for a namespace using the backend set
+    in the cache settings. The TTL and size can be set per namespace"""
+
+    settings = config.CacheSettings.load_settings()
+    overrides = settings.namespaces.get(namespace, {})
+    kwargs = {
+        "ttl": overrides.get("ttl_seconds", settings.ttl_seconds),
+        "max_entries": overrides.get("max_entries", settings.max_entries),
+    }
+
+    if settings.backend == "memory":
+        cache = MemoryCache(**kwargs)
+
+    elif settings.backend == "sqlite":
+        path = config.ROOT_DIR / settings.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cache = SQLiteCache(str(path), namespace, **kwargs)
+
+    elif settings.backend == "mongo":
+        cache = MongoCache(get_database()[namespace], **kwargs)
+
+    else:
+        raise ValueError(f"Unknown cache backend: {settings.backend}")
+
+    logger.info(f"Using {settings.backend} cache for {namespace=}")
+    return cache
@@ -0,0 +1,341 @@
+"""Helpers for running blocking calls (e.g. LLM requests) concurrently while
+staying within a provider's rate limits"""
+
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, TypeVar
+
+from tqdm import tqdm
+
+from video_summarizer.backend.utils.utils import logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class RateLimiter:
+    """Sliding window limiter for requests per minute and tokens per minute.
+
+    Args:
+    ---
+    requests_per_minute: maximum number of calls started in any window
+    tokens_per_minute: maximum number of tokens consumed in any window
+    period: length of the window in seconds
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        period: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.period = period
+        self._clock = clock
+        self._sleep = sleep
+        self._events: deque[tuple[float, int]] = deque()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._events and now - self._events[0][0] >= self.period:
+            _, tokens = self._events.popleft()
+            self._tokens -= tokens
+
+    def _fits(self, tokens: int) -> bool:
+        if not self._events:
+            # a single request larger than the token limit must still run
+            return True
+
+        if (
+            self.requests_per_minute is not None
+            and len(self._events) >= self.requests_per_minute
+        ):
+            return False
+
+        if (
+            self.tokens_per_minute is not None
+            and self._tokens + tokens > self.tokens_per_minute
+        ):
+            return False
+
+        return True
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Blocks until a request costing `tokens` can be made. Returns the
+        number of seconds spent waiting"""
+
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._prune(now)
+
+                if self._fits(tokens):
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return waited
+
+                delay = self.period - (now - self._events[0][0])
+
+            delay = max(delay, 0.001)
+            self._sleep(delay)
+            waited += delay
+
+
+def call_with_retries(
+    func: Callable[[], R],
+    attempts: int = 3,
+    backoff: float = 1.0,
+    max_backoff: float = 30.0,
+    should_retry: Callable[[Exception], bool] = lambda e: True,
+    sleep: Callable[[float], None] = time.sleep,
+) -> R:
+    """Calls `func`, retrying failures with exponential backoff.
+
+    Args:
+    ---
+    func: the blocking call
+    attempts: maximum number of calls
+    backoff: delay before the first retry in seconds, doubled for each
+    retry up to `max_backoff`. Each delay is jittered by up to 50% so that
+    concurrent callers do not retry in lockstep
+    should_retry: whether an error is transient; others are raised at once
+    sleep: waits between attempts
+
+    Raises:
+    ---
+    The last error once the attempts are used up
+    """
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts or not should_retry(e):
+                raise
+
+            delay = min(backoff * 2 ** (attempt - 1), max_backoff)
+            delay *= random.uniform(0.5, 1.0)
+            logger.info(f"Retrying in {delay:.2f}s after {attempt=}: {e}")
+            sleep(delay)
+
+
+def map_concurrently(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 1,
+    limiter: RateLimiter | None = None,
+    cost: Callable[[T], int] | None = None,
+    show_progress: bool = True,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> list[R]:
+    """Applies `func` to every item using a bounded thread pool. The first
+    call to fail stops the map: the items that have not started yet are
+    cancelled and its error is raised once the running calls finish.
+
+    Args:
+    ---
+    func: blocking function to apply to each item
+    items: the inputs
+    max_workers: maximum number of calls in flight at any time
+    limiter: optional rate limiter that every call must pass through
+    cost: estimates the number of tokens an item will consume
+    show_progress: whether to display a progress bar
+    on_progress: called with (completed, total) each time an item completes
+
+    Returns:
+    ---
+    The results in the same order as `items`
+    """
+
+    items = list(items)
+
+    def run(item: T) -> R:
+        if limiter is not None:
+            limiter.acquire(cost(item) if cost is not None else 0)
+        return func(item)
+
+    if not items:
+        return []
+
+    max_workers = max(1, min(max_workers, len(items)))
+
+    lock = threading.Lock()
+    completed = 0
+
+    with tqdm(total=len(items), disable=not show_progress) as progress:
+
+        def done(future) -> None:
+            nonlocal completed
+            if future.cancelled():
+                return
+
+            with lock:
+                completed += 1
+                progress.update()
+                if on_progress is not None:
+                    on_progress(completed, len(items))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run, item) for item in items]
+            for future in futures:
+                future.add_done_callback(done)
+
+            wait(futures, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                if future.done() and future.exception() is not None:
+                    executor.shutdown(cancel_futures=True)
+                    raise future.exception()
+
+            return [future.result() for future in futures]
+
+
+class Stage(NamedTuple):
+    """A step of a pipeline.
+
+    Args:
+    ---
+    name: used when reporting timings
+    func: processes one item
+    workers: number of threads running `func`
+    fan_out: whether `func` returns a list of items instead of a single item
+    finish_on_error: whether to still process the items already queued for
+    this stage after another stage failed, e.g. to save finished work
+    """
+
+    name: str
+    func: Callable
+    workers: int = 1
+    fan_out: bool = False
+    finish_on_error: bool = False
+
+
+_STOP = object()
+
+
+def iter_pipeline(
+    items: Iterable, stages: list[Stage], queue_size: int = 8
+) -> Iterator[tuple[tuple[int, ...], Any]]:
+    """Runs items through a sequence of stages connected by bounded queues so
+    that different items are processed by different stages at the same time.
+    Throughput is set by the slowest stage rather than the sum of all stages.
+
+    Yields:
+    ---
+    (position, result) pairs as soon as each item leaves the last stage. The
+    position is a tuple holding the index of the item and, for each fan-out
+    stage, the index of the output it came from, so sorting the positions
+    restores the input order.
+
+    Raises:
+    ---
+    The first exception raised by a stage, once the pipeline has stopped
+
+    If the caller stops early, e.g. by closing the generator, the stages
+    stop taking new items and the items in flight are finished before
+    returning, as when a stage fails.
+    """
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    queues.append(queue.Queue())
+    errors = []
+    failed = threading.Event()
+    busy = {stage.name: 0.0 for stage in stages}
+    lock = threading.Lock()
+
+    def feed():
+        for i, item in enumerate(items):
+            if failed.is_set():
+                break
+            queues[0].put(((i,), item))
+        queues[0].put(_STOP)
+
+    def work(n: int, stage: Stage, remaining: list[int]):
+        q_in, q_out = queues[n], queues[n + 1]
+
+        while (task := q_in.get()) is not _STOP:
+            if failed.is_set() and not stage.finish_on_error:
+                continue  # drain so that upstream stages can finish
+
+            position, item = task
+            start = time.perf_counter()
+
+            try:
+                if stage.fan_out:
+                    outputs = [
+                        (position + (j,), out)
+                        for j, out in enumerate(stage.func(item))
+                    ]
+                else:
+                    outputs = [(position, stage.func(item))]
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+                continue
+            finally:
+                with lock:
+                    busy[stage.name] += time.perf_counter() - start
+
+            for output in outputs:
+                q_out.put(output)
+
+        # let sibling workers stop, and stop the next stage after the last one
+        q_in.put(_STOP)
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                q_out.put(_STOP)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for n, stage in enumerate(stages):
+        remaining = [stage.workers]
+        for _ in range(stage.workers):
+            threads.append(
+                threading.Thread(
+                    target=work, args=(n, stage, remaining), daemon=True
+                )
+            )
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    finished = False
+    try:
+        while (result := queues[-1].get()) is not _STOP:
+            if not failed.is_set():
+                yield result
+        finished = True
+    finally:
+        if not finished:
+            failed.set()
+            for thread in threads:
+                thread.join()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Pipeline finished in {elapsed:.2f}s, busy time per stage: "
+        + ", ".join(f"{k}={v:.2f}s" for k, v in busy.items())
+    )
+
+    if errors:
+        raise errors[0]
+
+
+def run_pipeline(
+    items: Iterable, stages: list[Stage], queue_size: int = 8
+) -> list:
+    """Runs items through a pipeline and returns the results in input order.
+    See `iter_pipeline`"""
+
+    results = sorted(iter_pipeline(items, stages, queue_size))
+    return [result for _, result in results]
@@ -0,0 +1,215 @@
+"""In-process BM25 index over the transcript windows of a video. Answers
+keyword questions without calling the embedding API or the vector store.
+
+An index is saved as a single compressed `.npz` file holding the postings in
+CSR form (for each term, the documents it appears in and how often) along
+with the ids and metadata of the documents.
+"""
+
+import json
+import math
+import re
+from pathlib import Path
+
+import numpy as np
+
+STOPWORDS = frozenset(
+    """a about an and are as at be but by can do does for from has have how
+    i if in is it its of on or so that the their there they this to was we
+    what when where which who why will with you your""".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower cases a text and splits it into words, dropping stopwords"""
+
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """A BM25 inverted index.
+
+    Args:
+    ---
+    ids: the id of each document
+    metadata: the metadata returned with each document
+    terms: the vocabulary, sorted
+    indptr: postings of term `t` are at `indptr[t]:indptr[t + 1]`
+    postings: document of each posting
+    frequencies: number of times the term appears in the document
+    lengths: number of tokens in each document
+    k1, b: the BM25 parameters
+    """
+
+    def __init__(
+        self,
+        ids: list[str],
+        metadata: list[dict],
+        terms: list[str],
+        indptr: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.ids = ids
+        self.metadata = metadata
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = max(float(lengths.mean()), 1.0) if len(ids) else 1.0
+
+    @classmethod
+    def build(
+        cls, ids: list[str], texts: list[str], metadata: list[dict]
+    ) -> "BM25Index":
+        """Indexes documents"""
+
+        counts = [{} for _ in texts]
+        lengths = np.zeros(len(texts), dtype=np.int32)
+
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc] = len(tokens)
+            for token in tokens:
+                counts[doc][token] = counts[doc].get(token, 0) + 1
+
+        terms = sorted({term for c in counts for term in c})
+        term_ids = {term: i for i, term in enumerate(terms)}
+
+        postings = [[] for _ in terms]
+        for doc, c in enumerate(counts):
+            for term, frequency in c.items():
+                postings[term_ids[term]].append((doc, frequency))
+
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(p) for p in postings])
+        flat = [posting for p in postings for posting in p]
+
+        return cls(
+            ids,
+            metadata,
+            terms,
+            indptr,
+            np.array([d for d, _ in flat], dtype=np.int32),
+            np.array([f for _, f in flat], dtype=np.uint16),
+            lengths,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def idf(self, document_frequency: int) -> float:
+        n = len(self.ids)
+        return math.log(
+            1 + (n - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        """Returns the `top_k` documents with the highest BM25 score, best
+        first. Besides `id`, `score` and `metadata`, each match has a
+        `coverage`: the share of the query's IDF weight found in the
+        document, 1.0 meaning it contains every query term"""
+
+        scores = np.zeros(len(self.ids))
+        matched = np.zeros(len(self.ids))
+        total = 0.0
+
+        for token in set(tokenize(query)):
+            t = self.terms.get(token)
+            if t is None:
+                total += self.idf(0)
+                continue
+
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs = self.postings[start:end]
+            tf = self.frequencies[start:end].astype(np.float64)
+            idf = self.idf(end - start)
+
+            norm = self.k1 * (
+                1 - self.b + self.b * self.lengths[docs] / self.avg_length
+            )
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+            matched[docs] += idf
+            total += idf
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) == 0 or top_k <= 0:
+            return []
+
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            {
+                "id": self.ids[i],
+                "score": float(scores[i]),
+                "coverage": float(matched[i] / total),
+                "metadata": self.metadata[i],
+            }
+            for i in top
+        ]
+
+    def save(self, path: str | Path) -> None:
+        """Saves the index to a compressed `.npz` file"""
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        terms = sorted(self.terms, key=self.terms.get)
+        records = json.dumps({"ids": self.ids, "metadata": self.metadata})
+
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez_compressed(
+            tmp,
+            terms=np.array(terms, dtype=str),
+            indptr=self.indptr,
+            postings=self.postings,
+            frequencies=self.frequencies,
+            lengths=self.lengths,
+            records=np.array(records),
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "BM25Index":
+        with np.load(path) as data:
+            records = json.loads(str(data["records"]))
+            return cls(
+                records["ids"],
+                records["metadata"],
+                data["terms"].tolist(),
+                data["indptr"],
+                data["postings"],
+                data["frequencies"],
+                data["lengths"],
+            )
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[dict]], top_k: int = 5, k: int = 60
+) -> list[dict]:
+    """Fuses rankings of matches by summing 1 / (k + rank) over the rankings
+    each match appears in. Matches are identified by their `id`.
+
+    Returns:
+    ---
+    The `top_k` matches with their fused score, best first
+    """
+
+    scores = {}
+    matches = {}
+
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            scores[match["id"]] = scores.get(match["id"], 0) + 1 / (k + rank)
+            matches.setdefault(match["id"], match)
+
+    best = sorted(scores, key=lambda id_: -scores[id_])[:top_k]
+    return [{**matches[id_], "score": scores[id_]} for id_ in best]
@@ -0,0 +1,243 @@
+"""Data access layer for the MongoDB collections.
+
+A single pooled `MongoClient` is shared by the whole process, so lookups
+reuse open connections instead of paying the connection and authentication
+handshake each time. Command and connection timings are collected by
+`DatabaseMetrics` and exposed through `get_metrics`."""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from pymongo import MongoClient, ReplaceOne, monitoring
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+
+from video_summarizer.backend.utils.utils import get_mongodb_uri, logger
+
+
+class DatabaseMetrics(
+    monitoring.CommandListener, monitoring.ConnectionPoolListener
+):
+    """Records the number and duration of database commands and the number
+    of connections opened"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.commands = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+            self.failures = 0
+            self.connections_created = 0
+            self.connection_seconds = 0.0
+            self._checkouts = {}
+
+    def _record(self, event, failed: bool = False) -> None:
+        with self._lock:
+            command = self.commands[event.command_name]
+            command["count"] += 1
+            command["seconds"] += event.duration_micros / 1e6
+            self.failures += failed
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+            self._checkouts[event.connection_id] = time.perf_counter()
+
+    def connection_ready(self, event):
+        with self._lock:
+            start = self._checkouts.pop(event.connection_id, None)
+            if start is not None:
+                self.connection_seconds += time.perf_counter() - start
+
+    # the remaining pool events are not recorded
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+    @property
+    def round_trips(self) -> int:
+        return sum(c["count"] for c in self.commands.values())
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "commands": {
+                    name: {
+                        "count": c["count"],
+                        "seconds": round(c["seconds"], 4),
+                        "avg_ms": round(1000 * c["seconds"] / c["count"], 3),
+                    }
+                    for name, c in self.commands.items()
+                },
+                "round_trips": sum(c["count"] for c in self.commands.values()),
+                "failures": self.failures,
+                "connections_created": self.connections_created,
+                "connection_seconds": round(self.connection_seconds, 4),
+            }
+
+
+metrics = DatabaseMetrics()
+
+
+@lru_cache
+def get_client() -> MongoClient:
+    """Returns the process-wide pooled MongoDB client"""
+
+    return MongoClient(
+        get_mongodb_uri(),
+        maxPoolSize=int(os.environ.get("_MONGO_POOL_SIZE", 50)),
+        event_listeners=[metrics],
+    )
+
+
+def get_database() -> Database:
+    return get_client()[os.environ.get("_MONGO_DB")]
+
+
+class VideoRepository:
+    """Access to a collection of documents identified by `video_id`"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @property
+    def name(self) -> str:
+        return self.collection.name
+
+    def ensure_indexes(self) -> None:
+        """Creates a unique index on `video_id`"""
+
+        try:
+            self.collection.create_index("video_id", unique=True)
+        except OperationFailure as e:
+            # e.g. older data has duplicate documents for a video
+            logger.error(
+                f"Could not create a unique video_id index on {self.name}: {e}"
+            )
+            self.collection.create_index("video_id")
+
+    def find_one(self, video_id: str, projection: dict | None = None):
+        return self.collection.find_one({"video_id": video_id}, projection)
+
+    def find_many(
+        self, video_ids: list[str], projection: dict | None = None
+    ) -> dict[str, dict]:
+        """Looks up many videos with a single query, returning the documents
+        keyed by video id"""
+
+        if not video_ids:
+            return {}
+
+        cursor = self.collection.find(
+            {"video_id": {"$in": list(video_ids)}}, projection
+        )
+        return {doc["video_id"]: doc for doc in cursor}
+
+    def existing_ids(self, video_ids: list[str]) -> set[str]:
+        """Returns the ids in `video_ids` that have a document"""
+
+        docs = self.find_many(video_ids, projection={"video_id": 1, "_id": 0})
+        return set(docs)
+
+    def upsert_one(self, doc: dict) -> None:
+        self.collection.replace_one(
+            {"video_id": doc["video_id"]}, doc, upsert=True
+        )
+
+    def upsert_many(self, docs: list[dict]) -> int:
+        """Inserts or replaces many documents with a single bulk write.
+        Returns the number of documents written"""
+
+        if not docs:
+            return 0
+
+        result = self.collection.bulk_write(
+            [
+                ReplaceOne({"video_id": doc["video_id"]}, doc, upsert=True)
+                for doc in docs
+            ],
+            ordered=False,
+        )
+        return result.upserted_count + result.modified_count
+
+
+@lru_cache
+def get_transcripts() -> VideoRepository:
+    repo = VideoRepository(get_database().transcripts)
+    repo.ensure_indexes()
+    return repo
+
+
+@lru_cache
+def get_summaries() -> VideoRepository:
+    repo = VideoRepository(get_database().summaries)
+    repo.ensure_indexes()
+    return repo
+
+
+@lru_cache
+def get_summary_nodes():
+    """Returns the collection of the stored summary nodes, see
+    `summary_state`"""
+
+    collection = get_database().summary_nodes
+    collection.create_index(
+        [
+            ("video_id", 1),
+            ("params_hash", 1),
+            ("level", 1),
+            ("start", 1),
+            ("end", 1),
+        ],
+        unique=True,
+    )
+    return collection
+
+
+def ensure_indexes() -> None:
+    """Creates the indexes of the video collections. Called at startup"""
+
+    get_transcripts()
+    get_summaries()
+    get_summary_nodes()
+
+
+def get_metrics() -> dict:
+    return metrics.to_dict()
@@ -0,0 +1,185 @@
+"""In-process cache of the answers given about each video, looked up by the
+meaning of the question rather than its exact text.
+
+A question is a hit when the cosine similarity between its embedding and
+the embedding of a question already answered about the same video is at
+least the threshold.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+import numpy as np
+
+from video_summarizer.backend.utils.cache import CacheStats
+from video_summarizer.backend.utils.vectorstore import normalise
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    vector: np.ndarray
+    context_ids: list[str]
+    answer: str
+    created_at: float
+
+
+class SemanticCache:
+    """Caches answers per video with TTL and LRU eviction.
+
+    Args:
+    ---
+    threshold: minimum cosine similarity between two questions for the
+    answer of one to be returned for the other
+    ttl: number of seconds an answer is valid for (None = no expiry)
+    max_entries: maximum number of answers kept per video (None = unbounded)
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self.invalidations = 0
+        self._clock = clock
+        self._entries: dict[str, OrderedDict[str, CachedAnswer]] = {}
+        # stacked question vectors of each video, rebuilt after a change
+        self._matrices: dict[str, tuple[list[str], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def _expire(self, video_id: str) -> None:
+        entries = self._entries.get(video_id)
+        if not entries or self.ttl is None:
+            return
+
+        now = self._clock()
+        expired = [
+            key
+            for key, entry in entries.items()
+            if now - entry.created_at > self.ttl
+        ]
+        for key in expired:
+            del entries[key]
+
+        if expired:
+            self.stats.evictions += len(expired)
+            self._matrices.pop(video_id, None)
+
+    def _matrix(self, video_id: str) -> tuple[list[str], np.ndarray]:
+        matrix = self._matrices.get(video_id)
+        if matrix is None:
+            entries = self._entries[video_id]
+            matrix = (
+                list(entries),
+                np.stack([entry.vector for entry in entries.values()]),
+            )
+            self._matrices[video_id] = matrix
+
+        return matrix
+
+    def get(
+        self,
+        video_id: str,
+        vector: list[float] | Callable[[], list[float]],
+    ) -> CachedAnswer | None:
+        """Returns the answer to the most similar question asked about a
+        video, or None if no question is similar enough.
+
+        `vector` may be a function returning the question's embedding, which
+        is then only called when the video has answers to compare with.
+        """
+
+        if callable(vector):
+            with self._lock:
+                self._expire(video_id)
+                if not self._entries.get(video_id):
+                    self.stats.misses += 1
+                    return None
+
+            # embedding may need the network, so it runs outside the lock
+            vector = vector()
+
+        with self._lock:
+            self._expire(video_id)
+
+            entry = None
+            if self._entries.get(video_id):
+                keys, matrix = self._matrix(video_id)
+                query = normalise(np.asarray(vector, dtype=np.float32))
+                scores = matrix @ query
+
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry = self._entries[video_id][keys[best]]
+                    self._entries[video_id].move_to_end(keys[best])
+
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+
+            return entry
+
+    def set(
+        self,
+        video_id: str,
+        question: str,
+        vector: list[float],
+        context_ids: list[str],
+        answer: str,
+    ) -> None:
+        """Stores the answer to a question about a video"""
+
+        entry = CachedAnswer(
+            question,
+            normalise(np.asarray(vector, dtype=np.float32)),
+            list(context_ids),
+            answer,
+            self._clock(),
+        )
+
+        with self._lock:
+            entries = self._entries.setdefault(video_id, OrderedDict())
+            entries[question] = entry
+            entries.move_to_end(question)
+
+            while (
+                self.max_entries is not None
+                and len(entries) > self.max_entries
+            ):
+                entries.popitem(last=False)
+                self.stats.evictions += 1
+
+            self._matrices.pop(video_id, None)
+
+    def invalidate(self, video_id: str) -> int:
+        """Drops the answers about a video, e.g. once it is indexed again.
+        Returns the number of answers dropped"""
+
+        with self._lock:
+            self._matrices.pop(video_id, None)
+            dropped = len(self._entries.pop(video_id, {}))
+            self.invalidations += dropped
+
+        return dropped
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **asdict(self.stats),
+                "hit_rate": self.stats.hit_rate,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,188 @@
+"""Columnar storage of video transcripts.
+
+A transcript is stored as three columns: the start and the duration of each
+line in seconds, as float32 arrays, and the text of the lines joined by NUL
+characters, with the number of lines. Each column is compressed with zlib,
+zstd or not at all.
+
+Transcripts saved by earlier versions are lists of formatted lines
+(`"\\n0:00:14 - text"`). `Transcript.decode` reads both, so documents can
+be migrated at any time (see `src/migrate_transcripts.py`).
+"""
+
+import re
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+FORMAT = "columnar"
+SEPARATOR = "\0"
+LEGACY_LINE = re.compile(r"\n(\d+:\d{2}:\d{2})\s-\s(.*)", re.DOTALL)
+
+
+def convert_video_ts(s: float) -> str:
+    """Converts a video time stamp in secs to H:M:S"""
+
+    hour, remainder_secs = divmod(s, 3600)
+    mins, secs = divmod(remainder_secs, 60)
+
+    hour = int(hour)
+    minutes = str(int(mins)).zfill(2)
+    seconds = str(int(secs)).zfill(2)
+
+    res = f"{hour}:{minutes}:{seconds}"
+    return res
+
+
+def parse_video_ts(ts: str) -> int:
+    """Converts a H:M:S video time stamp to secs. See `convert_video_ts`"""
+
+    hour, mins, secs = ts.split(":")
+    return 3600 * int(hour) + 60 * int(mins) + int(secs)
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.compress(data)
+
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress(data)
+
+    if compression == "none":
+        return data
+
+    raise ValueError(f"Unknown {compression=}")
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.decompress(data)
+
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    if compression == "none":
+        return data
+
+    raise ValueError(f"Unknown {compression=}")
+
+
+def is_columnar(stored) -> bool:
+    return isinstance(stored, dict) and stored.get("format") == FORMAT
+
+
+@dataclass
+class Transcript:
+    """The lines of a transcript, as columns.
+
+    Args:
+    ---
+    starts: the start of each line in seconds
+    durations: how long each line is shown for in seconds
+    texts: the text of each line
+    """
+
+    starts: np.ndarray
+    durations: np.ndarray
+    texts: list[str]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @classmethod
+    def from_segments(cls, segments: list[dict]) -> "Transcript":
+        """Builds a transcript from the segments returned by
+        youtube-transcript-api, dicts with `text`, `start` and `duration`"""
+
+        return cls(
+            np.array([s["start"] for s in segments], dtype=np.float32),
+            np.array(
+                [s.get("duration", 0) for s in segments], dtype=np.float32
+            ),
+            [s["text"] for s in segments],
+        )
+
+    @classmethod
+    def from_lines(cls, lines: list[str]) -> "Transcript":
+        """Parses the formatted lines stored by earlier versions. Lines that
+        do not match the format are skipped. Their timestamps are rounded to
+        the second, so the duration of a line is the time until the next
+        one starts"""
+
+        starts, texts = [], []
+        for line in lines:
+            match = LEGACY_LINE.match(line) if line else None
+            if match is not None:
+                starts.append(parse_video_ts(match.group(1)))
+                texts.append(match.group(2))
+
+        starts = np.array(starts, dtype=np.float32)
+        durations = np.diff(starts, append=starts[-1:])
+
+        return cls(starts, durations, texts)
+
+    @classmethod
+    def decode(cls, stored: dict | list[str]) -> "Transcript":
+        """Reads a transcript as stored in its document, in either format"""
+
+        if not is_columnar(stored):
+            return cls.from_lines(stored)
+
+        compression = stored["compression"]
+
+        def array(key: str) -> np.ndarray:
+            data = decompress(stored[key], compression)
+            return np.frombuffer(data, dtype=np.float32)
+
+        starts = array("starts")
+        texts = decompress(stored["texts"], compression).decode()
+        # a single line with no text is stored as an empty string too
+        count = stored.get("count", len(starts))
+
+        return cls(
+            starts,
+            array("durations"),
+            texts.split(SEPARATOR) if count else [],
+        )
+
+    def encode(self, compression: str = "zlib") -> dict:
+        """Returns the transcript as stored in its document. NUL characters,
+        which separate the lines, are removed from their text"""
+
+        texts = SEPARATOR.join(
+            text.replace(SEPARATOR, "") for text in self.texts
+        ).encode()
+
+        return {
+            "format": FORMAT,
+            "compression": compression,
+            "count": len(self.texts),
+            "starts": compress(
+                np.asarray(self.starts, dtype=np.float32).tobytes(),
+                compression,
+            ),
+            "durations": compress(
+                np.asarray(self.durations, dtype=np.float32).tobytes(),
+                compression,
+            ),
+            "texts": compress(texts, compression),
+        }
+
+    @property
+    def timestamps(self) -> list[str]:
+        """The H:M:S start of each line"""
+
+        return [convert_video_ts(s) for s in self.starts.tolist()]
+
+    def lines(self) -> list[str]:
+        """The lines formatted with their timestamps, as the summariser
+        prompts them"""
+
+        return [
+            f"\n{ts} - {text}" for ts, text in zip(self.timestamps, self.texts)
+        ]
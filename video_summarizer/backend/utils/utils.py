@@ -11,23 +11,44 @@ env_file = f"{app_env}.env"
 load_dotenv(find_dotenv(filename=env_file))
 
 
+def get_mongodb_uri() -> str:
+    """Builds the MongoDB connection string from the environment"""
+
+    _USER = os.environ.get("_MONGO_UNAME")
+    _PASSWORD = quote_plus(os.environ.get("_MONGO_PWD"))
+    _HOST = os.environ.get("_MONGO_HOST")
+    _DB = os.environ.get("_MONGO_DB")
+    _PORT = os.environ.get("_MONGO_PORT")
+
+    return f"mongodb://{_USER}:{_PASSWORD}@{_HOST}:{_PORT}/?authSource={_DB}"
+
+
 def get_mongodb_client():
-    """Establishes a MongoDB client
+    """Establishes a new MongoDB client. Prefer the pooled client from
+    `repository.get_client` for application code
 
     Returns
     ---
     Tuple of (MongoClient, database_name)
     """
 
-    _USER = os.environ.get("_MONGO_UNAME")
-    _PASSWORD = quote_plus(os.environ.get("_MONGO_PWD"))
-    _HOST = os.environ.get("_MONGO_HOST")
-    _DB = os.environ.get("_MONGO_DB")
-    _PORT = os.environ.get("_MONGO_PORT")
+    return MongoClient(get_mongodb_uri()), os.environ.get("_MONGO_DB")
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimates the number of tokens in a text (~4 characters per
+    token for English text)"""
+
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Shortens a text so that it is at most `max_tokens` tokens long"""
 
-    uri = f"mongodb://{_USER}:{_PASSWORD}@{_HOST}:{_PORT}/?authSource={_DB}"
+    if estimate_tokens(text) <= max_tokens:
+        return text
 
-    return MongoClient(uri), _DB
+    return text[: max_tokens * 4]
 
 
 def get_logging_level():
@@ -0,0 +1,338 @@
+"""Vector stores holding the embedded transcript lines of each video.
+
+Backends:
+---
+* LocalVectorStore: float32 matrices in memory-mapped `.npy` files, queried
+with NumPy. Nothing has to be provisioned before the first question
+* PineconeVectorStore: one Pinecone index with a namespace per video
+"""
+
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
+
+import numpy as np
+
+from video_summarizer.backend.configs import config
+from video_summarizer.backend.utils.utils import logger
+
+if TYPE_CHECKING:
+    from pinecone import Pinecone
+
+
+class BaseVectorStore(ABC):
+    """Base class for the vector store backends. Vectors are grouped by the
+    video they belong to.
+
+    Matches are returned as dicts with the keys `id`, `score` (cosine
+    similarity) and `metadata`, best match first.
+    """
+
+    @abstractmethod
+    def count(self, video_id: str) -> int:
+        """Returns the number of vectors stored for a video"""
+
+    @abstractmethod
+    def upsert(
+        self,
+        video_id: str,
+        ids: list[str],
+        vectors: Iterable[list[float]],
+        metadata: list[dict],
+    ) -> None:
+        """Inserts vectors, replacing those with the same id"""
+
+    @abstractmethod
+    def existing_ids(self, video_id: str, ids: list[str]) -> set[str]:
+        """Returns the ids in `ids` that are stored for a video"""
+
+    @abstractmethod
+    def query(
+        self, video_id: str, vector: list[float], top_k: int = 5
+    ) -> list[dict]:
+        """Returns the `top_k` vectors closest to `vector`"""
+
+    @abstractmethod
+    def delete(self, video_id: str) -> None:
+        """Deletes the vectors of a video"""
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    """Scales vectors to unit length so that a dot product is their cosine
+    similarity"""
+
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class LocalVectorStore(BaseVectorStore):
+    """Stores the vectors of each video as a normalised float32 matrix in
+    `<path>/<video_id>.npy` and their ids and metadata in
+    `<path>/<video_id>.json`. Matrices are memory-mapped, so only the pages a
+    query touches are read from disk. A matrix may have more rows than there
+    are ids; the spare rows are filled by later upserts.
+
+    Args:
+    ---
+    path: directory the files are stored in
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._loaded: dict[str, tuple[np.ndarray, list[str], list[dict]]] = {}
+        self._lock = threading.Lock()
+
+    def _files(self, video_id: str) -> tuple[Path, Path]:
+        return (
+            self.path / f"{video_id}.npy",
+            self.path / f"{video_id}.json",
+        )
+
+    def _load(self, video_id: str) -> tuple[np.ndarray, list[str], list[dict]]:
+        loaded = self._loaded.get(video_id)
+        if loaded is not None:
+            return loaded
+
+        vectors_file, records_file = self._files(video_id)
+
+        if vectors_file.exists():
+            matrix = np.load(vectors_file, mmap_mode="r")
+            with open(records_file, "r") as f:
+                records = json.load(f)
+            loaded = (matrix, records["ids"], records["metadata"])
+        else:
+            loaded = (np.empty((0, 0), dtype=np.float32), [], [])
+
+        self._loaded[video_id] = loaded
+        return loaded
+
+    def count(self, video_id):
+        with self._lock:
+            return len(self._load(video_id)[1])
+
+    def upsert(self, video_id, ids, vectors, metadata):
+        if not ids:
+            return
+
+        vectors = normalise(np.asarray(list(vectors), dtype=np.float32))
+
+        with self._lock:
+            matrix, old_ids, old_metadata = self._load(video_id)
+
+            rows = {id_: i for i, id_ in enumerate(old_ids)}
+            new_ids = list(old_ids)
+            new_metadata = list(old_metadata)
+            new_rows = []
+
+            for id_, vector, meta in zip(ids, vectors, metadata):
+                if id_ in rows:
+                    new_metadata[rows[id_]] = meta
+                else:
+                    rows[id_] = len(new_ids)
+                    new_ids.append(id_)
+                    new_metadata.append(meta)
+                new_rows.append(rows[id_])
+
+            vectors_file, records_file = self._files(video_id)
+            appends = all(row >= len(old_ids) for row in new_rows)
+
+            if old_ids and appends and len(new_ids) <= len(matrix):
+                # new rows fit in the spare capacity of the file. They are
+                # only visible to readers once the ids are written below
+                out = np.load(vectors_file, mmap_mode="r+")
+                out[new_rows] = vectors
+                out.flush()
+                del out
+
+            else:
+                # grow the capacity geometrically so that adding a
+                # transcript batch by batch rewrites the matrix O(log n)
+                # times
+                capacity = max(len(new_ids), 2 * len(old_ids))
+                new_matrix = np.zeros(
+                    (capacity, vectors.shape[1]), dtype=np.float32
+                )
+                if old_ids:
+                    new_matrix[: len(old_ids)] = matrix[: len(old_ids)]
+                new_matrix[new_rows] = vectors
+
+                # write to a temporary file first so that readers never see
+                # a partially written matrix
+                tmp_vectors = vectors_file.with_suffix(".tmp.npy")
+                np.save(tmp_vectors, new_matrix)
+                os.replace(tmp_vectors, vectors_file)
+
+            tmp_records = records_file.with_suffix(".tmp.json")
+            with open(tmp_records, "w") as f:
+                json.dump({"ids": new_ids, "metadata": new_metadata}, f)
+            os.replace(tmp_records, records_file)
+
+            self._loaded.pop(video_id, None)
+
+    def existing_ids(self, video_id, ids):
+        with self._lock:
+            return set(ids).intersection(self._load(video_id)[1])
+
+    def query(self, video_id, vector, top_k=5):
+        with self._lock:
+            matrix, ids, metadata = self._load(video_id)
+
+        if not ids or top_k <= 0:
+            return []
+
+        query = normalise(np.asarray(vector, dtype=np.float32))
+        scores = matrix[: len(ids)] @ query
+
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            {"id": ids[i], "score": float(scores[i]), "metadata": metadata[i]}
+            for i in top
+        ]
+
+    def delete(self, video_id):
+        with self._lock:
+            self._loaded.pop(video_id, None)
+            for file in self._files(video_id):
+                file.unlink(missing_ok=True)
+
+
+class PineconeVectorStore(BaseVectorStore):
+    """Stores the vectors of all videos in a single Pinecone index, with a
+    namespace per video. The index is created the first time it is needed,
+    so adding a video never waits for an index to be provisioned.
+
+    Args:
+    ---
+    client: the Pinecone client
+    index_name: name of the shared index
+    dimension: size of the embeddings
+    """
+
+    def __init__(
+        self,
+        client: "Pinecone",
+        index_name: str = "video-summarizer",
+        dimension: int = 1536,
+    ):
+        self.client = client
+        self.index_name = index_name
+        self.dimension = dimension
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get_index(self):
+        """Returns the shared index, creating it if needed"""
+
+        with self._lock:
+            if self._index is not None:
+                return self._index
+
+            from pinecone import PodSpec
+
+            available_idx = [
+                i.get("name")
+                for i in self.client.list_indexes().get("indexes")
+            ]
+
+            if self.index_name not in available_idx:
+                self.client.create_index(
+                    name=self.index_name,
+                    dimension=self.dimension,  # https://www.pinecone.io/learn/openai-embeddings-v3/
+                    metric="cosine",
+                    spec=PodSpec(environment="gcp-starter"),
+                )
+
+                while not self.client.describe_index(self.index_name).status[
+                    "ready"
+                ]:
+                    time.sleep(1)
+
+            self._index = self.client.Index(self.index_name)
+            logger.info(
+                f"Pinecone index stats:\n {self._index.describe_index_stats()}"
+            )
+
+            return self._index
+
+    def count(self, video_id):
+        stats = self.get_index().describe_index_stats()
+        namespace = stats.get("namespaces", {}).get(video_id)
+
+        return namespace.get("vector_count", 0) if namespace else 0
+
+    def existing_ids(self, video_id, ids):
+        index = self.get_index()
+
+        existing = set()
+        for i in range(0, len(ids), 100):
+            fetched = index.fetch(ids=ids[i : i + 100], namespace=video_id)
+            existing.update(fetched.get("vectors"))
+
+        return existing
+
+    def upsert(self, video_id, ids, vectors, metadata):
+        self.get_index().upsert(
+            vectors=list(zip(ids, vectors, metadata)),
+            namespace=video_id,
+            batch_size=100,
+        )
+
+    def query(self, video_id, vector, top_k=5):
+        query_res = self.get_index().query(
+            vector=vector,
+            top_k=top_k,
+            namespace=video_id,
+            include_metadata=True,
+            include_values=False,
+        )
+
+        return [
+            {"id": d["id"], "score": d["score"], "metadata": d["metadata"]}
+            for d in query_res.get("matches")
+        ]
+
+    def delete(self, video_id):
+        from pinecone import NotFoundException
+
+        try:
+            self.get_index().delete(delete_all=True, namespace=video_id)
+            logger.info(f"Successfully deleted namespace {video_id=}")
+        except NotFoundException:
+            logger.info(f"Namespace {video_id=} already deleted")
+
+
+@lru_cache
+def get_vector_store() -> BaseVectorStore:
+    """Returns the process-wide vector store using the backend set in the
+    vector store settings"""
+
+    settings = config.VectorStoreSettings.load_settings()
+
+    if settings.backend == "local":
+        store = LocalVectorStore(config.ROOT_DIR / settings.path)
+
+    elif settings.backend == "pinecone":
+        from pinecone import Pinecone
+
+        client = Pinecone(
+            api_key=os.environ.get("PINECONE_API_KEY"),
+            environment=os.environ.get("PINECONE_ENVIRONMENT"),
+        )
+        store = PineconeVectorStore(
+            client, settings.index_name, settings.dimension
+        )
+
+    else:
+        raise ValueError(f"Unknown vector store backend: {settings.backend}")
+
+    logger.info(f"Using {settings.backend} vector store")
+    return store